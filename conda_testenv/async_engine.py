@@ -0,0 +1,231 @@
+"""
+An asyncio alternative to the thread pool of
+:func:`conda_testenv.test_env.run_packages`, which drives the test
+subprocesses of many packages from a single event loop. The output of each
+test is streamed line by line, tagged with the name of its package, so that
+concurrent tests can be told apart.
+
+This module requires Python 3.5 or later. Its async syntax is invalid on
+earlier versions, so setup.py leaves it out of the package for them.
+
+"""
+import asyncio
+import subprocess
+import sys
+import time
+
+from conda_testenv import phases, processes
+from conda_testenv.results import (CANCELLED, FAILED, PASSED, SKIPPED,
+                                   TIMED_OUT, PackageResult, error_reason)
+from conda_testenv.test_env import log_path, pkg_test_dir
+
+
+#: The longest line which will be read from a test in one go.
+LINE_LIMIT = 2 ** 20
+
+#: The number of seconds between looks at whether a test process has
+#: exited, for when processes it left running hold its pipes open.
+EXIT_POLL = 0.1
+
+
+async def stream_lines(tag, reader, out):
+    """
+    Copy each line from the reader to the given text stream, prefixed by
+    the tag unless it is None.
+
+    """
+    while True:
+        try:
+            line = await reader.readline()
+        except ValueError:
+            # The line exceeded LINE_LIMIT, so take what there is of it.
+            line = await reader.read(LINE_LIMIT)
+        if not line:
+            break
+        text = line.decode('utf-8', 'replace').rstrip('\r\n')
+        if tag is not None:
+            text = '[{}] {}'.format(tag, text)
+        out.write(text + '\n')
+        out.flush()
+
+
+async def wait_exited(proc):
+    """
+    Wait for the given asyncio subprocess to exit, and return its exit
+    status. Before Python 3.12, Process.wait() only returns once the pipes
+    of the process are closed as well, which processes that it left
+    running in the background may hold open.
+
+    """
+    async def poll():
+        while proc.returncode is None:
+            await asyncio.sleep(EXIT_POLL)
+
+    tasks = [asyncio.ensure_future(proc.wait()),
+             asyncio.ensure_future(poll())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return proc.returncode
+
+
+async def run_command(tag, cmd, env, cwd, timeout=None, log_file=None,
+                      cancel=None):
+    """
+    Run the given command in its own process group, streaming its output,
+    and return its exit status. Should it take longer than timeout seconds,
+    its process group is killed and None is returned. Once it exits, the
+    rest of its output is read for up to
+    :data:`~conda_testenv.processes.DRAIN_TIMEOUT` seconds.
+
+    The output is written to the given log file if any, and otherwise to
+    this process's stdout and stderr with each line prefixed by the tag.
+    Given a :class:`~conda_testenv.processes.Cancellation`, the process is
+    registered with it.
+
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, env=env, cwd=cwd, stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, limit=LINE_LIMIT,
+        **processes.process_group_kwargs())
+    if log_file is None:
+        streams = asyncio.gather(stream_lines(tag, proc.stdout, sys.stdout),
+                                 stream_lines(tag, proc.stderr, sys.stderr))
+    else:
+        streams = asyncio.gather(stream_lines(None, proc.stdout, log_file),
+                                 stream_lines(None, proc.stderr, log_file))
+    if cancel is not None:
+        cancel.register(proc.pid)
+    try:
+        try:
+            returncode = await asyncio.wait_for(wait_exited(proc), timeout)
+        except asyncio.TimeoutError:
+            processes.kill_process_group(proc.pid)
+            await wait_exited(proc)
+            returncode = None
+    finally:
+        if cancel is not None:
+            cancel.unregister(proc.pid)
+    try:
+        await asyncio.wait_for(streams, processes.DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        # Processes which the command left running in the background hold
+        # its pipes open, so stop reading them.
+        proc._transport.close()
+    if cancel is not None and returncode is not None:
+        cancel.check(proc.pid, returncode)
+    return returncode
+
+
+async def run_pkg_tests(m, env, semaphore, timeout_for=None, scratch=None,
+                        log_dir=None, profile=None, cancel=None,
+                        output=None):
+    """
+    The asyncio equivalent of :func:`conda_testenv.test_env.run_pkg_tests`.
+
+    """
+    async with semaphore:
+        if cancel is not None and cancel.cancelled:
+            return PackageResult(m, SKIPPED, 0.0, reason=CANCELLED)
+        start = time.time()
+        timeout = None if timeout_for is None else timeout_for(m)
+        deadline = None if timeout is None else start + timeout
+        log = log_path(log_dir, m.dist())
+        if log is not None:
+            log_file = open(log, 'w')
+        elif output is not None:
+            log_file = output.buffer()
+        else:
+            log_file = None
+        status = PASSED
+        kinds = []
+        try:
+            with pkg_test_dir(m, scratch, profile) as (tmpdir, cmds):
+                test_start = phases.clock()
+                for kind, cmd in cmds:
+                    kinds.append(kind)
+                    remaining = None
+                    if deadline is not None:
+                        remaining = max(deadline - time.time(), 0)
+                    returncode = await run_command(m.name(), cmd, env,
+                                                   tmpdir, remaining,
+                                                   log_file, cancel)
+                    if returncode is None:
+                        status = TIMED_OUT
+                        break
+                    if returncode != 0:
+                        status = FAILED
+                        break
+                if profile is not None:
+                    profile.add(phases.TEST, m.dist(),
+                                phases.clock() - test_start)
+        except processes.Cancelled:
+            status = SKIPPED
+            reason = CANCELLED
+        except Exception as err:
+            status = FAILED
+            reason = error_reason(err)
+        else:
+            reason = None
+        result = PackageResult(m, status, time.time() - start,
+                               reason=reason, kinds=kinds, log=log)
+        if log_file is not None:
+            if log is None:
+                output.emit(result, log_file)
+            log_file.close()
+        if cancel is not None and result.gating:
+            cancel.failed()
+        return result
+
+
+async def run_all(metas, env, jobs, history, options):
+    semaphore = asyncio.Semaphore(jobs)
+    tasks = [asyncio.ensure_future(run_pkg_tests(m, env, semaphore,
+                                                 **options))
+             for m in history.longest_first(metas)]
+    results = await asyncio.gather(*tasks)
+    by_meta = dict((id(result.m), result) for result in results)
+    return [by_meta[id(m)] for m in metas]
+
+
+def new_event_loop():
+    """
+    A new event loop, set as the current one, which can run subprocesses.
+    Before Python 3.8, the child watcher must be attached to the loop to
+    wait for subprocesses, which it otherwise refuses to start.
+
+    """
+    if sys.platform == 'win32':
+        loop = asyncio.ProactorEventLoop()
+    else:
+        loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if sys.platform != 'win32' and sys.version_info < (3, 8):
+        asyncio.get_child_watcher().attach_loop(loop)
+    return loop
+
+
+def close_event_loop(loop):
+    """Close a loop made by :func:`new_event_loop`."""
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def run_packages(metas, env, jobs, history, **options):
+    """
+    Test the given recipes in the environment described by env, with up to
+    the given number of jobs at a time, and return the results in the
+    order of the recipes. The options are the timeout_for, scratch,
+    log_dir, profile, cancel and output keywords of
+    :func:`conda_testenv.test_env.run_pkg_tests`.
+
+    """
+    metas = list(metas)
+    loop = new_event_loop()
+    try:
+        return loop.run_until_complete(run_all(metas, env, jobs, history,
+                                                options))
+    finally:
+        close_event_loop(loop)
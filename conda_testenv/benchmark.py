@@ -0,0 +1,242 @@
+"""
+Benchmark how conda-testenv's own work scales with the number of packages
+in an environment.
+
+A synthetic environment is fabricated offline for each size: a prefix
+whose conda-meta records point at a pkgs cache of packages with
+``info/recipe`` directories, whose tests are a mixture of imports, a
+run_test.py, a run_test.sh with commands, and no tests at all. The stages
+of a run which do not execute any tests are then timed against it. Those
+which need conda-build are skipped if it is not installed.
+
+Run it with::
+
+    python -m conda_testenv.benchmark --sizes 10,100,1000,5000
+
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+from conda_testenv import (conda_meta, durations, metadata_cache, phases,
+                           result_cache, test_env)
+
+
+#: The kinds of test of the synthetic recipes, in the order they cycle.
+KINDS = ('imports', 'python', 'shell', 'none')
+
+#: The default numbers of packages to benchmark.
+SIZES = (10, 100, 1000, 5000)
+
+
+def recipe_meta_yaml(name, version, kind):
+    """The meta.yaml of a synthetic recipe with the given kind of test."""
+    lines = ['package:',
+             '  name: {}'.format(name),
+             '  version: "{}"'.format(version),
+             '']
+    if kind == 'imports':
+        lines += ['test:', '  imports:', '    - {}'.format(name),
+                  '    - {}.sub'.format(name)]
+    elif kind == 'shell':
+        lines += ['test:', '  commands:', '    - {} --help'.format(name)]
+    return '\n'.join(lines) + '\n'
+
+
+def recipe_test_fields(name, kind):
+    """The test fields of a synthetic recipe with the given kind of test."""
+    fields = dict((field, None) for field in metadata_cache.TEST_FIELDS)
+    if kind == 'imports':
+        fields['test/imports'] = [name, '{}.sub'.format(name)]
+    elif kind == 'shell':
+        fields['test/commands'] = ['{} --help'.format(name)]
+    return fields
+
+
+def make_environment(root, count):
+    """
+    Fabricate an environment of count packages in the given directory,
+    returning its prefix and a
+    :class:`~conda_testenv.metadata_cache.CachedMetaData` for the recipe
+    of each package, as conda-build would render it.
+
+    Each package depends on a few of those before it, so that the
+    dependency closures grow with the size of the environment.
+
+    """
+    prefix = os.path.join(root, 'env')
+    pkgs = os.path.join(root, 'pkgs')
+    os.makedirs(os.path.join(prefix, 'conda-meta'))
+    metas = []
+    for index in range(count):
+        name = 'pkg{:05d}'.format(index)
+        version = '1.{}'.format(index % 7)
+        kind = KINDS[index % len(KINDS)]
+        dist = '{}-{}-0'.format(name, version)
+        source = os.path.join(pkgs, dist)
+        recipe = os.path.join(source, 'info', 'recipe')
+        os.makedirs(recipe)
+        with open(os.path.join(recipe, 'meta.yaml'), 'w') as fh:
+            fh.write(recipe_meta_yaml(name, version, kind))
+        if kind == 'python':
+            with open(os.path.join(recipe, 'run_test.py'), 'w') as fh:
+                fh.write('import {}\n'.format(name))
+        elif kind == 'shell':
+            with open(os.path.join(recipe, 'run_test.sh'), 'w') as fh:
+                fh.write('{} --version\n'.format(name))
+        depends = sorted(set('pkg{:05d}'.format(dep)
+                             for dep in (index - 1, index // 2, index // 3)
+                             if 0 <= dep < index))
+        record = {'name': name, 'version': version, 'build': '0',
+                  'depends': depends, 'link': {'source': source}}
+        with open(os.path.join(prefix, 'conda-meta', dist + '.json'),
+                  'w') as fh:
+            json.dump(record, fh)
+        fields = recipe_test_fields(name, kind)
+        fields.update({'name': name, 'version': version, 'build_id': '0',
+                       'dist': dist})
+        metas.append(metadata_cache.CachedMetaData(recipe, fields))
+    return prefix, metas
+
+
+def conda_build_available():
+    try:
+        import conda_build  # noqa
+    except ImportError:
+        return False
+    return True
+
+
+def time_stages(root, count):
+    """
+    Time each stage of a run against a synthetic environment of count
+    packages in the given directory, returning a dictionary of stage name
+    to seconds, or None for a stage which could not be run.
+
+    """
+    prefix, metas = make_environment(root, count)
+    stages = {}
+
+    start = phases.clock()
+    packages = conda_meta.linked_packages(prefix)
+    recipes = test_env.package_recipes(packages)
+    stages['discover'] = phases.clock() - start
+
+    start = phases.clock()
+    index = conda_meta.PackageIndex(packages)
+    for package, recipe_dir in recipes:
+        result_cache.cache_key(package.dist, recipe_dir, index)
+    stages['result cache keys'] = phases.clock() - start
+
+    cache = metadata_cache.MetadataCache(
+        'benchmark', None, path=os.path.join(root, 'metadata.json'))
+    for m in metas:
+        cache.put(m.path, m)
+    start = phases.clock()
+    for package, recipe_dir in recipes:
+        cache.get(recipe_dir)
+    stages['metadata cache'] = phases.clock() - start
+
+    history = durations.DurationHistory(os.path.join(root,
+                                                     'durations.json'))
+    start = phases.clock()
+    history.longest_first(metas)
+    stages['schedule'] = phases.clock() - start
+
+    stages['render'] = stages['test files'] = None
+    if conda_build_available():
+        start = phases.clock()
+        list(test_env.iter_package_metadata(recipes))
+        stages['render'] = phases.clock() - start
+
+        start = phases.clock()
+        for m in metas:
+            with test_env.pkg_test_dir(m):
+                pass
+        stages['test files'] = phases.clock() - start
+    return stages
+
+
+#: The stages, in the order in which they are reported.
+STAGES = ('discover', 'render', 'metadata cache', 'test files',
+          'result cache keys', 'schedule')
+
+
+def run_benchmark(sizes=SIZES):
+    """
+    Time the stages of a run for environments of each of the given sizes,
+    returning a dictionary of size to the stages timed by
+    :func:`time_stages`.
+
+    """
+    timings = {}
+    for count in sizes:
+        root = tempfile.mkdtemp(prefix='conda-testenv-benchmark-')
+        try:
+            timings[count] = time_stages(root, count)
+        finally:
+            shutil.rmtree(root)
+    return timings
+
+
+def scaling_exponent(sizes, seconds):
+    """
+    The exponent k of seconds = c * size ** k through the smallest and
+    largest sizes, which is about 1 for a stage which scales linearly, or
+    None if it cannot be told.
+
+    """
+    pairs = [(size, value) for size, value in zip(sizes, seconds)
+             if size > 0 and value]
+    if len(pairs) < 2 or pairs[0][0] == pairs[-1][0]:
+        return None
+    (small, small_time), (large, large_time) = pairs[0], pairs[-1]
+    return math.log(large_time / small_time) / math.log(float(large) / small)
+
+
+def report(timings, out=None):
+    """
+    Print a table of the seconds taken by each stage for each size, with
+    the scaling exponent of each stage.
+
+    """
+    out = out or sys.stdout
+    sizes = sorted(timings)
+    row = '{:<18}' + ' {:>10}' * len(sizes) + ' {:>8}'
+    print(row.format('stage', *['N={}'.format(size) for size in sizes] +
+                     ['scaling']), file=out)
+    for stage in STAGES:
+        seconds = [timings[size][stage] for size in sizes]
+        if all(value is None for value in seconds):
+            print('{:<18} skipped (conda-build is not installed)'.format(
+                stage), file=out)
+            continue
+        exponent = scaling_exponent(sizes, seconds)
+        print(row.format(stage,
+                         *['{:.4f}s'.format(value) for value in seconds] +
+                         ['-' if exponent is None
+                          else 'N^{:.2f}'.format(exponent)]),
+              file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                        help='Comma separated numbers of packages '
+                             '(default: %(default)s).')
+    args = parser.parse_args()
+    try:
+        sizes = sorted(int(size) for size in args.sizes.split(','))
+    except ValueError:
+        parser.error('--sizes must be a comma separated list of integers')
+    report(run_benchmark(sizes))
+
+
+if __name__ == '__main__':
+    main()
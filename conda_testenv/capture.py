@@ -0,0 +1,129 @@
+"""
+Capture the output of the tests of each package, rather than letting it
+go straight to the terminal, so that the output of concurrent packages
+cannot interleave. Each package's output is kept in memory up to a
+threshold, beyond which it spills to a temporary file, and is printed in
+one piece once the package is finished.
+
+"""
+from __future__ import print_function
+
+import sys
+import tempfile
+import threading
+
+
+#: The number of bytes of a package's output kept in memory before it
+#: spills to a temporary file.
+THRESHOLD = 1024 * 1024
+
+#: The number of lines of the output of a failed package printed in quiet
+#: mode.
+TAIL_LINES = 50
+
+#: The number of bytes copied at a time.
+CHUNK = 64 * 1024
+
+
+class Capture(object):
+    """
+    A file-like buffer of the output of a package's tests, which is kept
+    in memory until it exceeds threshold bytes. It may be written to from
+    several threads.
+
+    """
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+        self.size = 0
+        self._file = tempfile.SpooledTemporaryFile(max_size=threshold,
+                                                   prefix='conda-testenv-')
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        with self._lock:
+            self._file.seek(0, 2)
+            self._file.write(data)
+            self.size += len(data)
+
+    def flush(self):
+        pass
+
+    @property
+    def spilled(self):
+        """Whether the output has spilled to disk."""
+        return self.size > self.threshold
+
+    def append_file(self, path):
+        """Append the contents of the file at the given path."""
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(CHUNK), b''):
+                self.write(chunk)
+
+    def chunks(self, start=0):
+        """Yield the output from the given offset, in chunks of bytes."""
+        with self._lock:
+            self._file.seek(start)
+            while True:
+                chunk = self._file.read(CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+
+    def tail(self, lines):
+        """The text of the last given number of lines of the output."""
+        start = max(self.size - CHUNK, 0)
+        text = b''.join(self.chunks(start)).decode('utf-8', 'replace')
+        return '\n'.join(text.splitlines()[-lines:])
+
+    def close(self):
+        self._file.close()
+
+
+class OutputCapture(object):
+    """
+    How the output of each package's tests is captured and printed to out,
+    stdout by default. In quiet mode, only the last tail_lines of the
+    output of packages which fail or time out are printed.
+
+    """
+    def __init__(self, threshold=THRESHOLD, quiet=False,
+                 tail_lines=TAIL_LINES, out=None):
+        self.threshold = threshold
+        self.quiet = quiet
+        self.tail_lines = tail_lines
+        self.out = out
+        # Held while a package's output is printed, so that it is not
+        # interleaved with another's.
+        self._lock = threading.Lock()
+
+    def buffer(self):
+        """A new :class:`Capture` for the output of a package."""
+        return Capture(self.threshold)
+
+    def emit(self, result, capture):
+        """
+        Print the output in the given :class:`Capture` of the package with
+        the given :class:`~conda_testenv.results.PackageResult`.
+
+        """
+        out = self.out or sys.stdout
+        if self.quiet:
+            if not result.gating or not capture.size:
+                return
+            with self._lock:
+                print('===== {}: {}, the last {} lines of its output '
+                      '====='.format(result.dist, result.status,
+                                     self.tail_lines), file=out)
+                print(capture.tail(self.tail_lines), file=out)
+                out.flush()
+            return
+        if not capture.size and not result.gating:
+            return
+        with self._lock:
+            print('===== {}: {} ====='.format(result.dist, result.status),
+                  file=out)
+            for chunk in capture.chunks():
+                out.write(chunk.decode('utf-8', 'replace'))
+            out.flush()
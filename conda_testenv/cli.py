@@ -1,23 +1,391 @@
 import argparse
+import sys
 
 import conda_testenv
-import conda_testenv.test_env as test_env
+from conda_testenv.sharding import parse_shard
+
+
+def package_timeout(value):
+    """Parse a NAME=SECONDS package timeout."""
+    name, sep, seconds = value.partition('=')
+    try:
+        if not (name and sep):
+            raise ValueError
+        return name, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected NAME=SECONDS, got {!r}'
+                                         ''.format(value))
+
+
+def merge(argv):
+    """
+    Combine the JSON reports of the shards of an environment, as the
+    ``conda-testenv merge`` command.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog='conda-testenv merge',
+        description='Combine the --report-json reports of every --shard of '
+                    'an environment into a report of the whole environment')
+    parser.add_argument('reports', nargs='+', metavar='REPORT',
+                        help='The JSON report of a shard.')
+    parser.add_argument('--report-json', metavar='PATH',
+                        help='Write the combined JSON report to PATH.')
+    parser.add_argument('--junit-xml', metavar='PATH',
+                        help='Write a combined JUnit XML report to PATH.')
+    parser.add_argument('--durations', metavar='PATH',
+                        help='Record the durations of the packages tested '
+                             'by the shards in the durations history at '
+                             'PATH, which the shards only read.')
+    args = parser.parse_args(argv)
+
+    from conda_testenv import durations, report
+    from conda_testenv.results import summarise
+
+    try:
+        results = report.merge_json(args.reports)
+    except (IOError, ValueError, KeyError) as err:
+        parser.error(str(err))
+    if args.report_json is not None:
+        report.write_json(results, args.report_json)
+    if args.junit_xml is not None:
+        report.write_junit(results, args.junit_xml)
+    if args.durations is not None:
+        history = durations.DurationHistory(args.durations)
+        history.record_results(results)
+        history.save()
+    summarise(results)
+    if any(result.gating for result in results):
+        sys.exit(1)
+
+
+def worker(argv):
+    """
+    Test the packages published to a shared queue by ``conda-testenv
+    --queue``, as the ``conda-testenv worker`` command.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog='conda-testenv worker',
+        description='Test packages from the queue of a "conda-testenv '
+                    '--queue" run, until the run is finished')
+    parser.add_argument('queue', metavar='QUEUE',
+                        help='The shared queue directory.')
+    parser.add_argument('-p', dest='prefix', required=True,
+                        help='The environment, which must have the same '
+                             'packages as that of the run.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of packages to test concurrently '
+                             '(default: %(default)s).')
+    parser.add_argument('--log-dir', metavar='DIR',
+                        help="Write the output of each package's tests to "
+                             'its own log file in DIR.')
+    parser.add_argument('--no-metadata-cache', dest='use_metadata_cache',
+                        action='store_false',
+                        help='Render the meta.yaml of every recipe.')
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    from conda_testenv import work_queue
+
+    queue = work_queue.JobQueue(args.queue)
+    tested = work_queue.work(queue, args.prefix, jobs=args.jobs,
+                             log_dir=args.log_dir,
+                             use_metadata_cache=args.use_metadata_cache)
+    print('The run is finished, after this worker tested {} '
+          'packages.'.format(tested))
+
+
+def watch(argv):
+    """
+    Test the packages of an environment as they are linked into it, as the
+    ``conda-testenv watch`` command.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog='conda-testenv watch',
+        description='Watch an environment, and test each package which is '
+                    'linked into it, until interrupted')
+    parser.add_argument('-p', dest='prefix', required=True,
+                        help='The environment to watch.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of packages to test concurrently '
+                             '(default: %(default)s).')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='Test every package which is linked, including '
+                             'those whose tests have already passed against '
+                             'the same recipe and dependencies.')
+    parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                        help="Kill a package's tests after SECONDS.")
+    parser.add_argument('--log-dir', metavar='DIR',
+                        help="Write the output of each package's tests to "
+                             'its own log file in DIR.')
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        metavar='SECONDS',
+                        help='Wait until the environment has not changed '
+                             'for SECONDS before testing the packages which '
+                             'were linked (default: %(default)s).')
+    parser.add_argument('--poll', action='store_true',
+                        help='Poll the environment for changes, rather than '
+                             'using inotify.')
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.debounce < 0:
+        parser.error('--debounce must not be negative')
+
+    from conda_testenv import watch
+
+    try:
+        watch.watch_env(args.prefix, poll=args.poll, debounce=args.debounce,
+                        jobs=args.jobs, use_cache=args.use_cache,
+                        timeout=args.timeout, log_dir=args.log_dir)
+    except IOError as err:
+        parser.error(str(err))
+
+
+#: The subcommands, which are given as the first argument.
+COMMANDS = {'merge': merge, 'watch': watch, 'worker': worker}
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        return COMMANDS[sys.argv[1]](sys.argv[2:])
+
     parser = argparse.ArgumentParser(description='Tool for running the tests '
                                                  'of all packages installed '
-                                                 'in a conda environment')
+                                                 'in a conda environment',
+                                     epilog='Run "conda-testenv merge -h" '
+                                            'for how to combine the reports '
+                                            'of shards, "conda-testenv '
+                                            'worker -h" for how to test the '
+                                            'packages of a --queue, and '
+                                            '"conda-testenv watch -h" for '
+                                            'how to test packages as they '
+                                            'are linked.')
 
     parser.add_argument('--version', action='version',
                         version=conda_testenv.__version__,
                         help="Show conda-testenv's version, and exit.")
 
-    parser.add_argument('-p', dest='prefix')
+    parser.add_argument('-p', dest='prefix', action='append', default=[],
+                        help='The prefix of the environment to test. May be '
+                             'repeated to test several environments '
+                             'together, testing the builds which they share '
+                             'only once.')
+
+    parser.add_argument('--all-envs', action='store_true',
+                        help="Test conda's root environment and every "
+                             'environment in its envs_dirs, as if each were '
+                             'given by -p.')
+
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of packages to test concurrently '
+                             '(default: %(default)s).')
+
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='Test every package, including those whose '
+                             'tests have already passed against the same '
+                             'recipe and dependencies.')
+
+    parser.add_argument('--zygote', action='store_true',
+                        help='Run the Python tests by forking a single, '
+                             'already started, interpreter in the '
+                             'environment.')
+
+    parser.add_argument('--preload', action='append', default=[],
+                        metavar='MODULE',
+                        help='A module for the --zygote interpreter to '
+                             'import before forking. May be repeated.')
+
+    parser.add_argument('--batch-imports', action='store_true',
+                        help='Test the packages whose only tests are '
+                             'imports together, in as many interpreters as '
+                             'there are jobs.')
+
+    parser.add_argument('--engine', choices=['threads', 'asyncio'],
+                        default='threads',
+                        help='How to run the tests of concurrent packages. '
+                             'The asyncio engine streams their output line '
+                             'by line, tagged with the package name '
+                             '(default: %(default)s).')
+
+    parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                        help='Kill the tests of any package which take '
+                             'longer than this, and report them as timed '
+                             'out.')
+
+    parser.add_argument('--package-timeout', type=package_timeout,
+                        action='append', default=[], metavar='NAME=SECONDS',
+                        help='The timeout for the tests of the named '
+                             'package, overriding --timeout. May be '
+                             'repeated.')
+
+    parser.add_argument('--no-metadata-cache', dest='use_metadata_cache',
+                        action='store_false',
+                        help='Render the meta.yaml of every recipe, rather '
+                             'than using the test metadata cached from '
+                             'previous runs.')
+
+    parser.add_argument('--no-keep-going', dest='keep_going',
+                        action='store_false',
+                        help='Stop at the first package whose tests fail, '
+                             'rather than testing every package and '
+                             'summarising the failures at the end.')
+
+    parser.add_argument('--report-json', metavar='PATH',
+                        help='Write a JSON report of the status, kinds of '
+                             'test and duration of every package to PATH.')
+
+    parser.add_argument('--junit-xml', metavar='PATH',
+                        help='Write a JUnit XML report of the results to '
+                             'PATH, with a test case for each package.')
+
+    parser.add_argument('--log-dir', metavar='DIR',
+                        help="Write the output of each package's tests to "
+                             'its own log file in DIR, rather than to the '
+                             'terminal.')
+
+    parser.add_argument('--capture', action='store_true',
+                        help="Capture the output of each package's tests "
+                             'and print it in one piece once they finish, '
+                             'so that the output of packages tested at the '
+                             'same time is not interleaved.')
+
+    parser.add_argument('--quiet', action='store_true',
+                        help="Capture the output of each package's tests, "
+                             'printing only the end of the output of those '
+                             'which fail or time out.')
+
+    parser.add_argument('--profile', action='store_true',
+                        help='Report the time spent in each phase of the '
+                             'run, to show how much of it is taken by '
+                             'conda-testenv rather than by the tests.')
+
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N',
+                        help='Test only the Ith of N shards of the '
+                             'environment, balanced by the --durations '
+                             'history if given, and otherwise split by a '
+                             'hash of each package. Combine the '
+                             '--report-json of each shard with '
+                             '"conda-testenv merge".')
+
+    parser.add_argument('--durations', metavar='PATH',
+                        help='The durations history to schedule by, and '
+                             'to balance the shards by, which every shard '
+                             'must share and only reads (default: '
+                             'durations.json in the state directory, which '
+                             'is not used for sharding). Record the '
+                             'durations of the shards with "conda-testenv '
+                             'merge --durations".')
+
+    parser.add_argument('--queue', metavar='DIR',
+                        help='Rather than testing the packages, publish '
+                             'them to a queue in the shared directory DIR, '
+                             'and collect the results of the "conda-testenv '
+                             'worker" processes which test them.')
+
+    parser.add_argument('--lease', type=float, metavar='SECONDS',
+                        help='With --queue, the time after which a package '
+                             'is given to another worker if its worker '
+                             'stops responding (default: 60).')
+
+    parser.add_argument('--fail-fast', type=int, nargs='?', const=1,
+                        metavar='N',
+                        help='Stop once N packages (default: 1) have failed '
+                             'or timed out, killing the tests which are '
+                             'running and skipping the rest.')
+
+    parser.add_argument('--retries', type=int, default=0, metavar='N',
+                        help='Test the packages which fail again, up to N '
+                             'times, once the others have been tested '
+                             '(default: %(default)s).')
+
+    parser.add_argument('--quarantine-flaky', action='store_true',
+                        help='Report the failures of packages whose tests '
+                             'have flipped between passing and failing, '
+                             'but do not fail the run for them.')
+
+    parser.add_argument('--test-requires', action='store_true',
+                        help='Install the test requirements of the recipes '
+                             'which are not in the environment into an '
+                             'overlay environment, created once from the '
+                             'local channel and the pkgs cache, and run the '
+                             'tests with it.')
 
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.zygote and sys.platform == 'win32':
+        parser.error('--zygote is not available on Windows')
+    if args.engine == 'asyncio':
+        if sys.version_info < (3, 5):
+            parser.error('--engine asyncio requires Python 3.5 or later')
+        if args.zygote:
+            parser.error('--zygote cannot be used with --engine asyncio')
+    if args.fail_fast is not None and args.fail_fast < 1:
+        parser.error('--fail-fast must be at least 1')
+    if args.retries < 0:
+        parser.error('--retries must not be negative')
+    if args.retries and not args.keep_going:
+        parser.error('--retries cannot be used with --no-keep-going')
+    if args.log_dir is not None:
+        for option in ('capture', 'quiet'):
+            if getattr(args, option):
+                parser.error('--{} cannot be used with '
+                             '--log-dir'.format(option))
+    if args.lease is not None:
+        if args.queue is None:
+            parser.error('--lease can only be used with --queue')
+        if args.lease <= 0:
+            parser.error('--lease must be positive')
+    if args.queue is not None:
+        if not args.keep_going:
+            parser.error('--no-keep-going cannot be used with --queue')
+        if args.fail_fast is not None:
+            parser.error('--fail-fast cannot be used with --queue')
+        if args.test_requires:
+            parser.error('--test-requires cannot be used with --queue')
+        if args.retries:
+            parser.error('--retries cannot be used with --queue')
+
+    # Imported here, so that --help and --version needn't wait for it.
+    import conda_testenv.test_env as test_env
+
+    prefixes = list(args.prefix)
+    if args.all_envs:
+        prefixes += [prefix for prefix in test_env.conda_environments()
+                     if prefix not in prefixes]
+    if len(prefixes) > 1:
+        for option, value in [('--zygote', args.zygote),
+                              ('--batch-imports', args.batch_imports),
+                              ('--engine asyncio', args.engine != 'threads'),
+                              ('--shard', args.shard is not None),
+                              ('--queue', args.queue is not None)]:
+            if value:
+                parser.error('{} cannot be used with several '
+                             'environments'.format(option))
+        env_prefix = prefixes
+    else:
+        env_prefix = prefixes[0] if prefixes else None
 
-    test_env.run_env_tests(args.prefix)
+    options = test_env.RunOptions(
+        jobs=args.jobs, use_cache=args.use_cache,
+        zygote=args.zygote, preload=args.preload,
+        batch_imports=args.batch_imports, engine=args.engine,
+        timeout=args.timeout, package_timeouts=dict(args.package_timeout),
+        use_metadata_cache=args.use_metadata_cache,
+        keep_going=args.keep_going, report_json=args.report_json,
+        junit_xml=args.junit_xml, log_dir=args.log_dir,
+        profile=args.profile, shard=args.shard,
+        durations_path=args.durations, queue_dir=args.queue,
+        lease=args.lease, fail_fast=args.fail_fast, retries=args.retries,
+        quarantine_flaky=args.quarantine_flaky, capture_output=args.capture,
+        quiet=args.quiet, test_requires=args.test_requires)
+    results = test_env.run_env_tests(env_prefix, options)
+    if any(result.gating for result in results):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -9,16 +9,20 @@ in the future.
 (c) 2012 Continuum Analytics, Inc. / http://continuum.io
 
 """
+import os
 from os.path import join
-import subprocess
 import sys
+import tempfile
+import time
 
-import conda_build.build
-from conda_build.create_test import (create_files, create_shell_files,
-                                     create_py_files, create_pl_files)
+from conda_testenv import processes
+from conda_testenv.results import FAILED, PASSED, TIMED_OUT
 
 
 def create_test_files(m, tmp_dir):
+    from conda_build.create_test import (create_files, create_shell_files,
+                                         create_py_files, create_pl_files)
+
     create_files(tmp_dir, m)
     # Make Perl or Python-specific test files
     if m.name().startswith('perl-'):
@@ -32,36 +36,112 @@ def create_test_files(m, tmp_dir):
     return py_files, pl_files, shell_files
 
 
-def run_tests(m, env, tmp_dir, py_files, pl_files, shell_files):
+def test_commands(tmp_dir, py_files, pl_files, shell_files):
+    """
+    Return the (kind, command) of each of the test files created in tmp_dir,
+    in the order in which they should be run. The kind is one of 'py', 'pl'
+    or 'shell'.
+
+    """
+    cmds = []
     if py_files:
-        try:
-            subprocess.check_call(['python', '-s',
-                                   join(tmp_dir, 'run_test.py')],
-                                  env=env, cwd=tmp_dir)
-        except subprocess.CalledProcessError:
-            conda_build.build.tests_failed(m)
+        cmds.append(('py', ['python', '-s', join(tmp_dir, 'run_test.py')]))
 
     if pl_files:
-        try:
-            subprocess.check_call(['perl',
-                                   join(tmp_dir, 'run_test.pl')],
-                                  env=env, cwd=tmp_dir)
-        except subprocess.CalledProcessError:
-            conda_build.build.tests_failed(m)
+        cmds.append(('pl', ['perl', join(tmp_dir, 'run_test.pl')]))
 
     if shell_files:
         if sys.platform == 'win32':
             test_file = join(tmp_dir, 'run_test.bat')
             cmd = [os.environ['COMSPEC'], '/c', 'call', test_file]
-            try:
-                subprocess.check_call(cmd, env=env, cwd=tmp_dir)
-            except subprocess.CalledProcessError:
-                conda_build.build.tests_failed(m)
         else:
             test_file = join(tmp_dir, 'run_test.sh')
             # TODO: Run the test/commands here instead of in run_test.py
             cmd = ['/bin/bash', '-x', '-e', test_file]
-            try:
-                subprocess.check_call(cmd, env=env, cwd=tmp_dir)
-            except subprocess.CalledProcessError:
-                conda_build.build.tests_failed(m)
+        cmds.append(('shell', cmd))
+    return cmds
+
+
+def run_in_zygote(zygote, script, tmp_dir, env, timeout, log, cancel,
+                  capture):
+    """
+    Run a Python test script with :meth:`conda_testenv.zygote.Zygote.run`.
+    The zygote's children can only write to a file, so output for a
+    capture goes to a temporary file first.
+
+    """
+    if log is not None or capture is None:
+        return zygote.run(script, tmp_dir, env, timeout=timeout, log=log,
+                          cancel=cancel)
+    fd, output = tempfile.mkstemp(prefix='conda-testenv-', suffix='.log')
+    os.close(fd)
+    try:
+        return zygote.run(script, tmp_dir, env, timeout=timeout, log=output,
+                          cancel=cancel)
+    finally:
+        capture.append_file(output)
+        os.remove(output)
+
+
+def run_test_commands(env, tmp_dir, cmds, zygote=None, timeout=None,
+                      log=None, cancel=None, capture=None):
+    """
+    Run the given (kind, command) pairs from :func:`test_commands` in
+    tmp_dir, stopping at the first that fails. If given a
+    :class:`~conda_testenv.zygote.Zygote`, the Python tests are run by
+    forking it rather than by starting a new interpreter.
+
+    Each command runs in its own process group. Should the commands take
+    longer than timeout seconds in total, the process group of the one
+    running is killed. If given the path of a log file, the output of the
+    commands is written to it rather than inherited from this process.
+    Given a :class:`~conda_testenv.processes.Cancellation`, each command
+    is registered with it, and
+    :class:`~conda_testenv.processes.Cancelled` raised should it be
+    cancelled. Without a log, the output may instead be written to the
+    given :class:`~conda_testenv.capture.Capture`.
+
+    Returns the status of the tests, one of the statuses of
+    :mod:`conda_testenv.results`, and the kinds of the commands which were
+    run.
+
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    kinds = []
+    log_file = None
+    if log is not None:
+        # Append, so that the output of subprocesses and zygote children
+        # don't overwrite each other.
+        open(log, 'w').close()
+        log_file = open(log, 'a')
+    try:
+        for kind, cmd in cmds:
+            kinds.append(kind)
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - time.time(), 0)
+            if kind == 'py' and zygote is not None:
+                returncode = run_in_zygote(zygote, cmd[-1], tmp_dir, env,
+                                           remaining, log, cancel, capture)
+            else:
+                returncode = processes.call(cmd, env=env, cwd=tmp_dir,
+                                            timeout=remaining,
+                                            stdout=log_file or capture,
+                                            cancel=cancel)
+            if returncode is None:
+                return TIMED_OUT, kinds
+            if returncode != 0:
+                return FAILED, kinds
+        return PASSED, kinds
+    finally:
+        if log_file is not None:
+            log_file.close()
+
+
+def run_tests(m, env, tmp_dir, py_files, pl_files, shell_files):
+    import conda_build.build
+
+    cmds = test_commands(tmp_dir, py_files, pl_files, shell_files)
+    status, _ = run_test_commands(env, tmp_dir, cmds)
+    if status != PASSED:
+        conda_build.build.tests_failed(m)
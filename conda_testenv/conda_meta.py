@@ -0,0 +1,103 @@
+"""
+Discover the packages linked into an environment by reading the records
+which conda keeps in its ``conda-meta`` directory directly, in one pass,
+keeping only the fields which conda-testenv needs.
+
+"""
+from collections import namedtuple
+import glob
+import json
+from multiprocessing.pool import ThreadPool
+import os
+
+
+#: A package linked into an environment. The source is the directory in the
+#: pkgs cache from which it was linked, or None if that is not recorded.
+LinkedPackage = namedtuple('LinkedPackage',
+                           'dist name version build source depends')
+
+
+def read_record(path):
+    """
+    Return the :class:`LinkedPackage` described by the conda-meta record at
+    the given path.
+
+    """
+    dist = os.path.basename(path)[:-len('.json')]
+    with open(path) as fh:
+        record = json.load(fh)
+    name, version, build = dist.rsplit('-', 2)
+    source = record.get('link', {}).get('source')
+    if source is None:
+        source = record.get('extracted_package_dir')
+    return LinkedPackage(dist=dist,
+                         name=record.get('name', name),
+                         version=record.get('version', version),
+                         build=record.get('build',
+                                          record.get('build_string', build)),
+                         source=source,
+                         depends=tuple(record.get('depends', ())))
+
+
+def linked_packages(prefix, threads=None):
+    """
+    List the packages linked into the given environment, ordered by dist as
+    in ``conda list``. The records are read by a pool of the given number of
+    threads, which can help on network filesystems.
+
+    """
+    paths = glob.glob(os.path.join(prefix, 'conda-meta', '*.json'))
+    if threads is not None and threads > 1 and len(paths) > 1:
+        pool = ThreadPool(threads)
+        try:
+            packages = pool.map(read_record, paths)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        packages = [read_record(path) for path in paths]
+    return sorted(packages, key=lambda package: package.dist.lower())
+
+
+class PackageIndex(object):
+    """
+    The linked packages of an environment, indexed by dist and by name, so
+    that the dependencies of each can be looked up without going through
+    all of them. Build one per environment and reuse it.
+
+    """
+    def __init__(self, packages):
+        self.by_dist = dict((package.dist, package) for package in packages)
+        self.by_name = dict((package.name, package.dist)
+                            for package in packages)
+
+    def closure(self, dist):
+        """
+        Return the set of dists which the given dist depends upon, directly
+        or indirectly. Dependencies which are not linked are ignored.
+
+        """
+        closure = set()
+        todo = [dist]
+        while todo:
+            package = self.by_dist.get(todo.pop())
+            if package is None:
+                continue
+            for spec in package.depends:
+                dep = self.by_name.get(spec.split()[0])
+                if dep is not None and dep not in closure and dep != dist:
+                    closure.add(dep)
+                    todo.append(dep)
+        return closure
+
+
+def dependency_closure(packages, dist):
+    """
+    Return the set of dists which the given dist depends upon, directly or
+    indirectly, amongst the given linked packages, or :class:`PackageIndex`
+    of them. Dependencies which are not linked are ignored.
+
+    """
+    if not isinstance(packages, PackageIndex):
+        packages = PackageIndex(packages)
+    return packages.closure(dist)
@@ -0,0 +1,119 @@
+"""
+Record how long the tests of each package take, so that the longest can be
+started first when testing concurrently (longest processing time first
+scheduling).
+
+"""
+import os
+
+from conda_testenv import state
+
+
+#: Rough costs, in seconds, used to estimate the duration of the tests of a
+#: package which has never been tested before.
+INTERPRETER_COST = 0.5
+IMPORT_COST = 0.2
+COMMAND_COST = 1.0
+SCRIPT_COST = 5.0
+FILE_COST = 0.5
+
+#: The weight given to the latest duration when updating the history.
+SMOOTHING = 0.5
+
+
+def estimate_duration(m):
+    """
+    Estimate how long the tests of the given recipe will take from the kind
+    of tests it defines and the number of files involved.
+
+    """
+    imports = m.get_value('test/imports') or []
+    commands = m.get_value('test/commands') or []
+    files = m.get_value('test/files') or []
+    scripts = [name for name in ('run_test.py', 'run_test.pl',
+                                 'run_test.sh', 'run_test.bat')
+               if os.path.exists(os.path.join(m.path, name))]
+
+    estimate = 0.0
+    if imports or 'run_test.py' in scripts:
+        estimate += INTERPRETER_COST
+    estimate += IMPORT_COST * len(imports)
+    estimate += COMMAND_COST * len(commands)
+    estimate += SCRIPT_COST * len(scripts)
+    estimate += FILE_COST * len(files)
+    return estimate
+
+
+class DurationHistory(object):
+    """
+    The durations of previous package tests, keyed by the package's
+    name-version-build string. Packages which have not been tested at
+    their current version fall back to the duration of any other version
+    of the same package.
+
+    A read_only history is never saved, such as one shared by several
+    processes which would otherwise overwrite each other's durations.
+
+    """
+    def __init__(self, path=None, read_only=False):
+        if path is None:
+            path = os.path.join(state.state_dir(), 'durations.json')
+        self.path = path
+        self.read_only = read_only
+        history = state.load_json(path, default={})
+        self.dists = history.get('dists', {})
+        self.names = history.get('names', {})
+
+    def get(self, dist, name=None):
+        """
+        The expected duration of the tests of the given dist, or None if
+        it has never been recorded.
+
+        """
+        duration = self.dists.get(dist)
+        if duration is None and name is not None:
+            duration = self.names.get(name)
+        return duration
+
+    def record(self, dist, name, duration):
+        previous = self.dists.get(dist)
+        if previous is not None:
+            duration = SMOOTHING * duration + (1 - SMOOTHING) * previous
+        self.dists[dist] = duration
+        self.names[name] = duration
+
+    def expected_duration(self, m):
+        """
+        The expected duration of the tests of the given recipe, from the
+        history if possible and otherwise by estimation.
+
+        """
+        duration = self.get(m.dist(), m.name())
+        if duration is None:
+            duration = estimate_duration(m)
+        return duration
+
+    def longest_first(self, metas):
+        """
+        Return the given recipes sorted so that those expected to take the
+        longest come first. Ties keep their original order.
+
+        """
+        return sorted(metas, key=self.expected_duration, reverse=True)
+
+    def record_results(self, results):
+        """
+        Record the durations of the given
+        :class:`~conda_testenv.results.PackageResult` of packages whose
+        tests were run, such as those read from a report.
+
+        """
+        for result in results:
+            if result.reason is None and result.tested_in is None:
+                self.record(result.dist, result.name, result.duration)
+
+    def save(self):
+        if self.read_only:
+            return
+        state.dump_json({'dists': self.dists, 'names': self.names},
+                        self.path)
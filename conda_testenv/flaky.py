@@ -0,0 +1,57 @@
+"""
+Record whether the tests of each package passed, run after run, so that
+packages whose tests flip between passing and failing can be recognised
+as flaky, and quarantined so that their failures do not fail the run.
+
+"""
+import os
+import time
+
+from conda_testenv import result_cache, state
+
+
+#: The number of the latest outcomes of each package which are kept.
+WINDOW = 20
+
+#: The number of flips between passing and failing within the window which
+#: make a package flaky.
+FLIPS = 2
+
+
+class FlakyHistory(object):
+    """
+    The latest outcomes of the tests of each package, keyed by the
+    package's name-version-build string. Packages which have not been
+    tested for result_cache.MAX_AGE are forgotten.
+
+    """
+    def __init__(self, path=None, max_age=result_cache.MAX_AGE):
+        if path is None:
+            path = os.path.join(state.state_dir(), 'flaky.json')
+        self.path = path
+        self.max_age = max_age
+        self.dists = state.load_json(path, default={})
+
+    def record(self, dist, passed):
+        entry = self.dists.setdefault(dist, {'outcomes': []})
+        entry['outcomes'] = (entry['outcomes'] + [bool(passed)])[-WINDOW:]
+        entry['used'] = time.time()
+
+    def flips(self, dist):
+        """
+        The number of times the tests of the given dist have changed from
+        passing to failing, or back, within the window.
+
+        """
+        outcomes = self.dists.get(dist, {}).get('outcomes', [])
+        return sum(1 for previous, outcome in zip(outcomes, outcomes[1:])
+                   if previous != outcome)
+
+    def is_flaky(self, dist):
+        return self.flips(dist) >= FLIPS
+
+    def save(self):
+        oldest = time.time() - self.max_age
+        self.dists = dict((dist, entry) for dist, entry in self.dists.items()
+                          if entry.get('used', 0) >= oldest)
+        state.dump_json(self.dists, self.path)
@@ -0,0 +1,170 @@
+"""
+Test the packages whose recipes only define ``test/imports`` in batches,
+importing the modules of many packages in each of a few interpreters rather
+than starting an interpreter per package.
+
+Each import is guarded, and its failure is attributed to the package which
+declared it, so that a broken module only fails its own package. Should an
+interpreter die part way through a batch, the packages it didn't report on
+are left to be tested individually.
+
+This module is also run as a script by the Python of the environment under
+test, so the script must only depend on the standard library and work on
+both Python 2 and 3.
+
+"""
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+
+#: The test scripts which, if present in a recipe, mean that its tests are
+#: more than just imports.
+TEST_SCRIPTS = ('run_test.py', 'run_test.pl', 'run_test.sh', 'run_test.bat')
+
+
+def imports_only(m):
+    """
+    Whether the only tests defined by the given recipe are imports.
+
+    """
+    if m.name().startswith('perl-') or not m.get_value('test/imports'):
+        return False
+    if m.get_value('test/commands') or m.get_value('test/files'):
+        return False
+    return not any(os.path.exists(os.path.join(m.path, name))
+                   for name in TEST_SCRIPTS)
+
+
+def import_modules(packages_fname, results_fname):
+    """
+    Import the modules of each (dist, imports) pair in the given JSON file,
+    appending a line to the results file as each package is finished.
+
+    """
+    with open(packages_fname) as fh:
+        packages = json.load(fh)
+    with open(results_fname, 'a') as results:
+        for dist, imports in packages:
+            print('===== testing package: {} ====='.format(dist))
+            start = time.time()
+            failed = []
+            for name in imports:
+                print('import: {!r}'.format(name))
+                try:
+                    __import__(name)
+                except KeyboardInterrupt:
+                    raise
+                except BaseException:
+                    traceback.print_exc()
+                    failed.append(name)
+            if failed:
+                print('===== {} FAILED to import {} ====='.format(
+                    dist, ', '.join(failed)))
+            sys.stdout.flush()
+            sys.stderr.flush()
+            result = {'dist': dist, 'failed': failed,
+                      'duration': time.time() - start}
+            results.write(json.dumps(result) + '\n')
+            results.flush()
+
+
+def run_batch(cmd, **kwargs):
+    """
+    Run a batch with :func:`conda_testenv.processes.call`. A batch killed
+    by a cancellation just stops, leaving the rest of its recipes
+    unreported.
+
+    """
+    from conda_testenv import processes
+
+    try:
+        processes.call(cmd, **kwargs)
+    except processes.Cancelled:
+        pass
+
+
+def test_imports(metas, env, batches=1, python='python', timeout_for=None,
+                 log_dir=None, cancel=None):
+    """
+    Import the modules of the given import-only recipes in up to the given
+    number of concurrent interpreters in the environment described by env.
+
+    If given, timeout_for(m) is the number of seconds the imports of a
+    recipe may take, or None for no limit. A batch is killed once it has
+    taken longer than the total of its recipes' timeouts. Given a log_dir,
+    the output of each batch is written to an import-batch-N.log file in
+    it. The batches are registered with the given
+    :class:`~conda_testenv.processes.Cancellation`, if any.
+
+    Returns a dictionary mapping the dist of each package which was tested
+    to a (passed, duration, log) tuple, where log is the path of the
+    batch's log file or None.
+
+    """
+    metas = list(metas)
+    if not metas:
+        return {}
+    batches = max(1, min(batches, len(metas)))
+    tmpdir = tempfile.mkdtemp(prefix='conda-testenv-imports-')
+    script = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+    try:
+        threads = []
+        for i in range(batches):
+            batch = metas[i::batches]
+            packages = [(m.dist(), list(m.get_value('test/imports')))
+                        for m in batch]
+            packages_fname = os.path.join(tmpdir, 'batch{}.json'.format(i))
+            results_fname = os.path.join(tmpdir,
+                                         'results{}.jsonl'.format(i))
+            with open(packages_fname, 'w') as fh:
+                json.dump(packages, fh)
+            open(results_fname, 'w').close()
+            cmd = [python, '-s', script, packages_fname, results_fname]
+            timeout = None
+            if timeout_for is not None:
+                timeouts = [timeout_for(m) for m in batch]
+                if None not in timeouts:
+                    timeout = sum(timeouts)
+            log = log_file = None
+            if log_dir is not None:
+                log = os.path.join(log_dir, 'import-batch-{}.log'.format(i))
+                log_file = open(log, 'w')
+            thread = threading.Thread(target=run_batch, args=(cmd,),
+                                      kwargs=dict(env=env, cwd=tmpdir,
+                                                  timeout=timeout,
+                                                  stdout=log_file,
+                                                  cancel=cancel))
+            thread.start()
+            threads.append((thread, results_fname, log, log_file))
+
+        tested = {}
+        for thread, results_fname, log, log_file in threads:
+            thread.join()
+            if log_file is not None:
+                log_file.close()
+            with open(results_fname) as fh:
+                for line in fh:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        # A partial line from an interpreter which died.
+                        continue
+                    tested[result['dist']] = (not result['failed'],
+                                              result['duration'], log)
+        return tested
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    # Don't let the modules alongside this one shadow those being imported.
+    del sys.path[0]
+    import_modules(sys.argv[1], sys.argv[2])
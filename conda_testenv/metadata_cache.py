@@ -0,0 +1,124 @@
+"""
+Cache the parts of a rendered conda_build.metadata.MetaData which are
+needed to test a package, so that a recipe's meta.yaml need only be parsed
+and rendered once for as long as it, conda-build and CONDA_NPY are
+unchanged.
+
+"""
+import hashlib
+import os
+import time
+
+from conda_testenv import result_cache, state
+
+
+#: The fields of a recipe which are kept in the cache.
+TEST_FIELDS = ('test/files', 'test/source_files', 'test/imports',
+               'test/commands', 'test/requires')
+
+
+class CachedMetaData(object):
+    """
+    A stand-in for the conda_build.metadata.MetaData of a recipe, providing
+    just what is needed to create and run the recipe's tests: its path, and
+    the name, version, build_id, dist, get_value and get_section methods.
+    These are what the create_files, create_py_files, create_pl_files and
+    create_shell_files functions of conda_build.create_test use, as called
+    by :func:`conda_testenv.conda_build_test.create_test_files`. Only the
+    test section is cached, and there is no config, which conda-build
+    needs to fetch the source for test/source_files, so recipes with
+    those are never cached.
+
+    """
+    def __init__(self, path, fields):
+        #: The directory of the recipe.
+        self.path = path
+        self.fields = fields
+
+    @classmethod
+    def from_metadata(cls, m):
+        fields = dict((field, m.get_value(field)) for field in TEST_FIELDS)
+        fields.update({'name': m.name(), 'version': m.version(),
+                       'build_id': m.build_id(), 'dist': m.dist()})
+        return cls(m.path, fields)
+
+    def name(self):
+        return self.fields['name']
+
+    def version(self):
+        return self.fields['version']
+
+    def build_id(self):
+        return self.fields['build_id']
+
+    def dist(self):
+        return self.fields['dist']
+
+    def get_value(self, field, default=None):
+        value = self.fields.get(field)
+        if value is None:
+            return default
+        return value
+
+    def get_section(self, section):
+        """The fields of the given section which are cached and set."""
+        prefix = section + '/'
+        return dict((field[len(prefix):], value)
+                    for field, value in self.fields.items()
+                    if field.startswith(prefix) and value is not None)
+
+    def __repr__(self):
+        return '<CachedMetaData {}>'.format(self.dist())
+
+
+class MetadataCache(object):
+    """
+    An on-disk cache of :class:`CachedMetaData`, keyed by the contents of
+    the recipe directory, the version of conda-build and CONDA_NPY.
+    Entries which have not been used for result_cache.MAX_AGE are evicted.
+
+    """
+    def __init__(self, conda_build_version, npy, path=None,
+                 max_age=result_cache.MAX_AGE):
+        if path is None:
+            path = os.path.join(state.state_dir(), 'metadata.json')
+        self.path = path
+        self.max_age = max_age
+        self.salt = '{}\0{}'.format(conda_build_version, npy)
+        self.entries = state.load_json(path, default={})
+
+    def key(self, recipe_dir):
+        digest = hashlib.sha1(self.salt.encode('utf-8'))
+        digest.update(result_cache.hash_directory(recipe_dir).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, recipe_dir):
+        """
+        The cached metadata of the recipe in the given directory, or None.
+
+        """
+        entry = self.entries.get(self.key(recipe_dir))
+        if entry is None:
+            return None
+        entry['used'] = time.time()
+        return CachedMetaData(recipe_dir, entry['fields'])
+
+    def put(self, recipe_dir, m):
+        """
+        Cache the given metadata of the recipe in the given directory,
+        unless it has test/source_files, which a :class:`CachedMetaData`
+        cannot stand in for.
+
+        """
+        if m.get_value('test/source_files'):
+            return
+        fields = CachedMetaData.from_metadata(m).fields
+        self.entries[self.key(recipe_dir)] = {'used': time.time(),
+                                              'fields': fields}
+
+    def save(self):
+        oldest = time.time() - self.max_age
+        self.entries = dict((key, entry)
+                            for key, entry in self.entries.items()
+                            if entry['used'] >= oldest)
+        state.dump_json(self.entries, self.path)
@@ -0,0 +1,303 @@
+"""
+An overlay environment holding the ``test/requires`` of the recipes being
+tested which are not in the environment under test, such as pytest or
+mock, so that their tests can run without installing them there.
+
+The requirements of all of the recipes are solved together, once, into a
+single overlay, which is created offline from the local channel and the
+pkgs cache. Its directories are added to PATH and PYTHONPATH when the
+tests are run. PATH keeps the environment under test first, but
+PYTHONPATH comes before site-packages on sys.path, so the requirements
+are solved twice: first on their own, to find which of the packages of
+the environment under test the overlay would also hold, and then with
+those packages pinned to their exact builds. Any package which the
+overlay shares with the environment is then the same build, and
+shadowing it changes nothing.
+
+Overlays are kept in the state directory, one for each distinct set of
+requirements and environment, so that the next run with the same
+requirements reuses its overlay. A lock file beside an overlay keeps
+concurrent runs from creating it at the same time. An overlay is not
+built elsewhere and renamed into place, as conda writes the prefix of an
+environment into its scripts.
+
+"""
+from __future__ import print_function
+
+from contextlib import contextmanager
+import errno
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+from conda_testenv import conda_meta, processes, state
+
+
+#: The file which marks an overlay as completely created, and records the
+#: requirements it was created for.
+MARKER = os.path.join('conda-meta', 'conda-testenv-overlay.json')
+
+#: The number of seconds after which the lock of an overlay is taken to
+#: have been left behind by a run which died while creating it.
+LOCK_TIMEOUT = 3600.0
+
+#: The number of seconds to wait between looks at the lock of an overlay
+#: which another run is creating.
+POLL = 1.0
+
+
+class OverlayError(Exception):
+    """Raised when the overlay of some test requirements cannot be made."""
+
+
+def spec_name(spec):
+    """The name of the package of the given conda match spec."""
+    match = re.match(r'[^\s<>=!~\[]+', spec.strip())
+    return match.group(0).lower() if match else ''
+
+
+def test_requirements(metas, packages):
+    """
+    The sorted match specs of the test/requires of the given recipes, less
+    those of packages which are among the given
+    :class:`~conda_testenv.conda_meta.LinkedPackage` of the environment
+    under test.
+
+    """
+    linked = set(package.name.lower() for package in packages)
+    specs = set()
+    for m in metas:
+        for spec in m.get_value('test/requires') or ():
+            spec = ' '.join(str(spec).split())
+            if spec and spec_name(spec) not in linked:
+                specs.add(spec)
+    return sorted(specs)
+
+
+def pin(package):
+    """The match spec of the exact build of the given linked package."""
+    return '{}={}={}'.format(package.name, package.version, package.build)
+
+
+def shared_pins(packages, names):
+    """
+    The sorted pins of those of the given
+    :class:`~conda_testenv.conda_meta.LinkedPackage` whose lowercase names
+    are among names, and of the linked packages which they depend upon,
+    so that the pinned builds are installable together.
+
+    """
+    index = conda_meta.PackageIndex(packages)
+    dists = set()
+    for package in packages:
+        if package.name.lower() in names:
+            dists.add(package.dist)
+            dists.update(index.closure(package.dist))
+    return sorted(pin(index.by_dist[dist]) for dist in dists)
+
+
+def linked_names(actions):
+    """
+    The lowercase names of the packages which the actions reported by
+    ``conda create --dry-run --json`` would link.
+
+    """
+    if isinstance(actions, dict):
+        actions = [actions]
+    names = set()
+    for action in actions:
+        for link in action.get('LINK', ()):
+            if isinstance(link, dict):
+                name = link.get('name') or link['dist_name'].rsplit('-', 2)[0]
+            else:
+                # A channel::name-version-build dist, perhaps followed by
+                # the kind of link.
+                dist = str(link).split()[0].split('::')[-1]
+                name = dist.rsplit('-', 2)[0]
+            names.add(name.lower())
+    return names
+
+
+def overlays_dir():
+    """The directory in which the overlays are kept."""
+    return os.path.join(state.state_dir(), 'overlays')
+
+
+def overlay_path(specs, root=None):
+    """
+    The prefix of the overlay of the given specs in root, by default
+    :func:`overlays_dir`.
+
+    """
+    digest = hashlib.sha1('\n'.join(sorted(specs)).encode('utf-8'))
+    return os.path.join(root or overlays_dir(), digest.hexdigest()[:16])
+
+
+def conda_executable():
+    """The conda command, as used to run conda-testenv if known."""
+    return os.environ.get('CONDA_EXE', 'conda')
+
+
+def create_command(prefix, offline=True):
+    """The conda command which creates an environment at the prefix."""
+    cmd = [conda_executable(), 'create', '--yes', '--quiet',
+           '--prefix', prefix, '--use-local']
+    if offline:
+        cmd.append('--offline')
+    return cmd
+
+
+def solve(specs, prefix, offline=True):
+    """
+    The lowercase names of the packages which conda would install into a
+    new environment of the given match specs at the prefix. Raises
+    :class:`OverlayError` if they cannot be installed.
+
+    """
+    cmd = create_command(prefix, offline) + ['--dry-run', '--json']
+    try:
+        proc = subprocess.Popen(cmd + list(specs), stdout=subprocess.PIPE)
+    except OSError as err:
+        raise OverlayError('Unable to run conda: {}'.format(err))
+    output, _ = proc.communicate()
+    try:
+        document = json.loads(output.decode('utf-8'))
+    except ValueError:
+        document = {}
+    if proc.returncode != 0 or not isinstance(document, dict):
+        message = None
+        if isinstance(document, dict):
+            message = document.get('message') or document.get('error')
+        raise OverlayError('conda cannot install {}: {}'.format(
+            ', '.join(specs), message or 'exit status {}'.format(
+                proc.returncode)))
+    return linked_names(document.get('actions', {}))
+
+
+@contextmanager
+def locked(prefix, poll=POLL):
+    """
+    Hold the lock of the overlay at the given prefix for the lifetime of
+    this context manager, first waiting for any other run which holds it.
+
+    """
+    lock = prefix + '.lock'
+    waiting = False
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        try:
+            stale = time.time() - os.path.getmtime(lock) > LOCK_TIMEOUT
+        except OSError:
+            # The lock has just been released.
+            continue
+        if stale:
+            try:
+                os.remove(lock)
+            except OSError:
+                pass
+            continue
+        if not waiting:
+            waiting = True
+            print('Waiting for another run to create the overlay at '
+                  '{}.'.format(prefix))
+            sys.stdout.flush()
+        time.sleep(poll)
+    try:
+        yield
+    finally:
+        os.remove(lock)
+
+
+def create_overlay(specs, packages=(), root=None, offline=True):
+    """
+    Return the prefix of an overlay environment of the given match specs
+    for the environment of the given
+    :class:`~conda_testenv.conda_meta.LinkedPackage`, creating it unless
+    it already exists. Those of the packages which the overlay would also
+    hold, as found by :func:`solve`, are pinned to their builds. With
+    offline, only the local channel and the packages in the pkgs cache are
+    used. Raises :class:`OverlayError` if the overlay cannot be created.
+
+    """
+    # The overlay depends on the builds of the environment, as well as on
+    # the specs, as they determine what is pinned.
+    key = sorted(specs) + sorted(pin(package) for package in packages)
+    prefix = overlay_path(key, root)
+    marker = os.path.join(prefix, MARKER)
+    if state.load_json(marker) == key:
+        return prefix
+    try:
+        os.makedirs(os.path.dirname(prefix))
+    except OSError as err:
+        if err.errno != errno.EEXIST:
+            raise
+    with locked(prefix):
+        if state.load_json(marker) == key:
+            # Another run has just created it.
+            return prefix
+        if os.path.exists(prefix):
+            # The remains of an overlay whose creation was cut short.
+            shutil.rmtree(prefix)
+        print('Creating an overlay environment of the test requirements: '
+              '{}'.format(', '.join(specs)))
+        sys.stdout.flush()
+        pins = shared_pins(packages, solve(specs, prefix, offline))
+        try:
+            returncode = processes.call(create_command(prefix, offline) +
+                                        list(specs) + pins)
+        except OSError as err:
+            raise OverlayError('Unable to run conda: {}'.format(err))
+        if returncode != 0:
+            if os.path.exists(prefix):
+                shutil.rmtree(prefix, ignore_errors=True)
+            raise OverlayError('conda could not create the overlay of {} '
+                               '(exit status {}).'.format(', '.join(specs),
+                                                          returncode))
+        state.dump_json(key, marker)
+    return prefix
+
+
+def bin_dirs(prefix):
+    """The directories of the executables of the given environment."""
+    if sys.platform == 'win32':
+        return [prefix, os.path.join(prefix, 'Library', 'bin'),
+                os.path.join(prefix, 'Scripts')]
+    return [os.path.join(prefix, 'bin')]
+
+
+def site_packages(prefix):
+    """The site-packages directories of the given environment."""
+    if sys.platform == 'win32':
+        pattern = os.path.join(prefix, 'Lib', 'site-packages')
+    else:
+        pattern = os.path.join(prefix, 'lib', 'python*', 'site-packages')
+    return sorted(glob.glob(pattern))
+
+
+def layer_environ(env, prefix):
+    """
+    Return a copy of the given environment variables with the directories
+    of the overlay at the given prefix appended to PATH and PYTHONPATH.
+    The environment under test takes precedence on PATH, but not on
+    sys.path, where PYTHONPATH comes before site-packages, which is why
+    the packages the overlay shares with the environment are pinned.
+
+    """
+    env = dict(env)
+    for var, dirs in [('PATH', bin_dirs(prefix)),
+                      ('PYTHONPATH', site_packages(prefix))]:
+        paths = [path for path in env.get(var, '').split(os.pathsep)
+                 if path]
+        env[var] = os.pathsep.join(paths + dirs)
+    return env
@@ -0,0 +1,120 @@
+"""
+Timing of the phases of a test run, to show where the time of a slow run
+goes: to conda-testenv itself, or to the tests of the packages.
+
+"""
+from __future__ import print_function
+
+from contextlib import contextmanager
+import math
+import sys
+import threading
+import time
+
+
+#: A clock which never goes backwards, where there is one (Python 3.3+).
+clock = getattr(time, 'monotonic', time.time)
+
+#: The phases of a run, in the order in which they are reported.
+DISCOVER = 'discover packages'
+METADATA = 'render metadata'
+TEST_FILES = 'create test files'
+TEST = 'run tests'
+CLEANUP = 'clean up'
+PHASES = (DISCOVER, METADATA, TEST_FILES, TEST, CLEANUP)
+
+#: The percentiles reported for each phase.
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """
+    Return the given percentile of a sorted, non-empty list of values, by
+    the nearest-rank method.
+
+    """
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class Profile(object):
+    """
+    The time spent in each phase of a run, per package. Phases may be timed
+    from several threads at once.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = clock()
+        #: Maps each phase to a dictionary of package dist to seconds.
+        self.timings = dict((phase, {}) for phase in PHASES)
+
+    def add(self, phase, dist, seconds):
+        """Add the given number of seconds to a package's phase."""
+        with self._lock:
+            timings = self.timings[phase]
+            timings[dist] = timings.get(dist, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase, dist=None):
+        """
+        Time the body of this context manager as the given phase of the
+        package with the given dist, or of the whole run if None.
+
+        """
+        start = clock()
+        try:
+            yield
+        finally:
+            self.add(phase, dist, clock() - start)
+
+    def elapsed(self):
+        """The number of seconds since this profile was created."""
+        return clock() - self._start
+
+    def report(self, out=None):
+        """
+        Print a table of the total, percentiles and maximum of the time
+        that packages spent in each phase, and how the time spent in
+        conda-testenv itself compares to that spent running tests.
+
+        """
+        out = out or sys.stdout
+        columns = ['p{}'.format(percent) for percent in PERCENTILES]
+        row = '{:<18} {:>6} {:>9} ' + '{:>8} ' * len(columns) + '{:>8}'
+        print('===== Profile =====', file=out)
+        print(row.format('phase', 'count', 'total', *columns + ['max']),
+              file=out)
+        totals = {}
+        for phase in PHASES:
+            values = sorted(self.timings[phase].values())
+            totals[phase] = sum(values)
+            if not values:
+                continue
+            stats = [percentile(values, percent) for percent in PERCENTILES]
+            print(row.format(phase, len(values),
+                             '{:.2f}s'.format(totals[phase]),
+                             *['{:.3f}s'.format(value)
+                               for value in stats + [values[-1]]]),
+                  file=out)
+        measured = sum(totals.values())
+        overhead = measured - totals[TEST]
+        share = 100.0 * overhead / measured if measured else 0.0
+        print('Test time {:.2f}s, conda-testenv overhead {:.2f}s ({:.1f}%), '
+              'wall time {:.2f}s.'.format(totals[TEST], overhead, share,
+                                          self.elapsed()),
+              file=out)
+
+
+@contextmanager
+def timed(profile, phase, dist=None):
+    """
+    Time the body of this context manager as the given phase with
+    :meth:`Profile.phase`, or do nothing if profile is None.
+
+    """
+    if profile is None:
+        yield
+    else:
+        with profile.phase(phase, dist):
+            yield
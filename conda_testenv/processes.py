@@ -0,0 +1,179 @@
+"""
+Run test processes in their own process group, so that the whole tree of
+processes started by a test can be killed should it take too long.
+
+"""
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+
+def process_group_kwargs():
+    """
+    The keyword arguments to subprocess.Popen which start the process in a
+    new process group.
+
+    """
+    if sys.platform == 'win32':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    elif sys.version_info[0] >= 3:
+        return {'start_new_session': True}
+    else:
+        return {'preexec_fn': os.setsid}
+
+
+def kill_process_group(pid):
+    """
+    Kill the process with the given pid, which must lead its own process
+    group, along with all of its descendants. Returns whether there was
+    anything to kill.
+
+    """
+    if sys.platform == 'win32':
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(['taskkill', '/F', '/T', '/PID', str(pid)],
+                                   stdout=devnull, stderr=devnull) == 0
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        # The process group has already gone.
+        return False
+    return True
+
+
+#: The number of seconds to wait, once a command has exited, for the rest
+#: of its output to be piped to a capture. Processes which it left running
+#: in the background may hold the pipe open for longer.
+DRAIN_TIMEOUT = 5.0
+
+
+def _pump(pipe, out):
+    fd = pipe.fileno()
+    while True:
+        data = os.read(fd, 64 * 1024)
+        if not data:
+            break
+        out.write(data)
+
+
+class Cancelled(Exception):
+    """Raised when a test process is killed by a :class:`Cancellation`."""
+
+
+class Cancellation(object):
+    """
+    A means of killing the process groups of all of the test processes
+    registered with it at once, and any which are registered afterwards.
+    This happens when :meth:`cancel` is called, or on the limit-th call of
+    :meth:`failed` if given a limit.
+
+    """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.failures = 0
+        self.cancelled = False
+        self._pids = set()
+        # The pids of the registered processes which this has killed.
+        self._killed = set()
+        self._lock = threading.Lock()
+
+    def failed(self):
+        """Record a failure, cancelling if it is the limit-th."""
+        with self._lock:
+            self.failures += 1
+            cancel = self.limit is not None and self.failures >= self.limit
+        if cancel:
+            self.cancel()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            pids = list(self._pids)
+        for pid in pids:
+            self._kill(pid)
+
+    def _kill(self, pid):
+        # Recorded before the signal is sent, as the process may be reaped,
+        # and checked, as soon as it has been.
+        with self._lock:
+            self._killed.add(pid)
+        if not kill_process_group(pid):
+            with self._lock:
+                self._killed.discard(pid)
+
+    def register(self, pid):
+        with self._lock:
+            self._pids.add(pid)
+            cancelled = self.cancelled
+        if cancelled:
+            self._kill(pid)
+
+    def unregister(self, pid):
+        with self._lock:
+            self._pids.discard(pid)
+
+    def check(self, pid, returncode):
+        """
+        Raise :class:`Cancelled` if the process with the given pid, which
+        exited with the given status, was killed by this cancellation. A
+        process which failed by itself before it could be killed is not.
+
+        """
+        with self._lock:
+            killed = pid in self._killed
+            self._killed.discard(pid)
+        if killed and returncode != 0:
+            raise Cancelled()
+
+
+def call(cmd, env=None, cwd=None, timeout=None, stdout=None, cancel=None):
+    """
+    Run the command in a new process group and return its exit status, or
+    None if it was killed, along with its descendants, after the given
+    timeout in seconds. If given a file, both stdout and stderr are
+    redirected to it. stdout may also be an object with a write method but
+    no file descriptor, such as a :class:`~conda_testenv.capture.Capture`,
+    to which the output is piped. If given a :class:`Cancellation`, the
+    process is registered with it, and :class:`Cancelled` is raised should
+    it be killed by it.
+
+    """
+    stderr = None if stdout is None else subprocess.STDOUT
+    piped = stdout is not None and not hasattr(stdout, 'fileno')
+    proc = subprocess.Popen(cmd, env=env, cwd=cwd,
+                            stdout=subprocess.PIPE if piped else stdout,
+                            stderr=stderr, **process_group_kwargs())
+    pump = None
+    if piped:
+        pump = threading.Thread(target=_pump, args=(proc.stdout, stdout))
+        pump.daemon = True
+        pump.start()
+    timed_out = []
+
+    def expire():
+        if proc.poll() is None:
+            timed_out.append(True)
+            kill_process_group(proc.pid)
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+    if cancel is not None:
+        cancel.register(proc.pid)
+    try:
+        returncode = proc.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if cancel is not None:
+            cancel.unregister(proc.pid)
+        if pump is not None:
+            pump.join(DRAIN_TIMEOUT)
+    if cancel is not None:
+        cancel.check(proc.pid, returncode)
+    if timed_out:
+        return None
+    return returncode
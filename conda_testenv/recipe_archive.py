@@ -0,0 +1,162 @@
+"""
+Read the recipe of a package from its tarball in the pkgs cache, for when
+the extracted package directory has been cleaned out.
+
+Only the ``info/recipe/`` members are written, streamed out of the
+tarball without extracting the rest of the package. The whole tarball is
+read, as conda-build only puts the top-level ``info/`` files first, and
+orders the members of ``info/recipe/`` among the package's own files. The
+recipes are kept in the state directory, so that each tarball is only
+read once.
+
+"""
+import errno
+import os
+import shutil
+import tarfile
+import tempfile
+
+from conda_testenv import state
+
+
+#: The extension of the package tarballs in the pkgs cache.
+TARBALL_EXTENSION = '.tar.bz2'
+
+#: The directory of the recipe within a package.
+RECIPE_PREFIX = 'info/recipe/'
+
+
+def recipes_dir():
+    """The directory in which the recipes read from tarballs are kept."""
+    return os.path.join(state.state_dir(), 'recipes')
+
+
+def pkgs_dirs(source):
+    """
+    The pkgs caches in which to look for the tarball of the package whose
+    extracted directory is the given source: the cache which holds the
+    source, and those in the CONDA_PKGS_DIRS environment variable.
+
+    """
+    dirs = [os.path.dirname(source)]
+    for path in os.environ.get('CONDA_PKGS_DIRS', '').split(','):
+        path = os.path.expanduser(path.strip())
+        if path and path not in dirs:
+            dirs.append(path)
+    return dirs
+
+
+def find_tarball(source):
+    """
+    The path of the tarball of the package whose extracted directory is
+    the given source, or None if there is none.
+
+    """
+    name = os.path.basename(os.path.normpath(source)) + TARBALL_EXTENSION
+    for pkgs_dir in pkgs_dirs(source):
+        tarball = os.path.join(pkgs_dir, name)
+        if os.path.isfile(tarball):
+            return tarball
+    return None
+
+
+def member_name(member):
+    """The name of the given tarball member, without any leading ./"""
+    name = member.name
+    while name.startswith('./'):
+        name = name[2:]
+    return name
+
+
+def recipe_member_path(name):
+    """
+    The path relative to the recipe directory of the tarball member with
+    the given name, or None if it is not part of the recipe or would be
+    written outside of it.
+
+    """
+    if not name.startswith(RECIPE_PREFIX):
+        return None
+    path = os.path.normpath(name[len(RECIPE_PREFIX):])
+    if (not path or path == '.' or os.path.isabs(path) or
+            path.split(os.sep)[0] == os.pardir):
+        return None
+    return path
+
+
+def extract_recipe(tarball, dest):
+    """
+    Extract the recipe of the given package tarball into the directory
+    dest, which must exist, returning the number of files extracted. Links
+    and other special members are left out.
+
+    """
+    extracted = 0
+    with tarfile.open(tarball, 'r|*') as tar:
+        for member in tar:
+            path = recipe_member_path(member_name(member))
+            if path is None:
+                continue
+            target = os.path.join(dest, path)
+            if member.isdir():
+                if not os.path.isdir(target):
+                    os.makedirs(target)
+            elif member.isfile():
+                parent = os.path.dirname(target)
+                if not os.path.isdir(parent):
+                    os.makedirs(parent)
+                source = tar.extractfile(member)
+                with open(target, 'wb') as fh:
+                    shutil.copyfileobj(source, fh)
+                extracted += 1
+    return extracted
+
+
+def recipe_from_tarball(source, root=None):
+    """
+    The directory of the recipe of the package whose extracted directory
+    is the given source, read from its tarball into root (by default
+    :func:`recipes_dir`) unless that has already been done since the
+    tarball last changed. Raises IOError if there is no tarball, or it has
+    no recipe.
+
+    """
+    tarball = find_tarball(source)
+    if tarball is None:
+        raise IOError('The recipe for this package does not exist, and '
+                      'neither does its tarball.')
+    if root is None:
+        root = recipes_dir()
+    dist = os.path.basename(tarball)[:-len(TARBALL_EXTENSION)]
+    recipe = os.path.join(root, dist)
+    if (os.path.isdir(recipe) and
+            os.path.getmtime(recipe) >= os.path.getmtime(tarball)):
+        return recipe
+    try:
+        os.makedirs(root)
+    except OSError as err:
+        if err.errno != errno.EEXIST:
+            raise
+    # Extract beside the recipe and rename it into place, so that
+    # concurrent runs never see a partial recipe.
+    tmpdir = tempfile.mkdtemp(prefix='.extract-', dir=root)
+    try:
+        try:
+            count = extract_recipe(tarball, tmpdir)
+        except (tarfile.TarError, EOFError) as err:
+            raise IOError('The tarball of this package cannot be read: '
+                          '{}'.format(err))
+        if not count:
+            raise IOError('The tarball of this package has no recipe.')
+        if os.path.isdir(recipe):
+            shutil.rmtree(recipe, ignore_errors=True)
+        try:
+            os.rename(tmpdir, recipe)
+        except OSError:
+            # Another run has just put the same recipe in place.
+            if not os.path.isdir(recipe):
+                raise
+    finally:
+        if os.path.isdir(tmpdir):
+            shutil.rmtree(tmpdir, ignore_errors=True)
+    return recipe
@@ -0,0 +1,172 @@
+"""
+Machine-readable reports of a test run, for consumption by CI systems.
+
+"""
+from collections import Counter
+import json
+import xml.etree.ElementTree as ET
+
+from conda_testenv.conda_meta import LinkedPackage
+from conda_testenv.results import SKIPPED, STATUSES, PackageResult
+
+
+def result_record(result):
+    """
+    Return a dictionary describing the given
+    :class:`~conda_testenv.results.PackageResult`.
+
+    """
+    return {'name': result.name, 'version': result.version,
+            'build': result.build, 'dist': result.dist,
+            'status': result.status, 'kinds': list(result.kinds),
+            'duration': round(result.duration, 3), 'log': result.log,
+            'reason': result.reason, 'attempts': result.attempts,
+            'flaky': result.flaky, 'quarantined': result.quarantined,
+            'env': result.env, 'tested_in': result.tested_in}
+
+
+def record_result(record):
+    """
+    Return a :class:`~conda_testenv.results.PackageResult` from a record
+    made by :func:`result_record`.
+
+    """
+    package = LinkedPackage(dist=record['dist'], name=record['name'],
+                            version=record['version'],
+                            build=record['build'], source=None, depends=())
+    result = PackageResult(None, record['status'], record['duration'],
+                           package=package, reason=record['reason'],
+                           kinds=record['kinds'], log=record['log'])
+    result.attempts = record.get('attempts', 1)
+    result.flaky = record.get('flaky', False)
+    result.quarantined = record.get('quarantined', False)
+    result.env = record.get('env')
+    result.tested_in = record.get('tested_in')
+    return result
+
+
+def write_json(results, path, shard=None, sharded=None):
+    """
+    Write a JSON report of the given results to path, with one record per
+    package and the number of packages with each status. A partial report
+    of one shard of an environment records the (index, count) of its
+    shard, and the dists of every package of the environment which was
+    sharded, for :func:`merge_json`.
+
+    """
+    counts = dict((status, 0) for status in STATUSES)
+    for result in results:
+        counts[result.status] += 1
+    report = {'packages': [result_record(result) for result in results],
+              'summary': counts,
+              'duration': round(sum(result.duration for result in results),
+                                3)}
+    if shard is not None:
+        report['shard'] = list(shard)
+    if sharded is not None:
+        report['sharded'] = sorted(sharded)
+    with open(path, 'w') as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
+        fh.write('\n')
+
+
+def write_junit(results, path, suite_name='conda-testenv'):
+    """
+    Write a JUnit XML report of the given results to path, with one test
+    case per package, named after its environment too if there are
+    several. Quarantined failures are reported as skipped, so as not to
+    fail the build.
+
+    """
+    suite = ET.Element('testsuite', name=suite_name)
+    failures = skipped = 0
+    several_envs = len(set(result.env for result in results)) > 1
+    for result in results:
+        name = result.dist
+        if several_envs:
+            name = '{} in {}'.format(result.dist, result.env)
+        case = ET.SubElement(suite, 'testcase', classname=result.name,
+                             name=name,
+                             time='{:.3f}'.format(result.duration))
+        message = result.reason or 'The tests {}.'.format(result.status)
+        if result.gating:
+            failures += 1
+            ET.SubElement(case, 'failure', type=result.status,
+                          message=message)
+        elif result.quarantined:
+            skipped += 1
+            ET.SubElement(case, 'skipped',
+                          message='Quarantined as flaky: ' + message)
+        elif result.status == SKIPPED:
+            skipped += 1
+            ET.SubElement(case, 'skipped', message=message)
+        if result.log is not None:
+            ET.SubElement(case, 'system-out').text = result.log
+    suite.set('tests', str(len(results)))
+    suite.set('failures', str(failures))
+    suite.set('errors', '0')
+    suite.set('skipped', str(skipped))
+    suite.set('time', '{:.3f}'.format(sum(result.duration
+                                          for result in results)))
+    ET.ElementTree(suite).write(path, encoding='utf-8',
+                                xml_declaration=True)
+
+
+def read_json(path):
+    """
+    Return the results recorded in a report written by :func:`write_json`,
+    its shard or None, and the dists of the environment which was sharded
+    or None.
+
+    """
+    with open(path) as fh:
+        report = json.load(fh)
+    shard = report.get('shard')
+    return ([record_result(record) for record in report['packages']],
+            None if shard is None else tuple(shard), report.get('sharded'))
+
+
+def merge_json(paths):
+    """
+    Combine the partial reports of the shards of an environment at the
+    given paths, returning the results of all of their packages.
+
+    Raises ValueError unless the reports are of distinct shards of the same
+    number of shards, which are all present, and they report on each
+    package of the environment which was sharded exactly once.
+
+    """
+    results = []
+    shards = []
+    environments = set()
+    for path in paths:
+        shard_results, shard, sharded = read_json(path)
+        if shard is None:
+            raise ValueError('{} is not the report of a shard.'.format(path))
+        results.extend(shard_results)
+        shards.append(shard)
+        if sharded is not None:
+            environments.add(tuple(sharded))
+    if len(environments) > 1:
+        raise ValueError('The shards are of different sets of packages, '
+                         'so the shards cannot be combined.')
+    counts = set(count for _, count in shards)
+    if len(counts) != 1:
+        raise ValueError('The reports are of different numbers of shards.')
+    count = counts.pop()
+    indices = sorted(index for index, _ in shards)
+    if indices != list(range(1, count + 1)):
+        raise ValueError('Expected one report of each of shards 1 to {}, '
+                         'got shards {}.'.format(
+                             count, ', '.join(map(str, indices))))
+    dists = Counter(result.dist for result in results)
+    duplicated = sorted(dist for dist, n in dists.items() if n > 1)
+    if duplicated:
+        raise ValueError('These packages were tested by more than one '
+                         'shard: {}'.format(', '.join(duplicated)))
+    if environments:
+        missing = sorted(set(environments.pop()).difference(dists))
+        if missing:
+            raise ValueError('These packages were not tested by any shard: '
+                             '{}'.format(', '.join(missing)))
+    return sorted(results, key=lambda result: result.dist.lower())
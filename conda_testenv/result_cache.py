@@ -0,0 +1,99 @@
+"""
+Remember the packages whose tests have passed, so that they need not be run
+again until the package, its recipe or its dependencies change.
+
+"""
+import hashlib
+import os
+import time
+
+import conda_testenv
+from conda_testenv import conda_meta, state
+
+
+#: Entries which have not been used for this many seconds are evicted.
+MAX_AGE = 30 * 24 * 60 * 60
+
+#: The maximum number of entries kept, the least recently used are evicted.
+MAX_ENTRIES = 20000
+
+
+def hash_directory(path):
+    """
+    Return a hash of the names and contents of all the files in the given
+    directory.
+
+    """
+    digest = hashlib.sha1()
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            fname = os.path.join(dirpath, filename)
+            digest.update(os.path.relpath(fname, path).encode('utf-8'))
+            with open(fname, 'rb') as fh:
+                digest.update(fh.read())
+    return digest.hexdigest()
+
+
+def cache_key(dist, recipe_dir, packages):
+    """
+    The key under which the result of testing a package is cached. This
+    changes whenever the package, the contents of its recipe or any of the
+    :class:`~conda_testenv.conda_meta.LinkedPackage` it depends upon in the
+    environment change. To compute the keys of many packages, pass a
+    :class:`~conda_testenv.conda_meta.PackageIndex` of them, rather than
+    indexing them again for each key.
+
+    """
+    closure = sorted(conda_meta.dependency_closure(packages, dist))
+    digest = hashlib.sha1()
+    for part in [conda_testenv.__version__, dist,
+                 hash_directory(recipe_dir)] + closure:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    An on-disk record of the cache keys of the packages whose tests passed,
+    and when each was last used.
+
+    """
+    def __init__(self, path=None, max_age=MAX_AGE, max_entries=MAX_ENTRIES):
+        if path is None:
+            path = os.path.join(state.state_dir(), 'results.json')
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.entries = state.load_json(path, default={})
+
+    def passed(self, key):
+        """
+        Whether the tests of the package with the given key have already
+        passed, marking the entry as used if so.
+
+        """
+        if key in self.entries:
+            self.entries[key] = time.time()
+            return True
+        return False
+
+    def record(self, key):
+        self.entries[key] = time.time()
+
+    def evict(self):
+        """
+        Remove entries which have not been used recently, and the least
+        recently used entries beyond the maximum number allowed.
+
+        """
+        oldest = time.time() - self.max_age
+        entries = sorted(((used, key) for key, used in self.entries.items()
+                          if used >= oldest), reverse=True)
+        self.entries = dict((key, used)
+                            for used, key in entries[:self.max_entries])
+
+    def save(self):
+        self.evict()
+        state.dump_json(self.entries, self.path)
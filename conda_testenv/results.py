@@ -0,0 +1,141 @@
+"""
+The outcome of testing the packages of an environment.
+
+"""
+from __future__ import print_function
+
+import sys
+
+
+#: The statuses of a package's tests.
+PASSED = 'passed'
+FAILED = 'failed'
+TIMED_OUT = 'timed out'
+SKIPPED = 'skipped'
+
+#: The order in which statuses are summarised.
+STATUSES = (PASSED, FAILED, TIMED_OUT, SKIPPED)
+
+#: The reason given for the packages which were skipped, or whose tests
+#: were killed, once a run is cancelled by --fail-fast.
+CANCELLED = 'Cancelled, as enough other packages failed.'
+
+
+class PackageResult(object):
+    """
+    The outcome of running the tests of a single package.
+
+    The package is identified by the conda_build.MetaData of its recipe
+    or, for a package whose recipe could not be used, by its
+    :class:`~conda_testenv.conda_meta.LinkedPackage`.
+
+    """
+    def __init__(self, m, status, duration, package=None, reason=None,
+                 kinds=(), log=None):
+        #: The conda_build.MetaData of the package's recipe, if any.
+        self.m = m
+        #: The LinkedPackage, given if there is no recipe.
+        self.package = package
+        #: One of PASSED (including when there were no tests to run),
+        #: FAILED, TIMED_OUT or SKIPPED.
+        self.status = status
+        #: The wall-clock time, in seconds, taken to create and run the tests.
+        self.duration = duration
+        #: Why the package was skipped or failed, other than by its tests.
+        self.reason = reason
+        #: The kinds of test which were run, amongst 'py', 'pl' and 'shell'.
+        self.kinds = list(kinds)
+        #: The path of the file to which the output of the tests was
+        #: written, if any.
+        self.log = log
+        #: The number of times the tests were run, including retries.
+        self.attempts = 1
+        #: Whether the tests have flipped between passing and failing.
+        self.flaky = False
+        #: Whether the failure of the tests is reported but not gating,
+        #: because they are flaky.
+        self.quarantined = False
+        #: The prefix of the package's environment, if known.
+        self.env = None
+        #: The prefix of the environment in which the tests were run, if
+        #: the result is shared from an identical build in another one.
+        self.tested_in = None
+
+    @property
+    def name(self):
+        return self.m.name() if self.m is not None else self.package.name
+
+    @property
+    def version(self):
+        if self.m is not None:
+            return self.m.version()
+        return self.package.version
+
+    @property
+    def build(self):
+        return self.m.build_id() if self.m is not None else self.package.build
+
+    @property
+    def dist(self):
+        return self.m.dist() if self.m is not None else self.package.dist
+
+    @property
+    def passed(self):
+        return self.status == PASSED
+
+    @property
+    def gating(self):
+        """Whether this result should fail the run."""
+        return self.status in (FAILED, TIMED_OUT) and not self.quarantined
+
+    def __repr__(self):
+        return '<PackageResult {} {} duration={:.2f}>'.format(
+            self.dist, self.status, self.duration)
+
+
+def error_reason(exc):
+    """The reason to give for a package which failed with an exception."""
+    return '{}: {}'.format(type(exc).__name__, exc)
+
+
+def summarise(results, out=None):
+    """
+    Print a summary of the given results: the number of packages with each
+    status, followed by every package which failed or timed out, and
+    those which only passed when retried. Packages are followed by their
+    environment if there are several.
+
+    """
+    if out is None:
+        out = sys.stdout
+    results = list(results)
+    several_envs = len(set(result.env for result in results)) > 1
+
+    def describe(result):
+        if several_envs:
+            return '{} in {}'.format(result.dist, result.env)
+        return result.dist
+
+    counts = dict((status, 0) for status in STATUSES)
+    for result in results:
+        counts[result.status] += 1
+    print('===== Summary of {} packages ====='.format(len(results)),
+          file=out)
+    print(', '.join('{} {}'.format(counts[status], status)
+                    for status in STATUSES), file=out)
+    for status in (FAILED, TIMED_OUT):
+        for result in results:
+            if result.status == status:
+                line = '{}: {}'.format(status.upper(), describe(result))
+                if result.reason:
+                    line += ' ({})'.format(result.reason)
+                if result.quarantined:
+                    line += ' [flaky, quarantined]'
+                elif result.flaky:
+                    line += ' [flaky]'
+                print(line, file=out)
+    for result in results:
+        if result.passed and result.attempts > 1:
+            print('PASSED ON ATTEMPT {}: {}'.format(result.attempts,
+                                                    describe(result)),
+                  file=out)
@@ -0,0 +1,184 @@
+"""
+A pool of scratch directories in which to create and run package tests.
+
+Directories are recycled between packages rather than created and deleted
+for each one: releasing a directory renames its contents out of the way and
+a background thread deletes them, so that cleaning up never holds up the
+next test. The pool prefers a tmpfs such as /dev/shm, up to a size cap
+and while it has space to spare, and otherwise falls back to the usual
+temporary directory on disk. A tmpfs mounted noexec, as /dev/shm is in
+Docker containers and on many hardened hosts, is not used, as tests may
+run scripts or programs which they create in their directory.
+
+"""
+from contextlib import contextmanager
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+#: The tmpfs to use when available.
+SHM = '/dev/shm'
+
+#: The default number of bytes which the pool may use on the tmpfs.
+SHM_SIZE_CAP = 1024 ** 3
+
+#: The number of bytes which the pool leaves free on the tmpfs, so that a
+#: test whose directory is created on it does not run out of space.
+SHM_FREE_MARGIN = 128 * 1024 ** 2
+
+#: The statvfs flag of a filesystem mounted noexec, which the os module
+#: only has from Python 3.7.
+ST_NOEXEC = getattr(os, 'ST_NOEXEC',
+                    8 if sys.platform.startswith('linux') else None)
+
+
+def filesystem_used(path):
+    """The number of bytes used on the filesystem of the given path."""
+    stat = os.statvfs(path)
+    return (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+
+
+def filesystem_free(path):
+    """
+    The number of bytes available to unprivileged users on the filesystem
+    of the given path.
+
+    """
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+def mounted_noexec(path):
+    """
+    Whether the filesystem of the given path is known to be mounted
+    noexec.
+
+    """
+    if ST_NOEXEC is None:
+        return False
+    return bool(os.statvfs(path).f_flag & ST_NOEXEC)
+
+
+class ScratchPool(object):
+    """
+    A pool of scratch directories, created on the tmpfs at shm (if it
+    exists and is not mounted noexec) while the pool has used less than
+    shm_size_cap bytes of it and more than shm_free_margin bytes of it
+    are free, and in the usual temporary directory otherwise.
+
+    """
+    def __init__(self, shm=SHM, shm_size_cap=SHM_SIZE_CAP,
+                 shm_free_margin=SHM_FREE_MARGIN):
+        self.shm_root = None
+        self.shm_free_margin = shm_free_margin
+        if (shm is not None and hasattr(os, 'statvfs') and
+                os.path.isdir(shm) and os.access(shm, os.W_OK) and
+                not mounted_noexec(shm) and
+                filesystem_free(shm) > shm_free_margin):
+            self.shm_root = tempfile.mkdtemp(prefix='conda-testenv-', dir=shm)
+            self.shm_base = filesystem_used(self.shm_root)
+        self.shm_size_cap = shm_size_cap
+        self.disk_root = None
+        self._lock = threading.Lock()
+        self._idle = []
+        self._count = 0
+        self._trash = queue.Queue()
+        self._cleaner = threading.Thread(target=self._clean)
+        self._cleaner.daemon = True
+        self._cleaner.start()
+
+    def _clean(self):
+        while True:
+            path = self._trash.get()
+            try:
+                if path is None:
+                    return
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                self._trash.task_done()
+
+    def _shm_full(self):
+        if filesystem_free(self.shm_root) <= self.shm_free_margin:
+            return True
+        used = filesystem_used(self.shm_root) - self.shm_base
+        return used >= self.shm_size_cap
+
+    def _new_name(self, root, kind):
+        with self._lock:
+            self._count += 1
+            return os.path.join(root, '{}{}'.format(kind, self._count))
+
+    def _root(self):
+        if self.shm_root is not None and not self._shm_full():
+            return self.shm_root
+        with self._lock:
+            if self.disk_root is None:
+                self.disk_root = tempfile.mkdtemp(prefix='conda-testenv-')
+            return self.disk_root
+
+    def acquire(self):
+        """Return an empty scratch directory."""
+        slot = None
+        with self._lock:
+            if self._idle:
+                slot = self._idle.pop()
+        if (slot is not None and self.shm_root is not None and
+                os.path.dirname(slot) == self.shm_root and self._shm_full()):
+            # Move onto disk, now that the tmpfs has filled up.
+            os.rmdir(slot)
+            slot = None
+        if slot is None:
+            slot = self._new_name(self._root(), 'workdir')
+            os.mkdir(slot)
+        return slot
+
+    def release(self, slot):
+        """
+        Return a scratch directory to the pool, deleting its contents in
+        the background.
+
+        """
+        trash = self._new_name(os.path.dirname(slot), 'trash')
+        try:
+            os.rename(slot, trash)
+            os.mkdir(slot)
+        except OSError:
+            # Perhaps a file is still open on Windows; give up on the slot.
+            self._trash.put(slot)
+            return
+        self._trash.put(trash)
+        with self._lock:
+            self._idle.append(slot)
+
+    @contextmanager
+    def workdir(self):
+        """
+        Acquire a scratch directory for the lifetime of this context
+        manager.
+
+        """
+        slot = self.acquire()
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def close(self):
+        """
+        Wait for the background cleanup to finish, and remove the pool's
+        directories.
+
+        """
+        self._trash.put(None)
+        self._cleaner.join()
+        for root in [self.shm_root, self.disk_root]:
+            if root is not None:
+                shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,87 @@
+"""
+Split the packages of an environment into shards, so that the tests of a
+large environment can be spread across several machines.
+
+The split depends only on the packages and the durations history, so every
+machine which sees the same environment and history computes the same
+shards, and together the shards cover every package exactly once. Only a
+history which every machine shares may be used for this; without one,
+each package's shard depends only on its dist.
+
+"""
+import argparse
+import hashlib
+
+
+def parse_shard(value):
+    """
+    Parse an I/N shard, the Ith of N (counting from 1), into an (index,
+    count) pair.
+
+    """
+    index, sep, count = value.partition('/')
+    try:
+        if not sep:
+            raise ValueError
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected I/N, got {!r}'
+                                         ''.format(value))
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError('the shard index must be between 1 '
+                                         'and {}, got {}'.format(count,
+                                                                 index))
+    return index, count
+
+
+def split(packages, count, history=None):
+    """
+    Split the given :class:`~conda_testenv.conda_meta.LinkedPackage` into
+    count lists, returned in shard order.
+
+    Given a :class:`~conda_testenv.durations.DurationHistory`, the shards
+    are balanced by the expected duration of their tests, by assigning
+    each package, longest first, to the shard with the least work so far.
+    Packages with no history count as the median of those with some.
+
+    With no history, each package is put in a shard chosen by a hash of
+    its dist, so that its shard does not depend on the other packages, nor
+    on anything which differs between machines.
+
+    """
+    if history is None:
+        shards = [[] for _ in range(count)]
+        for package in packages:
+            digest = hashlib.md5(package.dist.encode('utf-8')).hexdigest()
+            shards[int(digest, 16) % count].append(package)
+        return [sorted(shard, key=lambda package: package.dist.lower())
+                for shard in shards]
+    expected = {}
+    for package in packages:
+        duration = history.get(package.dist, package.name)
+        if duration is not None:
+            expected[package.dist] = duration
+    known = sorted(expected.values())
+    default = known[len(known) // 2] if known else 1.0
+
+    def cost(package):
+        return expected.get(package.dist, default)
+
+    shards = [[] for _ in range(count)]
+    loads = [0.0] * count
+    for package in sorted(packages,
+                          key=lambda package: (-cost(package), package.dist)):
+        shard = loads.index(min(loads))
+        shards[shard].append(package)
+        loads[shard] += cost(package)
+    return [sorted(shard, key=lambda package: package.dist.lower())
+            for shard in shards]
+
+
+def shard(packages, index, count, history=None):
+    """
+    The packages of the given shard, the index-th of count (counting from
+    1), as split by :func:`split`.
+
+    """
+    return split(packages, count, history)[index - 1]
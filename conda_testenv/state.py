@@ -0,0 +1,56 @@
+"""
+Persistent state which conda-testenv keeps between runs, such as the
+durations of previous package tests.
+
+"""
+import errno
+import json
+import os
+import tempfile
+
+
+def state_dir():
+    """
+    The directory in which conda-testenv keeps its state. This may be
+    changed with the CONDA_TESTENV_STATE_DIR environment variable.
+
+    """
+    default = os.path.join(os.path.expanduser('~'), '.conda', 'testenv')
+    return os.environ.get('CONDA_TESTENV_STATE_DIR', default)
+
+
+def load_json(path, default=None):
+    """
+    Load the JSON document at the given path, returning the default if it
+    does not exist or cannot be read.
+
+    """
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def dump_json(obj, path):
+    """
+    Write obj as JSON to the given path. The file is replaced atomically so
+    that concurrent readers never see a partially written document.
+
+    """
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname)
+    except OSError as err:
+        if err.errno != errno.EEXIST:
+            raise
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(obj, fh, indent=1, sort_keys=True)
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
@@ -1,17 +1,33 @@
+"""
+Run the tests of the packages installed in a conda environment.
+
+conda and conda-build are slow to import, so they are only imported by the
+functions which need them. This keeps ``conda-testenv --help`` and
+``--version`` fast.
+
+"""
 from __future__ import print_function
 
+from collections import namedtuple
 from contextlib import contextmanager
+import copy
+import functools
+from multiprocessing.pool import ThreadPool
 import os
 import shutil
+import sys
 import tempfile
+import time
 
-import conda.cli.main_list
-import conda.install as install
-from conda_build.config import config
-import conda_build.metadata
-from conda_build.scripts import prepend_bin_path
-
-from conda_testenv import conda_build_test
+from conda_testenv import (capture, conda_build_test, conda_meta, durations,
+                           flaky, import_batch, metadata_cache, overlay,
+                           phases, processes, recipe_archive, report,
+                           result_cache, sharding)
+from conda_testenv.results import (CANCELLED, FAILED, PASSED, SKIPPED,
+                                   TIMED_OUT, PackageResult, error_reason,
+                                   summarise)
+from conda_testenv.scratch import ScratchPool
+from conda_testenv.zygote import Zygote
 
 
 def list_package_sources(prefix):
@@ -19,88 +35,988 @@ def list_package_sources(prefix):
     List the sources of all the packages installed in the given environment.
 
     """
-    installed = install.linked(prefix)
-    sources = []
-    for dist in conda.cli.main_list.get_packages(installed, None):
-        info = install.is_linked(prefix, dist)
-        sources.append(info['link']['source'])
-    return sources
+    return [package.source for package in conda_meta.linked_packages(prefix)
+            if package.source is not None]
 
 
 def recipe_directory(source):
     """
-    Find the recipe in the given source if it exists.
+    Find the recipe in the given source if it exists. If the source has
+    been cleaned out of the pkgs cache, the recipe is read from the
+    package's tarball instead.
 
     """
     meta_dir = os.path.join(source, 'info', 'recipe')
     if os.path.isdir(meta_dir):
         return meta_dir
     else:
-        raise IOError("The recipe for this package does not exist.")
+        return recipe_archive.recipe_from_tarball(source)
 
 
 @contextmanager
-def switch_out_meta_for_orig(recipe_dir):
+def original_recipe(recipe_dir):
     """
-    Use the original meta.yaml.orig rather than meta.yaml for the lifetime of
-    this context manager.
+    Yield a directory containing the given recipe with its original
+    meta.yaml.orig in place of meta.yaml, for the lifetime of this context
+    manager.
+
+    The recipe directory itself is never modified, as it lives in the pkgs
+    cache which may be shared by concurrent runs. Instead, recipes with a
+    meta.yaml.orig are copied to a scratch directory.
 
     """
-    meta = os.path.join(recipe_dir, 'meta.yaml')
     meta_orig = os.path.join(recipe_dir, 'meta.yaml.orig')
-    meta_tmp = os.path.join(recipe_dir, 'meta.yaml.tmp')
-
     if not os.path.exists(meta_orig):
-        yield
-    else:
-        shutil.move(meta, meta_tmp)
-        shutil.move(meta_orig, meta)
-        yield
-        shutil.move(meta, meta_orig)
-        shutil.move(meta_tmp, meta)
+        yield recipe_dir
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix='conda-testenv-recipe-')
+    try:
+        view = os.path.join(tmpdir, 'recipe')
+        shutil.copytree(recipe_dir, view)
+        os.remove(os.path.join(view, 'meta.yaml'))
+        os.rename(os.path.join(view, 'meta.yaml.orig'),
+                  os.path.join(view, 'meta.yaml'))
+        yield view
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def render_recipe(recipe_dir):
+    """
+    Return the conda_build.MetaData of the original recipe in the given
+    directory.
 
+    """
+    import conda_build.metadata
+    from conda_build.config import config
+
+    # The conda_build.MetaData of recipes with a dependency of numpy x.x
+    # requires this to be set but the value is not important
+    SET_NPY = config.CONDA_NPY is None
+    if SET_NPY:
+        config.CONDA_NPY = 00
+    try:
+        with original_recipe(recipe_dir) as view:
+            m = conda_build.metadata.MetaData(view)
+    finally:
+        if SET_NPY:
+            config.CONDA_NPY = None
+    # The test files are copied from the recipe, which only differs from the
+    # view in its meta.yaml, so refer to it rather than to the view.
+    m.path = recipe_dir
+    return m
+
+
+def package_recipes(packages, skipped=None):
+    """
+    List the (package, recipe directory) of each of the given
+    :class:`~conda_testenv.conda_meta.LinkedPackage`. Packages without a
+    recipe are left out, and if given a skipped list, a SKIPPED result is
+    appended to it for each of them.
 
-def run_pkg_tests(m, env_prefix):
+    """
+    recipes = []
+    for package in packages:
+        try:
+            if package.source is None:
+                raise IOError('The source of this package is not recorded.')
+            recipes.append((package, recipe_directory(package.source)))
+        except IOError as err:
+            if skipped is not None:
+                skipped.append(PackageResult(None, SKIPPED, 0.0,
+                                             package=package,
+                                             reason=str(err)))
+    return recipes
+
+
+def iter_package_metadata(recipes, metadata_cache=None, errors=None,
+                          profile=None):
+    """
+    Yield the conda_build.MetaData of each of the given (package, recipe
+    directory) pairs.
+
+    If given a :class:`~conda_testenv.metadata_cache.MetadataCache`, recipes
+    which have been rendered before are represented by their
+    :class:`~conda_testenv.metadata_cache.CachedMetaData` instead, and the
+    others are added to the cache.
+
+    If given an errors list, a recipe which cannot be rendered appends a
+    FAILED result to it rather than raising.
+
+    If given a :class:`~conda_testenv.phases.Profile`, the time taken to
+    get the metadata of each recipe is added to it.
+
+    """
+    for package, recipe_path in recipes:
+        with phases.timed(profile, phases.METADATA, package.dist):
+            m = None
+            if metadata_cache is not None:
+                m = metadata_cache.get(recipe_path)
+            if m is None:
+                try:
+                    m = render_recipe(recipe_path)
+                except Exception as err:
+                    if errors is None:
+                        raise
+                    errors.append(PackageResult(None, FAILED, 0.0,
+                                                package=package,
+                                                reason=error_reason(err)))
+                    continue
+                if metadata_cache is not None:
+                    metadata_cache.put(recipe_path, m)
+        yield m
+
+
+def test_environ(env_prefix, overlay_prefix=None):
+    """
+    Return a copy of the environment variables of this process, modified
+    to run the tests of packages in the given environment, with the given
+    :mod:`~conda_testenv.overlay` environment, if any, layered after it.
+
+    """
+    from conda_build.scripts import prepend_bin_path
+
+    env = prepend_bin_path(os.environ.copy(), env_prefix,
+                           prepend_prefix=True)
+    if overlay_prefix is not None:
+        env = overlay.layer_environ(env, overlay_prefix)
+    return env
+
+
+@contextmanager
+def pkg_test_dir(m, scratch=None, profile=None):
+    """
+    Create the test files of a recipe in a new temporary directory for the
+    lifetime of this context manager, yielding the directory and the
+    (kind, command) pairs which run the tests in it. The directory comes
+    from the given :class:`~conda_testenv.scratch.ScratchPool`, if any.
+
+    The time taken to create and remove the directory is added to the
+    given :class:`~conda_testenv.phases.Profile`, if any.
+
+    """
+    with phases.timed(profile, phases.TEST_FILES, m.dist()):
+        if scratch is None:
+            tmpdir = tempfile.mkdtemp()
+        else:
+            tmpdir = scratch.acquire()
+    try:
+        with phases.timed(profile, phases.TEST_FILES, m.dist()):
+            test_files = conda_build_test.create_test_files(m, tmpdir)
+            cmds = conda_build_test.test_commands(tmpdir, *test_files)
+        yield tmpdir, cmds
+    finally:
+        with phases.timed(profile, phases.CLEANUP, m.dist()):
+            if scratch is None:
+                shutil.rmtree(tmpdir)
+            else:
+                scratch.release(tmpdir)
+
+
+def log_path(log_dir, name):
+    """
+    The path of the log file with the given name in log_dir, or None if
+    there is no log_dir.
+
+    """
+    if log_dir is None:
+        return None
+    return os.path.join(log_dir, name + '.log')
+
+
+def run_pkg_tests(m, env_prefix, zygote=None, timeout_for=None,
+                  scratch=None, log_dir=None, profile=None, cancel=None,
+                  output=None, overlay_prefix=None):
     """
     Run the tests defined in the recipe of a package in the given
-    environment.
+    environment, returning a :class:`~conda_testenv.results.PackageResult`.
+
+    Each call works in its own temporary directory, from the given
+    :class:`~conda_testenv.scratch.ScratchPool` if any, and copy of the
+    environment variables, so that packages may be tested concurrently.
+    If given, timeout_for(m) is the number of seconds after which the tests
+    are killed, or None for no limit. Given a log_dir, the output of the
+    tests is written to a file named after the package's dist in it. The
+    time taken by each phase is added to the given
+    :class:`~conda_testenv.phases.Profile`, if any.
+
+    Given a :class:`~conda_testenv.processes.Cancellation`, a failure is
+    recorded with it should the tests fail. Once it is cancelled, the tests
+    are killed, or not run at all, and the package is skipped.
+
+    Without a log_dir, the output of the tests is captured and printed in
+    one piece when they finish by the given
+    :class:`~conda_testenv.capture.OutputCapture`, if any.
+
+    The tests are run with the packages of the given overlay environment,
+    if any, as well as those of the environment under test.
 
     """
-    tmpdir = tempfile.mkdtemp()
+    start = time.time()
+    if cancel is not None and cancel.cancelled:
+        return PackageResult(m, SKIPPED, 0.0, reason=CANCELLED)
+    timeout = None if timeout_for is None else timeout_for(m)
+    log = log_path(log_dir, m.dist())
+    captured = None
+    if output is not None and log is None:
+        captured = output.buffer()
+    kinds = []
     try:
-        test_files = conda_build_test.create_test_files(m, tmpdir)
-        py_files, pl_files, shell_files = test_files
-        if not (py_files or pl_files or shell_files):
-            return
-        env = os.environ
-        env = prepend_bin_path(env, env_prefix, prepend_prefix=True)
-        conda_build_test.run_tests(m, env, tmpdir,
-                                   py_files, pl_files, shell_files)
+        try:
+            with pkg_test_dir(m, scratch, profile) as (tmpdir, cmds):
+                with phases.timed(profile, phases.TEST, m.dist()):
+                    status, kinds = conda_build_test.run_test_commands(
+                        test_environ(env_prefix, overlay_prefix), tmpdir, cmds,
+                        zygote=zygote, timeout=timeout, log=log,
+                        cancel=cancel, capture=captured)
+        except processes.Cancelled:
+            result = PackageResult(m, SKIPPED, time.time() - start,
+                                   reason=CANCELLED, kinds=kinds, log=log)
+        except Exception as err:
+            result = PackageResult(m, FAILED, time.time() - start,
+                                   reason=error_reason(err), kinds=kinds,
+                                   log=log)
+        else:
+            result = PackageResult(m, status, time.time() - start,
+                                   kinds=kinds, log=log)
+        if captured is not None:
+            output.emit(result, captured)
     finally:
-        shutil.rmtree(tmpdir)
+        if captured is not None:
+            captured.close()
+    if cancel is not None and result.gating:
+        cancel.failed()
+    return result
 
 
-def run_env_tests(env_prefix):
+def run_packages(run, metas, jobs, history):
     """
-    Run all the tests defined in the recipe of all packages in the given
-    environment.
+    Call run on each of the given recipes, with up to the given number of
+    jobs at a time, and return the results in the order of the recipes.
+
+    Concurrent jobs start with the recipes which the
+    :class:`~conda_testenv.durations.DurationHistory` expects to take the
+    longest. A single job runs lazily, one recipe after another.
+
+    """
+    if jobs == 1:
+        return (run(m) for m in metas)
+
+    # Recipes are rendered up-front in this thread, as the conda-build
+    # config is global state; only the tests themselves are run by the
+    # workers.
+    metas = list(metas)
+    pool = ThreadPool(jobs)
+    try:
+        results = pool.map(run, history.longest_first(metas), chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    by_meta = dict((id(result.m), result) for result in results)
+    return [by_meta[id(m)] for m in metas]
+
+
+def run_packages_batching_imports(runner, metas, jobs, env,
+                                  timeout_for=None, log_dir=None,
+                                  profile=None, cancel=None):
+    """
+    Test the given recipes with runner, a function which takes a list of
+    recipes and returns their results, except that those whose only tests
+    are imports are first tested in batches, in up to the given number of
+    interpreters. Any which the batches failed to report on, including
+    those of a batch killed for exceeding the timeouts of its packages,
+    are passed to runner along with the rest. The batches are registered
+    with the given :class:`~conda_testenv.processes.Cancellation`, if any,
+    and their failures recorded with it.
+
+    """
+    metas = list(metas)
+    batched = [m for m in metas if import_batch.imports_only(m)]
+    tested = import_batch.test_imports(batched, env, batches=jobs,
+                                       timeout_for=timeout_for,
+                                       log_dir=log_dir, cancel=cancel)
+    results = {}
+    for m in batched:
+        if m.dist() in tested:
+            passed, duration, log = tested[m.dist()]
+            if profile is not None:
+                profile.add(phases.TEST, m.dist(), duration)
+            status = PASSED if passed else FAILED
+            results[id(m)] = PackageResult(m, status, duration,
+                                           kinds=['py'], log=log)
+            if cancel is not None and not passed:
+                cancel.failed()
+    remaining = [m for m in metas if id(m) not in results]
+    for result in runner(remaining):
+        results[id(result.m)] = result
+    return [results[id(m)] for m in metas]
+
+
+def unique_builds(builds, keys):
+    """
+    Given (environment prefix, package, recipe directory) builds and a
+    dictionary of each to its result cache key, return the builds which
+    are not the same as one in an earlier environment, by key, and a
+    dictionary of the (prefix, package) of each of those to the builds
+    which are the same as it, and so can share its result.
+
+    """
+    first = {}
+    unique = []
+    sharers = {}
+    for build in builds:
+        tested_build = first.setdefault(keys[build], build)
+        if tested_build is build:
+            unique.append(build)
+        else:
+            sharers.setdefault(tested_build[:2], []).append(build)
+    return unique, sharers
+
+
+def env_log_dirs(log_dir, prefixes):
+    """
+    A dictionary of each of the given environment prefixes to the
+    directory for the logs of its packages. With several environments,
+    each has its own subdirectory of log_dir, named after it, as the same
+    dist may be tested in more than one of them.
+
+    """
+    if log_dir is None or len(prefixes) == 1:
+        return dict((prefix, log_dir) for prefix in prefixes)
+    dirs = {}
+    names = set()
+    for prefix in prefixes:
+        name = os.path.basename(os.path.normpath(prefix)) or 'root'
+        unique, count = name, 1
+        while unique in names:
+            count += 1
+            unique = '{}-{}'.format(name, count)
+        names.add(unique)
+        dirs[prefix] = os.path.join(log_dir, unique)
+    return dirs
+
 
+def conda_environments():
     """
-    sources = list_package_sources(env_prefix)
-    for source in sources:
+    The prefixes of conda's root environment and of every environment in
+    its envs_dirs.
+
+    """
+    try:
+        from conda.base.context import context
+        root_prefix, envs_dirs = context.root_prefix, context.envs_dirs
+    except ImportError:
+        # conda < 4.2
+        from conda.config import envs_dirs, root_dir as root_prefix
+    prefixes = [root_prefix]
+    for envs_dir in envs_dirs:
+        if not os.path.isdir(envs_dir):
+            continue
+        for name in sorted(os.listdir(envs_dir)):
+            prefix = os.path.join(envs_dir, name)
+            if (os.path.isdir(os.path.join(prefix, 'conda-meta')) and
+                    prefix not in prefixes):
+                prefixes.append(prefix)
+    return prefixes
+
+
+
+
+#: The options of :func:`run_env_tests`, as described by
+#: :class:`RunOptions`, and their defaults.
+RUN_OPTIONS = (('jobs', 1), ('use_cache', True), ('zygote', False),
+               ('preload', ()), ('batch_imports', False),
+               ('engine', 'threads'), ('timeout', None),
+               ('package_timeouts', None), ('use_metadata_cache', True),
+               ('keep_going', True), ('report_json', None),
+               ('junit_xml', None), ('log_dir', None), ('profile', False),
+               ('shard', None), ('durations_path', None),
+               ('queue_dir', None), ('lease', None), ('fail_fast', None),
+               ('retries', 0), ('quarantine_flaky', False),
+               ('capture_output', False), ('quiet', False),
+               ('test_requires', False), ('dists', None))
+
+
+class RunOptions(namedtuple('RunOptions',
+                            [name for name, _ in RUN_OPTIONS])):
+    """
+    How :func:`run_env_tests` tests the packages of environments. The
+    options are given by name, and those which are not take their defaults
+    from :data:`RUN_OPTIONS`.
+
+    Unless keep_going is False, every package is tested regardless of
+    failures. Otherwise, the run exits at the first failure, as
+    conda-build does.
+
+    With more than one job, the packages are tested concurrently by a pool
+    of that many workers, starting with those which are expected to take
+    the longest. Failures are reported in the same order as for a serial
+    run, once all of the workers have finished.
+
+    Unless use_cache is False, packages whose tests have already passed
+    against the same recipe and dependencies are not tested again.
+
+    With zygote, Python tests are forked from a single interpreter in the
+    environment which has already imported the modules given by preload.
+
+    With batch_imports, the packages whose only tests are imports are
+    tested together in a few interpreters rather than one each.
+
+    The engine is either 'threads', or 'asyncio' to drive the tests from a
+    single event loop with their output streamed line by line and tagged
+    with the package name (Python 3.5+, and not with zygote).
+
+    The tests of each package are killed, and reported as timed out, after
+    timeout seconds (no limit if None). package_timeouts may map package
+    names to their own timeouts.
+
+    Unless use_metadata_cache is False, the test metadata of each recipe
+    is cached rather than rendered again on the next run.
+
+    With log_dir, the output of each package's tests is written to its own
+    log file in that directory rather than to the terminal, in a
+    subdirectory for each environment if there are several. Otherwise, with
+    capture_output, the output of each package is captured and printed in
+    one piece once it finishes, or with quiet, only the end of the output
+    of those which fail or time out is printed. report_json and
+    junit_xml are paths to write reports of the results to, which are
+    written even if the run is cut short.
+
+    With profile, the time spent in each phase of the run is reported at
+    the end.
+
+    Given a shard, an (index, count) pair, only the packages of the
+    index-th of count shards are tested, as split by
+    :func:`conda_testenv.sharding.split`, and the JSON report is marked as
+    a partial report of that shard. The shards are balanced by the
+    durations history at durations_path, if given, which must be the same
+    for every shard, and are otherwise split by a hash of each dist. A
+    shared durations history is not updated by the shards, whose
+    durations are recorded in their JSON reports instead.
+
+    Given a queue_dir, the packages are not tested by this process but
+    published to a :class:`~conda_testenv.work_queue.JobQueue` in that
+    shared directory, for ``conda-testenv worker`` processes to test, and
+    their results collected from it. A job whose worker fails to renew its
+    lease for lease seconds is given to another worker. keep_going must
+    be True.
+
+    Given fail_fast, a number of failures, no more packages are tested
+    once that many have failed or timed out, and the tests which are
+    running are killed. Those packages are reported as skipped.
+
+    The packages which fail or time out are tested again, up to retries
+    times, after all of the others. Whether the tests of each package
+    passed is recorded in a :class:`~conda_testenv.flaky.FlakyHistory`,
+    and those which flip between passing and failing, or only pass on a
+    retry, are marked as flaky. With quarantine_flaky, the failures of
+    flaky packages are reported but do not fail the run. Retries cannot be
+    combined with queue_dir, as the workers' results are not of recipes
+    which this process could test again, but flaky packages are still
+    found from the history.
+
+    With test_requires, the test/requires of the recipes which are not in
+    an environment are installed in an :mod:`~conda_testenv.overlay`
+    environment, created once for all of its recipes from the local
+    channel and the pkgs cache, which is layered onto the environment
+    when its packages are tested. The packages which need an overlay
+    which cannot be created are reported as failed. This cannot be
+    combined with queue_dir.
+
+    Given dists, a collection of name-version-build strings, only the
+    packages among them are tested.
+
+    """
+    __slots__ = ()
+
+    def __new__(cls, **options):
+        values = dict(RUN_OPTIONS)
+        values.update(options)
+        return super(RunOptions, cls).__new__(cls, **values)
+
+    def check(self, prefixes):
+        """
+        Raise ValueError if these options cannot be used to test the
+        environments with the given prefixes.
+
+        """
+        if len(prefixes) > 1 and (self.zygote or self.batch_imports or
+                                  self.engine != 'threads' or
+                                  self.shard is not None or
+                                  self.queue_dir is not None):
+            raise ValueError('Several environments can only be tested by '
+                             'the threads engine, without zygote, '
+                             'batch_imports, shard or queue_dir.')
+        if self.engine == 'asyncio' and sys.version_info < (3, 5):
+            raise ValueError('The asyncio engine requires Python 3.5 or '
+                             'later.')
+        if self.test_requires and self.queue_dir is not None:
+            raise ValueError('test_requires cannot be combined with '
+                             'queue_dir, as the workers test in their own '
+                             'environments.')
+        if self.retries and self.queue_dir is not None:
+            raise ValueError('retries cannot be combined with queue_dir.')
+
+    def package_timeout(self, name):
+        """
+        The number of seconds the tests of the named package may take, or
+        None for no limit.
+
+        """
+        return (self.package_timeouts or {}).get(name, self.timeout)
+
+
+def label(result, build):
+    """Label the given result with the environment and package of build."""
+    result.env, result.package = build[:2]
+
+
+def select_builds(prefixes, options, history=None, profile=None):
+    """
+    Select the packages of the environments with the given prefixes to
+    test, as limited by the dists and shard of the given
+    :class:`RunOptions`, and find their recipes. A shard is balanced by
+    the given :class:`~conda_testenv.durations.DurationHistory`, if any.
+
+    Returns a dictionary of each prefix to all of the packages linked into
+    it, the (prefix, package, recipe directory) of each selected package
+    with a recipe, which is called a build, and a SKIPPED result for each
+    of those without.
+
+    """
+    linked = {}
+    builds = []
+    skipped = []
+    with phases.timed(profile, phases.DISCOVER):
+        for prefix in prefixes:
+            packages = conda_meta.linked_packages(prefix,
+                                                  threads=options.jobs)
+            linked[prefix] = packages
+            if options.dists is not None:
+                packages = [package for package in packages
+                            if package.dist in options.dists]
+            if options.shard is not None:
+                index, count = options.shard
+                packages = sharding.shard(packages, index, count, history)
+                print('Testing {} of the {} packages as shard {}/{}.'.format(
+                    len(packages), len(linked[prefix]), index, count))
+            env_skipped = []
+            for package, recipe_path in package_recipes(packages,
+                                                        env_skipped):
+                builds.append((prefix, package, recipe_path))
+            for result in env_skipped:
+                result.env = prefix
+            skipped.extend(env_skipped)
+    return linked, builds, skipped
+
+
+def build_keys(builds, linked):
+    """
+    The :func:`~conda_testenv.result_cache.cache_key` of each of the given
+    builds, from a dictionary of each environment prefix to the packages
+    linked into it.
+
+    """
+    indexes = dict((prefix, conda_meta.PackageIndex(packages))
+                   for prefix, packages in linked.items())
+    keys = {}
+    for build in builds:
+        prefix, package, recipe_path = build
+        keys[build] = result_cache.cache_key(package.dist, recipe_path,
+                                             indexes[prefix])
+    return keys
+
+
+def plan_builds(builds, keys=None, cache=None):
+    """
+    Plan which of the given builds to test. Given the cache key of each
+    build, a build which is the same as an earlier one in another
+    environment shares its result rather than being tested, and given a
+    :class:`~conda_testenv.result_cache.ResultCache` too, those whose tests
+    have already passed are skipped.
+
+    Returns the builds to test, a SKIPPED result for each of those whose
+    tests have already passed, and the builds which share the results of
+    others, as returned by :func:`unique_builds`.
+
+    """
+    sharers = {}
+    if keys is not None:
+        unique, sharers = unique_builds(builds, keys)
+        if len(unique) < len(builds):
+            print('Testing {} builds once on behalf of {} environments, '
+                  'rather than {}.'.format(
+                      len(unique), len(set(build[0] for build in builds)),
+                      len(builds)))
+        builds = unique
+    skipped = []
+    if cache is not None:
+        uncached = []
+        for build in builds:
+            if cache.passed(keys[build]):
+                result = PackageResult(None, SKIPPED, 0.0,
+                                       reason='The tests have already '
+                                              'passed.')
+                label(result, build)
+                skipped.append(result)
+            else:
+                uncached.append(build)
+        builds = uncached
+    return builds, skipped, sharers
+
+
+class Recorder(object):
+    """
+    Records the outcome of each package tested: its duration in the given
+    :class:`~conda_testenv.durations.DurationHistory`, whether it passed
+    in the given :class:`~conda_testenv.flaky.FlakyHistory`, and if it
+    passed, its cache key in the given
+    :class:`~conda_testenv.result_cache.ResultCache`, if any.
+
+    """
+    def __init__(self, history, outcomes, cache=None, keys=None):
+        self.history = history
+        self.outcomes = outcomes
+        self.cache = cache
+        self.keys = keys
+
+    def record(self, result, build):
+        """Record the given result of the tests of build."""
+        label(result, build)
+        if result.reason is None:
+            self.history.record(result.dist, result.name, result.duration)
+            self.outcomes.record(result.dist, result.passed)
+        if result.passed and self.cache is not None:
+            self.cache.record(self.keys[build])
+
+    def save(self):
+        self.history.save()
+        self.outcomes.save()
+        if self.cache is not None:
+            self.cache.save()
+
+
+def create_overlays(env_metas, linked):
+    """
+    Create the :mod:`~conda_testenv.overlay` of each environment for the
+    test requirements of its recipes, given a list of the (prefix, recipes)
+    of each environment and a dictionary of each prefix to the packages
+    linked into it.
+
+    Returns a dictionary of each prefix to the prefix of its overlay, and
+    a FAILED result for each recipe which needs an overlay which could not
+    be created.
+
+    """
+    overlays = {}
+    unmet = []
+    for prefix, metas in env_metas:
+        specs = overlay.test_requirements(metas, linked[prefix])
+        if not specs:
+            continue
         try:
-            recipe_path = recipe_directory(source)
-            with switch_out_meta_for_orig(recipe_path):
-                # The conda_build.MetaData of recipes with a dependency of
-                # numpy x.x requires this to be set but the value is not
-                # important
-                SET_NPY = config.CONDA_NPY is None
-                if SET_NPY:
-                    config.CONDA_NPY = 00
-                m = conda_build.metadata.MetaData(recipe_path)
-                run_pkg_tests(m, env_prefix)
-                if SET_NPY:
-                    config.CONDA_NPY = None
-        except IOError:
-            pass
-    print('All tests are finished.')
+            overlays[prefix] = overlay.create_overlay(specs, linked[prefix])
+        except overlay.OverlayError as err:
+            print('Unable to create the overlay: {}'.format(err))
+            for m in metas:
+                if overlay.test_requirements([m], linked[prefix]):
+                    unmet.append(PackageResult(
+                        m, FAILED, 0.0,
+                        reason='The overlay of its test requirements '
+                               'could not be created: {}'.format(err)))
+    return overlays, unmet
+
+
+def retry_failures(tested, runner, retries, record, cancel=None):
+    """
+    Test the recipes of the results in the tested list which fail or time
+    out again with runner, up to retries times while any do, replacing
+    their results in the list. Each new result is passed to record. No
+    more are retried once the given
+    :class:`~conda_testenv.processes.Cancellation`, if any, is cancelled.
+
+    """
+    for attempt in range(2, retries + 2):
+        failing = [result for result in tested
+                   if result.gating and result.m is not None and
+                   result.reason is None]
+        if not failing or (cancel is not None and cancel.cancelled):
+            break
+        print('Retrying the tests of {} packages, attempt {} of '
+              '{}.'.format(len(failing), attempt, retries + 1))
+        retried = {}
+        for result in runner([result.m for result in failing]):
+            result.attempts = attempt
+            record(result)
+            retried[id(result.m)] = result
+        tested[:] = [retried.get(id(result.m), result) for result in tested]
+
+
+def execute_builds(builds, prefixes, linked, options, recorder, tested,
+                   skipped, errors=None, cancel=None, profile=None):
+    """
+    Test the given builds of the environments with the given prefixes, as
+    described by the given :class:`RunOptions`, recording each result with
+    the given :class:`Recorder`. linked is a dictionary of each prefix to
+    the packages linked into it.
+
+    The results are appended as they come to the tested list, or the
+    skipped list for builds which are cancelled before their recipes are
+    rendered, or the errors list, if given, for those whose recipes cannot
+    be rendered, so that they may be reported even if the run is cut
+    short. The tests are registered with the given
+    :class:`~conda_testenv.processes.Cancellation`, if any, and the time
+    taken by each phase added to the given
+    :class:`~conda_testenv.phases.Profile`, if any.
+
+    """
+    import conda_build
+    import conda_build.build
+    from conda_build.config import config
+
+    builds_by_package = dict((build[:2], build) for build in builds)
+
+    def timeout_for(m):
+        return options.package_timeout(m.name())
+
+    rendered = None
+    if options.use_metadata_cache:
+        rendered = metadata_cache.MetadataCache(conda_build.__version__,
+                                                config.CONDA_NPY)
+    meta_builds = {}
+
+    def iter_metas():
+        for build in builds:
+            if cancel is not None and cancel.cancelled:
+                # Skip the rest without rendering their recipes.
+                result = PackageResult(None, SKIPPED, 0.0, reason=CANCELLED)
+                label(result, build)
+                skipped.append(result)
+                continue
+            failed = len(errors) if errors is not None else 0
+            for m in iter_package_metadata([build[1:]], rendered, errors,
+                                           profile):
+                meta_builds[id(m)] = build
+                yield m
+            for result in (errors or [])[failed:]:
+                label(result, build)
+
+    metas = iter_metas()
+    overlays = {}
+    # The results of the recipes whose test requirements are missing, as
+    # their overlay could not be created.
+    unmet = []
+    if options.test_requires:
+        # Every recipe is needed to know the requirements of the overlays.
+        metas = list(metas)
+        overlays, unmet = create_overlays(
+            [(prefix, [m for m in metas if meta_builds[id(m)][0] == prefix])
+             for prefix in prefixes], linked)
+        unmet_ids = set(id(result.m) for result in unmet)
+        metas = [m for m in metas if id(m) not in unmet_ids]
+    log_dirs = env_log_dirs(options.log_dir, prefixes)
+    for directory in set(log_dirs.values()) - set([None]):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    scratch = ScratchPool()
+    output = None
+    if options.capture_output or options.quiet:
+        output = capture.OutputCapture(quiet=options.quiet)
+    run_in_env = functools.partial(run_pkg_tests, timeout_for=timeout_for,
+                                   scratch=scratch, profile=profile,
+                                   cancel=cancel, output=output)
+    # The environment of the tests of the zygote, the asyncio engine and
+    # the import batches, which only test a single environment.
+    environ = test_environ(prefixes[0], overlays.get(prefixes[0]))
+    warm_interpreter = None
+    if options.zygote:
+        warm_interpreter = Zygote(environ, options.preload)
+        run_in_env = functools.partial(run_in_env, zygote=warm_interpreter)
+
+    def run(m):
+        prefix = meta_builds[id(m)][0]
+        return run_in_env(m, prefix, overlay_prefix=overlays.get(prefix),
+                          log_dir=log_dirs[prefix])
+
+    if options.engine == 'asyncio':
+        from conda_testenv import async_engine
+        runner = functools.partial(async_engine.run_packages,
+                                   env=environ, jobs=options.jobs,
+                                   history=recorder.history,
+                                   timeout_for=timeout_for,
+                                   scratch=scratch, log_dir=options.log_dir,
+                                   profile=profile, cancel=cancel,
+                                   output=output)
+    else:
+        runner = functools.partial(run_packages, run, jobs=options.jobs,
+                                   history=recorder.history)
+
+    def record(result):
+        if result.m is not None:
+            build = meta_builds[id(result.m)]
+        else:
+            # The results of workers are of packages, not recipes.
+            build = builds_by_package[(prefixes[0], result.package)]
+        recorder.record(result, build)
+        if result.status == TIMED_OUT:
+            print('TESTS TIMED OUT after {}s: {}'.format(
+                options.package_timeout(result.name), result.dist))
+        if result.gating and not options.keep_going:
+            conda_build.build.tests_failed(result.m)
+
+    try:
+        for result in unmet:
+            tested.append(result)
+            record(result)
+            if cancel is not None:
+                cancel.failed()
+        if options.queue_dir is not None:
+            from conda_testenv import work_queue
+            queue = work_queue.JobQueue(
+                options.queue_dir, lease=options.lease or work_queue.LEASE)
+            results = work_queue.coordinate(
+                queue, [build[1:] for build in builds],
+                lambda package: options.package_timeout(package.name))
+        elif options.batch_imports:
+            results = run_packages_batching_imports(
+                runner, metas, options.jobs, environ,
+                timeout_for=timeout_for, log_dir=options.log_dir,
+                profile=profile, cancel=cancel)
+        else:
+            results = runner(metas)
+        for result in results:
+            tested.append(result)
+            record(result)
+        retry_failures(tested, runner, options.retries, record, cancel)
+    finally:
+        if rendered is not None:
+            rendered.save()
+        scratch.close()
+        if warm_interpreter is not None:
+            warm_interpreter.close()
+
+
+def mark_flaky(results, outcomes, quarantine=False):
+    """
+    Mark the given results as flaky if the given
+    :class:`~conda_testenv.flaky.FlakyHistory` has seen them flip between
+    passing and failing, or they only passed on a retry. With quarantine,
+    the failures of flaky packages are marked as quarantined.
+
+    """
+    for result in results:
+        result.flaky = (outcomes.is_flaky(result.dist) or
+                        (result.passed and result.attempts > 1))
+        result.quarantined = (quarantine and result.flaky and
+                              result.status in (FAILED, TIMED_OUT))
+
+
+def share_results(results, sharers):
+    """
+    Return the given results, along with a copy of each of them for each
+    of the builds which share it, as returned by :func:`unique_builds`,
+    sorted by dist and environment.
+
+    """
+    results = list(results)
+    for result in list(results):
+        for build in sharers.get((result.env, result.package), []):
+            shared = copy.copy(result)
+            shared.tested_in = result.env
+            label(shared, build)
+            results.append(shared)
+    results.sort(key=lambda result: (result.dist.lower(), result.env or ''))
+    return results
+
+
+def write_reports(results, options, linked):
+    """
+    Write the reports of the given results asked for by the given
+    :class:`RunOptions`. linked is a dictionary of each environment prefix
+    to the packages linked into it, of which a shard records those of its
+    environment.
+
+    """
+    if options.report_json is not None:
+        sharded = None
+        if options.shard is not None and len(linked) == 1:
+            packages, = linked.values()
+            sharded = [package.dist for package in packages]
+        report.write_json(results, options.report_json, shard=options.shard,
+                          sharded=sharded)
+    if options.junit_xml is not None:
+        report.write_junit(results, options.junit_xml)
+
+
+def run_env_tests(env_prefix, options=None, **kwargs):
+    """
+    Run all the tests defined in the recipe of all packages in the given
+    environment, print a summary, and return a
+    :class:`~conda_testenv.results.PackageResult` for every package.
+
+    The run is described by the given :class:`RunOptions`, or by options
+    given by name, which replace those of any :class:`RunOptions`.
+
+    env_prefix may also be a list of the prefixes of several environments,
+    whose packages are tested by the same pool of workers. A build whose
+    recipe and dependencies are the same in several of them is only
+    tested in the first, and its result shared with the others. Several
+    environments cannot be combined with zygote, batch_imports, the
+    asyncio engine, shard or queue_dir.
+
+    The run is made of :func:`select_builds`, :func:`plan_builds`,
+    :func:`execute_builds`, which records its results with a
+    :class:`Recorder`, and :func:`write_reports`.
+
+    """
+    if options is None:
+        options = RunOptions(**kwargs)
+    elif kwargs:
+        options = options._replace(**kwargs)
+    prefixes = env_prefix
+    if not isinstance(prefixes, (list, tuple)):
+        prefixes = [prefixes]
+    options.check(prefixes)
+    # Created first, so that its wall time includes importing conda-build.
+    profile = phases.Profile() if options.profile else None
+
+    # The shards share a durations history, and each writes its durations
+    # to its report instead, for "conda-testenv merge" to record.
+    shared_history = options.durations_path is not None
+    history = durations.DurationHistory(
+        options.durations_path,
+        read_only=options.shard is not None and shared_history)
+    # Only a durations history given explicitly is shared by every shard;
+    # their own default histories would differ.
+    linked, builds, skipped = select_builds(
+        prefixes, options, history if shared_history else None, profile)
+    keys = None
+    if options.use_cache or len(prefixes) > 1:
+        keys = build_keys(builds, linked)
+    cache = result_cache.ResultCache() if options.use_cache else None
+    builds, cached, sharers = plan_builds(builds, keys, cache)
+    skipped.extend(cached)
+
+    recorder = Recorder(history, flaky.FlakyHistory(), cache, keys)
+    errors = [] if options.keep_going else None
+    cancel = None
+    if options.fail_fast is not None:
+        cancel = processes.Cancellation(limit=options.fail_fast)
+    tested = []
+    try:
+        execute_builds(builds, prefixes, linked, options, recorder, tested,
+                       skipped, errors, cancel=cancel, profile=profile)
+        mark_flaky(tested, recorder.outcomes, options.quarantine_flaky)
+    finally:
+        recorder.save()
+        results = share_results(skipped + (errors or []) + tested, sharers)
+        write_reports(results, options, linked)
+    if cancel is not None and cancel.cancelled:
+        print('Stopped after {} failures.'.format(cancel.failures))
+    else:
+        print('All tests are finished.')
+    summarise(results)
+    if profile is not None:
+        profile.report()
+    return results
@@ -14,6 +14,9 @@ class Test_cli(unittest.TestCase):
 
         condarc = os.path.join(self.tmpdir, 'condarc')
         self.environ['CONDARC'] = condarc
+        # Keep the durations and results of previous runs out of the way.
+        self.environ['CONDA_TESTENV_STATE_DIR'] = os.path.join(self.tmpdir,
+                                                               'state')
         with open(condarc, 'w') as fh:
             fh.write('add_pip_as_python_dependency: false\n')
             fh.write('conda-build:\n')
@@ -0,0 +1,36 @@
+"""
+Stand-ins shared by the unit tests.
+
+"""
+
+
+class FakeMetaData(object):
+    """
+    A stand-in for the conda_build.metadata.MetaData of the named recipe
+    in the directory at path, whose test section has the given fields.
+
+    """
+    def __init__(self, name, path, version='1.0', build_id='0', **test):
+        self._name = name
+        self._version = version
+        self._build_id = build_id
+        self.path = path
+        self.test = test
+
+    def name(self):
+        return self._name
+
+    def version(self):
+        return self._version
+
+    def build_id(self):
+        return self._build_id
+
+    def dist(self):
+        return '{}-{}-{}'.format(self._name, self._version, self._build_id)
+
+    def get_value(self, field, default=None):
+        section, key = field.split('/')
+        if section != 'test':
+            return default
+        return self.test.get(key, default)
@@ -0,0 +1,71 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from conda_testenv import processes
+
+if sys.version_info >= (3, 5):
+    from conda_testenv import async_engine
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'Requires Python 3.5.')
+@unittest.skipIf(sys.platform == 'win32', 'Uses POSIX shell commands.')
+class Test_run_command(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.loop = async_engine.new_event_loop()
+        self.addCleanup(async_engine.close_event_loop, self.loop)
+
+    def run_command(self, script, **kwargs):
+        return self.loop.run_until_complete(async_engine.run_command(
+            'pkg', ['/bin/sh', '-c', script], dict(os.environ),
+            self.tmpdir, **kwargs))
+
+    def test_returncode(self):
+        self.assertEqual(self.run_command('exit 3'), 3)
+        self.assertEqual(self.run_command('exit 0', timeout=10), 0)
+
+    def test_tagged_output(self):
+        stdout = sys.stdout
+        sys.stdout = out = io.StringIO()
+        try:
+            self.run_command('echo hello; echo world')
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(out.getvalue(), '[pkg] hello\n[pkg] world\n')
+
+    def test_log_file(self):
+        out = io.StringIO()
+        self.run_command('echo out; echo err >&2', log_file=out)
+        self.assertEqual(sorted(out.getvalue().split()), ['err', 'out'])
+
+    def test_timeout_kills_tree(self):
+        marker = os.path.join(self.tmpdir, 'marker')
+        # The grandchild would create the marker, had it not been killed.
+        script = '(sleep 1; touch {}) & sleep 30'.format(marker)
+        start = time.time()
+        self.assertIsNone(self.run_command(script, timeout=0.5))
+        self.assertLess(time.time() - start, 10)
+        time.sleep(1.5)
+        self.assertFalse(os.path.exists(marker))
+
+    def test_background_process_holds_pipes(self):
+        self.addCleanup(setattr, processes, 'DRAIN_TIMEOUT',
+                        processes.DRAIN_TIMEOUT)
+        processes.DRAIN_TIMEOUT = 0.5
+        out = io.StringIO()
+        start = time.time()
+        # The subshell keeps the pipes open for after the command exits.
+        self.assertEqual(self.run_command('(sleep 5) & echo hello',
+                                          log_file=out), 0)
+        self.assertLess(time.time() - start, 3)
+        self.assertEqual(out.getvalue(), 'hello\n')
+        start = time.time()
+        self.assertEqual(self.run_command('(sleep 5) & exit 2', timeout=30),
+                         2)
+        self.assertLess(time.time() - start, 3)
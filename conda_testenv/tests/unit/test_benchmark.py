@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from conda_testenv import benchmark, conda_meta
+from conda_testenv.test_env import package_recipes
+
+
+class Test_make_environment(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_discoverable(self):
+        prefix, metas = benchmark.make_environment(self.tmpdir, 8)
+        packages = conda_meta.linked_packages(prefix)
+        recipes = package_recipes(packages)
+        self.assertEqual(len(recipes), 8)
+        self.assertEqual([package.dist for package in packages],
+                         [m.dist() for m in metas])
+        self.assertEqual(packages[3].depends, ('pkg00001', 'pkg00002'))
+
+    def test_kinds(self):
+        prefix, metas = benchmark.make_environment(self.tmpdir, 4)
+        imports, python, shell, none = metas
+        self.assertEqual(imports.get_value('test/imports'),
+                         ['pkg00000', 'pkg00000.sub'])
+        self.assertTrue(os.path.exists(os.path.join(python.path,
+                                                    'run_test.py')))
+        self.assertEqual(shell.get_value('test/commands'),
+                         ['pkg00002 --help'])
+        self.assertTrue(os.path.exists(os.path.join(shell.path,
+                                                    'run_test.sh')))
+        self.assertEqual(none.get_value('test/imports', []), [])
+
+
+class Test_scaling_exponent(unittest.TestCase):
+    def test_linear(self):
+        self.assertAlmostEqual(
+            benchmark.scaling_exponent([10, 100, 1000], [1.0, 10.0, 100.0]),
+            1.0)
+
+    def test_unknown(self):
+        self.assertIsNone(benchmark.scaling_exponent([10, 100],
+                                                     [None, None]))
+
+
+class Test_run_benchmark(unittest.TestCase):
+    def test_report(self):
+        timings = benchmark.run_benchmark([2, 6])
+        self.assertEqual(sorted(timings), [2, 6])
+        out = StringIO()
+        benchmark.report(timings, out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ['stage', 'N=2', 'N=6',
+                                            'scaling'])
+        self.assertEqual([line.split()[0] for line in lines[1:]],
+                         ['discover', 'render', 'metadata', 'test',
+                          'result', 'schedule'])
+
+
+if __name__ == '__main__':
+    unittest.main()
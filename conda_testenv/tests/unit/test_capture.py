@@ -0,0 +1,83 @@
+import sys
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from conda_testenv import processes
+from conda_testenv.capture import Capture, OutputCapture
+from conda_testenv.conda_meta import LinkedPackage
+from conda_testenv.results import FAILED, PASSED, PackageResult
+
+
+def result(status):
+    package = LinkedPackage(dist='a-1.0-0', name='a', version='1.0',
+                            build='0', source=None, depends=())
+    return PackageResult(None, status, 1.0, package=package)
+
+
+def capture(text, threshold=1024):
+    captured = Capture(threshold)
+    captured.write(text)
+    return captured
+
+
+class Test_Capture(unittest.TestCase):
+    def test_in_memory(self):
+        captured = capture('hello\n')
+        self.addCleanup(captured.close)
+        self.assertFalse(captured.spilled)
+        self.assertEqual(b''.join(captured.chunks()), b'hello\n')
+
+    def test_spills(self):
+        captured = capture('x' * 100, threshold=10)
+        self.addCleanup(captured.close)
+        captured.write(b'y')
+        self.assertTrue(captured.spilled)
+        self.assertEqual(b''.join(captured.chunks()), b'x' * 100 + b'y')
+
+    def test_tail(self):
+        captured = capture(''.join('line {}\n'.format(n) for n in range(10)))
+        self.addCleanup(captured.close)
+        self.assertEqual(captured.tail(2), 'line 8\nline 9')
+
+
+class Test_OutputCapture(unittest.TestCase):
+    def emit(self, status, text, quiet=False):
+        out = StringIO()
+        output = OutputCapture(quiet=quiet, tail_lines=1, out=out)
+        captured = capture(text)
+        self.addCleanup(captured.close)
+        output.emit(result(status), captured)
+        return out.getvalue()
+
+    def test_whole(self):
+        self.assertEqual(self.emit(PASSED, 'one\ntwo\n'),
+                         '===== a-1.0-0: passed =====\none\ntwo\n')
+
+    def test_silent_pass(self):
+        self.assertEqual(self.emit(PASSED, ''), '')
+
+    def test_quiet_pass(self):
+        self.assertEqual(self.emit(PASSED, 'one\ntwo\n', quiet=True), '')
+
+    def test_quiet_failure(self):
+        out = self.emit(FAILED, 'one\ntwo\n', quiet=True)
+        self.assertTrue(out.startswith('===== a-1.0-0: failed'))
+        self.assertNotIn('one', out)
+        self.assertTrue(out.endswith('\ntwo\n'))
+
+
+@unittest.skipIf(sys.platform == 'win32', 'Uses POSIX shell commands.')
+class Test_call_capture(unittest.TestCase):
+    def test_piped(self):
+        captured = Capture()
+        self.addCleanup(captured.close)
+        script = 'echo out; echo err >&2'
+        returncode = processes.call(['/bin/sh', '-c', script],
+                                    stdout=captured)
+        self.assertEqual(returncode, 0)
+        self.assertEqual(sorted(b''.join(captured.chunks()).split()),
+                         [b'err', b'out'])
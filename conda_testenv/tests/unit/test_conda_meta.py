@@ -0,0 +1,56 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from conda_testenv.conda_meta import LinkedPackage, linked_packages
+
+
+class Test_linked_packages(unittest.TestCase):
+    def setUp(self):
+        self.prefix = tempfile.mkdtemp()
+        self.meta = os.path.join(self.prefix, 'conda-meta')
+        os.mkdir(self.meta)
+
+    def tearDown(self):
+        shutil.rmtree(self.prefix)
+
+    def link(self, dist, **record):
+        with open(os.path.join(self.meta, dist + '.json'), 'w') as fh:
+            json.dump(record, fh)
+
+    def test_fields(self):
+        self.link('numpy-1.10.4-py27_0', name='numpy', version='1.10.4',
+                  build='py27_0', depends=['python 2.7*'],
+                  files=['lib/numpy/__init__.py'],
+                  link={'source': '/pkgs/numpy-1.10.4-py27_0'})
+        expected = LinkedPackage(dist='numpy-1.10.4-py27_0', name='numpy',
+                                 version='1.10.4', build='py27_0',
+                                 source='/pkgs/numpy-1.10.4-py27_0',
+                                 depends=('python 2.7*',))
+        self.assertEqual(linked_packages(self.prefix), [expected])
+
+    def test_minimal_record(self):
+        self.link('a-1.0-0')
+        package, = linked_packages(self.prefix)
+        self.assertEqual((package.name, package.version, package.build),
+                         ('a', '1.0', '0'))
+        self.assertIsNone(package.source)
+        self.assertEqual(package.depends, ())
+
+    def test_order(self):
+        for dist in ['b-1.0-0', 'A-1.0-0', 'c-1.0-0']:
+            self.link(dist)
+        for threads in [None, 4]:
+            dists = [package.dist
+                     for package in linked_packages(self.prefix, threads)]
+            self.assertEqual(dists, ['A-1.0-0', 'b-1.0-0', 'c-1.0-0'])
+
+    def test_no_environment(self):
+        self.assertEqual(linked_packages(os.path.join(self.prefix, 'no')),
+                         [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from conda_testenv.conda_meta import LinkedPackage
+from conda_testenv.durations import DurationHistory, estimate_duration
+from conda_testenv.report import read_json, write_json
+from conda_testenv.results import FAILED, PASSED, SKIPPED, PackageResult
+from conda_testenv.tests.unit.fakes import FakeMetaData
+
+
+def result(name, status, reason=None):
+    package = LinkedPackage(dist='{}-1.0-0'.format(name), name=name,
+                            version='1.0', build='0', source=None,
+                            depends=())
+    return PackageResult(None, status, 1.5, package=package, reason=reason)
+
+
+class Test_DurationHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'durations.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        history = DurationHistory(self.path)
+        history.record('a-1.0-0', 'a', 10.0)
+        history.save()
+        history = DurationHistory(self.path)
+        self.assertEqual(history.get('a-1.0-0'), 10.0)
+        self.assertEqual(history.get('a-2.0-0', 'a'), 10.0)
+        self.assertIsNone(history.get('a-2.0-0'))
+
+    def test_smoothing(self):
+        history = DurationHistory(self.path)
+        history.record('a-1.0-0', 'a', 10.0)
+        history.record('a-1.0-0', 'a', 20.0)
+        self.assertEqual(history.get('a-1.0-0'), 15.0)
+
+    def test_read_only(self):
+        history = DurationHistory(self.path, read_only=True)
+        history.record('a-1.0-0', 'a', 10.0)
+        history.save()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_record_results(self):
+        results = [result('a', PASSED), result('b', FAILED),
+                   result('c', SKIPPED, reason='No recipe.'),
+                   result('d', PASSED)]
+        results[3].tested_in = '/envs/other'
+        path = os.path.join(self.tmpdir, 'report.json')
+        write_json(results, path, shard=(1, 1))
+        history = DurationHistory(self.path)
+        history.record_results(read_json(path)[0])
+        self.assertEqual(history.get('a-1.0-0'), 1.5)
+        self.assertEqual(history.get('b-1.0-0'), 1.5)
+        self.assertIsNone(history.get('c-1.0-0'))
+        self.assertIsNone(history.get('d-1.0-0'))
+
+    def test_longest_first(self):
+        history = DurationHistory(self.path)
+        history.record('slow-1.0-0', 'slow', 100.0)
+        fast = FakeMetaData('fast', self.tmpdir, imports=['fast'])
+        slow = FakeMetaData('slow', self.tmpdir)
+        untested = FakeMetaData('untested', self.tmpdir)
+        many = FakeMetaData('many', self.tmpdir, imports=['a', 'b', 'c'])
+        order = history.longest_first([fast, untested, slow, many])
+        self.assertEqual(order, [slow, many, fast, untested])
+
+
+class Test_estimate_duration(unittest.TestCase):
+    def test_scripts(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmpdir, 'run_test.sh'), 'w'):
+                pass
+            with_script = FakeMetaData('a', tmpdir)
+            self.assertGreater(estimate_duration(with_script), 0)
+            without = FakeMetaData('b', os.path.join(tmpdir, 'missing'))
+            self.assertEqual(estimate_duration(without), 0)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from conda_testenv.flaky import FlakyHistory
+
+
+class Test_FlakyHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'flaky.json')
+
+    def history(self, outcomes):
+        history = FlakyHistory(self.path)
+        for passed in outcomes:
+            history.record('a-1.0-0', passed)
+        return history
+
+    def test_consistent(self):
+        history = self.history([False, False, False])
+        self.assertEqual(history.flips('a-1.0-0'), 0)
+        self.assertFalse(history.is_flaky('a-1.0-0'))
+
+    def test_fixed(self):
+        self.assertFalse(self.history([False, True, True]).is_flaky('a-1.0-0'))
+
+    def test_flipping(self):
+        history = self.history([True, False, True])
+        self.assertEqual(history.flips('a-1.0-0'), 2)
+        self.assertTrue(history.is_flaky('a-1.0-0'))
+
+    def test_unknown(self):
+        self.assertFalse(FlakyHistory(self.path).is_flaky('b-1.0-0'))
+
+    def test_window(self):
+        history = self.history([True, False, True] + [True] * 20)
+        self.assertFalse(history.is_flaky('a-1.0-0'))
+
+    def test_save(self):
+        self.history([True, False, True]).save()
+        self.assertTrue(FlakyHistory(self.path).is_flaky('a-1.0-0'))
+
+    def test_expiry(self):
+        history = self.history([True, False, True])
+        history.max_age = -1
+        history.save()
+        self.assertEqual(FlakyHistory(self.path).flips('a-1.0-0'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from conda_testenv import import_batch, processes
+from conda_testenv.tests.unit.fakes import FakeMetaData
+
+
+class Test_imports_only(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_imports(self):
+        m = FakeMetaData('a', self.tmpdir, imports=['a'])
+        self.assertTrue(import_batch.imports_only(m))
+
+    def test_no_imports(self):
+        m = FakeMetaData('a', self.tmpdir)
+        self.assertFalse(import_batch.imports_only(m))
+
+    def test_commands(self):
+        m = FakeMetaData('a', self.tmpdir, imports=['a'], commands=['a'])
+        self.assertFalse(import_batch.imports_only(m))
+
+    def test_script(self):
+        open(os.path.join(self.tmpdir, 'run_test.py'), 'w').close()
+        m = FakeMetaData('a', self.tmpdir, imports=['a'])
+        self.assertFalse(import_batch.imports_only(m))
+
+
+class Test_test_imports(unittest.TestCase):
+    def test_attribution(self):
+        metas = [FakeMetaData('good', '', imports=['json', 'os.path']),
+                 FakeMetaData('bad', '', imports=['json', 'not_a_module']),
+                 FakeMetaData('other', '', imports=['shutil'])]
+        tested = import_batch.test_imports(metas, os.environ.copy(),
+                                           batches=2, python=sys.executable)
+        self.assertEqual(sorted(tested), ['bad-1.0-0', 'good-1.0-0',
+                                          'other-1.0-0'])
+        self.assertTrue(tested['good-1.0-0'][0])
+        self.assertFalse(tested['bad-1.0-0'][0])
+        self.assertTrue(tested['other-1.0-0'][0])
+        self.assertIsNone(tested['good-1.0-0'][2])
+
+    def test_no_metas(self):
+        log_dir = tempfile.mkdtemp()
+        try:
+            tested = import_batch.test_imports([], os.environ.copy(),
+                                               batches=2,
+                                               python=sys.executable,
+                                               log_dir=log_dir)
+            self.assertEqual(tested, {})
+            # No interpreter was started for an empty batch.
+            self.assertEqual(os.listdir(log_dir), [])
+        finally:
+            shutil.rmtree(log_dir)
+
+    def test_cancelled(self):
+        cancel = processes.Cancellation()
+        cancel.cancel()
+        metas = [FakeMetaData('good', '', imports=['json'])]
+        tested = import_batch.test_imports(metas, os.environ.copy(),
+                                           python=sys.executable,
+                                           cancel=cancel)
+        self.assertEqual(tested, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from conda_testenv import conda_build_test, test_env
+from conda_testenv.metadata_cache import MetadataCache
+from conda_testenv.tests.unit.fakes import FakeMetaData
+
+try:
+    import conda_build
+except ImportError:
+    conda_build = None
+
+
+class Test_MetadataCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'metadata.json')
+        self.recipe = os.path.join(self.tmpdir, 'recipe')
+        os.mkdir(self.recipe)
+        self.write_meta('package: {name: a}\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_meta(self, content):
+        with open(os.path.join(self.recipe, 'meta.yaml'), 'w') as fh:
+            fh.write(content)
+
+    def fake(self, **test):
+        test.setdefault('imports', ['a', 'a.b'])
+        return FakeMetaData('a', self.recipe, build_id='np110_0', **test)
+
+    def test_round_trip(self):
+        cache = MetadataCache('1.21', 110, path=self.path)
+        self.assertIsNone(cache.get(self.recipe))
+        cache.put(self.recipe, self.fake())
+        cache.save()
+        m = MetadataCache('1.21', 110, path=self.path).get(self.recipe)
+        self.assertEqual(m.dist(), 'a-1.0-np110_0')
+        self.assertEqual(m.name(), 'a')
+        self.assertEqual(m.path, self.recipe)
+        self.assertEqual(m.get_value('test/imports'), ['a', 'a.b'])
+        self.assertEqual(m.get_value('test/commands', []), [])
+
+    def test_invalidation(self):
+        cache = MetadataCache('1.21', 110, path=self.path)
+        cache.put(self.recipe, self.fake())
+        cache.save()
+        self.assertIsNotNone(MetadataCache('1.21', 110, path=self.path)
+                             .get(self.recipe))
+        self.assertIsNone(MetadataCache('1.22', 110, path=self.path)
+                          .get(self.recipe))
+        self.assertIsNone(MetadataCache('1.21', 111, path=self.path)
+                          .get(self.recipe))
+        self.write_meta('package: {name: b}\n')
+        self.assertIsNone(cache.get(self.recipe))
+
+    def test_get_section(self):
+        cache = MetadataCache('1.21', 110, path=self.path)
+        cache.put(self.recipe, self.fake(files=['a.txt']))
+        m = cache.get(self.recipe)
+        self.assertEqual(m.get_section('test'),
+                         {'files': ['a.txt'], 'imports': ['a', 'a.b']})
+        self.assertEqual(m.get_section('source'), {})
+
+    def test_source_files_not_cached(self):
+        cache = MetadataCache('1.21', 110, path=self.path)
+        cache.put(self.recipe, self.fake(source_files=['tests']))
+        self.assertIsNone(cache.get(self.recipe))
+
+    @unittest.skipIf(conda_build is None, 'Requires conda-build.')
+    def test_create_files(self):
+        self.write_meta('package: {name: a, version: "1.0"}\n'
+                        'test:\n'
+                        '  files: [data.txt]\n'
+                        '  imports: [os]\n'
+                        '  commands: [echo hello]\n')
+        with open(os.path.join(self.recipe, 'data.txt'), 'w') as fh:
+            fh.write('data\n')
+        m = test_env.render_recipe(self.recipe)
+        cache = MetadataCache(conda_build.__version__, 110, path=self.path)
+        cache.put(self.recipe, m)
+        cached = cache.get(self.recipe)
+        created = []
+        for meta in (m, cached):
+            tmpdir = os.path.join(self.tmpdir, str(len(created)))
+            os.mkdir(tmpdir)
+            files = conda_build_test.create_test_files(meta, tmpdir)
+            contents = {}
+            for name in sorted(os.listdir(tmpdir)):
+                with open(os.path.join(tmpdir, name)) as fh:
+                    contents[name] = fh.read().replace(tmpdir, 'TMPDIR')
+            created.append((files, contents))
+        self.assertEqual(created[1], created[0])
+        self.assertIn('data.txt', created[1][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from conda_testenv import overlay
+from conda_testenv.conda_meta import LinkedPackage
+from conda_testenv.metadata_cache import TEST_FIELDS, CachedMetaData
+
+
+def package(name, version='1.0', build='0', depends=()):
+    return LinkedPackage(dist='{}-{}-{}'.format(name, version, build),
+                         name=name, version=version, build=build,
+                         source=None, depends=depends)
+
+
+def meta(requires):
+    fields = dict((field, None) for field in TEST_FIELDS)
+    fields['test/requires'] = requires
+    return CachedMetaData('recipe', fields)
+
+
+class Test_spec_name(unittest.TestCase):
+    def test_names(self):
+        self.assertEqual(overlay.spec_name('pytest'), 'pytest')
+        self.assertEqual(overlay.spec_name('pytest >=3'), 'pytest')
+        self.assertEqual(overlay.spec_name('Mock>=2,<3'), 'mock')
+        self.assertEqual(overlay.spec_name('nose 1.3.* py27_0'), 'nose')
+
+
+class Test_test_requirements(unittest.TestCase):
+    def test_union(self):
+        metas = [meta(['pytest >=3', 'numpy']), meta(None),
+                 meta(['mock', 'pytest  >=3'])]
+        packages = [package('numpy', '1.13.1', 'py36_0'),
+                    package('python', '3.6.1')]
+        self.assertEqual(overlay.test_requirements(metas, packages),
+                         ['mock', 'pytest >=3'])
+
+    def test_nothing_missing(self):
+        metas = [meta(['numpy'])]
+        packages = [package('numpy'), package('python', '3.6.1')]
+        self.assertEqual(overlay.test_requirements(metas, packages), [])
+
+
+class Test_shared_pins(unittest.TestCase):
+    def test_closure(self):
+        packages = [package('numpy', '1.13.1', 'py36_0',
+                            depends=('python 3.6*', 'mkl')),
+                    package('mkl', '2017'), package('python', '3.6.1'),
+                    package('conda', '4.3.21')]
+        # Only the packages which the overlay would hold, and what they
+        # depend upon, are pinned.
+        self.assertEqual(overlay.shared_pins(packages,
+                                             set(['numpy', 'pytest'])),
+                         ['mkl=2017=0', 'numpy=1.13.1=py36_0',
+                          'python=3.6.1=0'])
+        self.assertEqual(overlay.shared_pins(packages, set(['pytest'])), [])
+
+
+class Test_linked_names(unittest.TestCase):
+    def test_records(self):
+        actions = {'LINK': [{'name': 'Mock', 'dist_name': 'mock-2.0.0-py36_0'},
+                            {'dist_name': 'six-1.10.0-py36_0'}]}
+        self.assertEqual(overlay.linked_names(actions), set(['mock', 'six']))
+
+    def test_dists(self):
+        actions = [{'LINK': ['defaults::mock-2.0.0-py36_0',
+                             'six-1.10.0-py36_0 2']}]
+        self.assertEqual(overlay.linked_names(actions), set(['mock', 'six']))
+
+
+@unittest.skipIf(sys.platform == 'win32', 'Uses a POSIX shell script.')
+class Test_create_overlay(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.calls = os.path.join(self.tmpdir, 'calls')
+        self.conda = os.path.join(self.tmpdir, 'conda')
+        # A stand in for conda, which records its arguments, solves every
+        # spec to the package of its name along with six, and creates the
+        # prefix given after --prefix.
+        with open(self.conda, 'w') as fh:
+            fh.write('#!/bin/sh\n'
+                     'echo "$@" >> {}\n'
+                     'case "$*" in *--dry-run*)\n'
+                     '  echo \'{{"actions": {{"LINK": [\'\n'
+                     '  echo \'{{"name": "mock"}}, {{"name": "six"}}]}}, \'\n'
+                     '  echo \'"success": true}}\'\n'
+                     '  exit;;\n'
+                     'esac\n'
+                     'while [ "$1" != --prefix ]; do shift; done\n'
+                     'mkdir -p "$2/bin"\n'.format(self.calls))
+        os.chmod(self.conda, 0o755)
+        os.environ['CONDA_EXE'] = self.conda
+        self.addCleanup(os.environ.pop, 'CONDA_EXE')
+        self.root = os.path.join(self.tmpdir, 'overlays')
+        self.packages = [package('six', '1.10.0'), package('python', '3.6.1')]
+
+    def calls_made(self):
+        with open(self.calls) as fh:
+            return fh.read().splitlines()
+
+    def test_created_once(self):
+        prefix = overlay.create_overlay(['mock'], self.packages, self.root)
+        self.assertTrue(os.path.isdir(os.path.join(prefix, 'bin')))
+        self.assertEqual(overlay.create_overlay(['mock'], self.packages,
+                                                self.root), prefix)
+        solve, create = self.calls_made()
+        self.assertIn('--dry-run', solve)
+        self.assertTrue(solve.endswith(' mock'))
+        self.assertIn('--offline', create)
+        # Only six, which the overlay would also hold, is pinned.
+        self.assertTrue(create.endswith(' mock six=1.10.0=0'))
+        # The overlay of another environment is not shared.
+        other = overlay.create_overlay(['mock'], [package('six', '1.11.0')],
+                                       self.root)
+        self.assertNotEqual(other, prefix)
+
+    def test_failure(self):
+        os.environ['CONDA_EXE'] = '/bin/false'
+        with self.assertRaises(overlay.OverlayError):
+            overlay.create_overlay(['mock'], self.packages, self.root)
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_unsolvable(self):
+        with open(self.conda, 'w') as fh:
+            fh.write('#!/bin/sh\n'
+                     'echo \'{"error": "PackagesNotFoundError", '
+                     '"message": "mock is missing"}\'\n'
+                     'exit 1\n')
+        with self.assertRaises(overlay.OverlayError) as raised:
+            overlay.create_overlay(['mock'], self.packages, self.root)
+        self.assertIn('mock is missing', str(raised.exception))
+
+    def test_stale_lock(self):
+        prefix = overlay.overlay_path(
+            ['mock', 'python=3.6.1=0', 'six=1.10.0=0'], self.root)
+        os.makedirs(self.root)
+        with open(prefix + '.lock', 'w'):
+            pass
+        stale = time.time() - overlay.LOCK_TIMEOUT - 10
+        os.utime(prefix + '.lock', (stale, stale))
+        self.assertEqual(overlay.create_overlay(['mock'], self.packages,
+                                                self.root), prefix)
+        self.assertEqual(os.listdir(self.root), [os.path.basename(prefix)])
+
+
+class Test_locked(unittest.TestCase):
+    def test_waits(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        prefix = os.path.join(tmpdir, 'overlay')
+        events = []
+
+        def other_run():
+            with overlay.locked(prefix, poll=0.01):
+                events.append('other')
+
+        with overlay.locked(prefix):
+            thread = threading.Thread(target=other_run)
+            thread.start()
+            time.sleep(0.1)
+            events.append('first')
+        thread.join()
+        self.assertEqual(events, ['first', 'other'])
+        self.assertEqual(os.listdir(tmpdir), [])
+
+
+class Test_layer_environ(unittest.TestCase):
+    @unittest.skipIf(sys.platform == 'win32', 'Uses POSIX layouts.')
+    def test_appended(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        site = os.path.join(tmpdir, 'lib', 'python3.6', 'site-packages')
+        os.makedirs(site)
+        env = overlay.layer_environ({'PATH': '/env/bin',
+                                     'PYTHONPATH': '/mine'}, tmpdir)
+        self.assertEqual(env['PATH'].split(os.pathsep),
+                         ['/env/bin', os.path.join(tmpdir, 'bin')])
+        self.assertEqual(env['PYTHONPATH'].split(os.pathsep),
+                         ['/mine', site])
+
+    @unittest.skipIf(sys.platform == 'win32', 'Uses POSIX layouts.')
+    def test_pinned_builds_shadowed(self):
+        # The overlay's site-packages comes before that of the environment
+        # on sys.path, so what it shadows must be the same build.
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        site = os.path.join(tmpdir, 'lib', 'python3.6', 'site-packages')
+        os.makedirs(site)
+        env = overlay.layer_environ({}, tmpdir)
+        script = ('import site, sys; '
+                  'paths = [p for p in site.getsitepackages() '
+                  'if p in sys.path]; '
+                  'print(all(sys.path.index({!r}) < sys.path.index(p) '
+                  'for p in paths))'.format(site))
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         env=env)
+        self.assertEqual(output.strip(), b'True')
+        self.assertEqual(overlay.shared_pins([package('six', '1.10.0')],
+                                             set(['six'])), ['six=1.10.0=0'])
@@ -0,0 +1,60 @@
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from conda_testenv import phases
+
+
+class Test_percentile(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(phases.percentile(values, 50), 50)
+        self.assertEqual(phases.percentile(values, 90), 90)
+        self.assertEqual(phases.percentile(values, 100), 100)
+
+    def test_single(self):
+        self.assertEqual(phases.percentile([3.0], 99), 3.0)
+
+
+class Test_Profile(unittest.TestCase):
+    def test_accumulates(self):
+        profile = phases.Profile()
+        profile.add(phases.TEST, 'a-1.0-0', 1.0)
+        profile.add(phases.TEST, 'a-1.0-0', 0.5)
+        with profile.phase(phases.TEST_FILES, 'a-1.0-0'):
+            pass
+        self.assertEqual(profile.timings[phases.TEST], {'a-1.0-0': 1.5})
+        self.assertIn('a-1.0-0', profile.timings[phases.TEST_FILES])
+
+    def test_records_on_error(self):
+        profile = phases.Profile()
+        with self.assertRaises(ValueError):
+            with profile.phase(phases.METADATA, 'a-1.0-0'):
+                raise ValueError
+        self.assertIn('a-1.0-0', profile.timings[phases.METADATA])
+
+    def test_report(self):
+        profile = phases.Profile()
+        profile.add(phases.DISCOVER, None, 1.0)
+        profile.add(phases.TEST, 'a-1.0-0', 3.0)
+        out = StringIO()
+        profile.report(out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], '===== Profile =====')
+        self.assertEqual([line.split()[0] for line in lines[2:4]],
+                         ['discover', 'run'])
+        self.assertIn('Test time 3.00s, conda-testenv overhead 1.00s '
+                      '(25.0%)', lines[-1])
+
+
+class Test_timed(unittest.TestCase):
+    def test_no_profile(self):
+        with phases.timed(None, phases.TEST):
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from conda_testenv import processes
+
+
+@unittest.skipIf(sys.platform == 'win32', 'Uses POSIX shell commands.')
+class Test_call(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_returncode(self):
+        self.assertEqual(processes.call(['/bin/sh', '-c', 'exit 3']), 3)
+        self.assertEqual(processes.call(['/bin/sh', '-c', 'exit 0'],
+                                        timeout=10), 0)
+
+    def test_timeout_kills_tree(self):
+        marker = os.path.join(self.tmpdir, 'marker')
+        # The grandchild would create the marker, had it not been killed.
+        script = '(sleep 1; touch {}) & sleep 30'.format(marker)
+        start = time.time()
+        self.assertIsNone(processes.call(['/bin/sh', '-c', script],
+                                         timeout=0.2))
+        self.assertLess(time.time() - start, 10)
+        time.sleep(1.5)
+        self.assertFalse(os.path.exists(marker))
+
+
+@unittest.skipIf(sys.platform == 'win32', 'Uses POSIX shell commands.')
+class Test_Cancellation(unittest.TestCase):
+    def test_cancel_kills_running(self):
+        cancel = processes.Cancellation()
+        timer = threading.Timer(0.2, cancel.cancel)
+        timer.start()
+        start = time.time()
+        with self.assertRaises(processes.Cancelled):
+            processes.call(['/bin/sh', '-c', 'sleep 30'], cancel=cancel)
+        self.assertLess(time.time() - start, 10)
+
+    def test_cancelled_before_start(self):
+        cancel = processes.Cancellation()
+        cancel.cancel()
+        with self.assertRaises(processes.Cancelled):
+            processes.call(['/bin/sh', '-c', 'sleep 30'], cancel=cancel)
+
+    def test_limit(self):
+        cancel = processes.Cancellation(limit=2)
+        cancel.failed()
+        self.assertFalse(cancel.cancelled)
+        cancel.failed()
+        self.assertTrue(cancel.cancelled)
+
+    def test_finished_process(self):
+        cancel = processes.Cancellation()
+        self.assertEqual(processes.call(['/bin/sh', '-c', 'exit 0'],
+                                        cancel=cancel), 0)
+        cancel.cancel()
+
+    def test_failed_before_cancel(self):
+        cancel = processes.Cancellation()
+        proc = subprocess.Popen(['/bin/sh', '-c', 'exit 3'],
+                                **processes.process_group_kwargs())
+        cancel.register(proc.pid)
+        self.assertEqual(proc.wait(), 3)
+        # Cancelled once the process has failed by itself, but before it
+        # has been unregistered.
+        cancel.cancel()
+        cancel.unregister(proc.pid)
+        cancel.check(proc.pid, 3)
+
+    def replace_kill(self, kill):
+        self.addCleanup(setattr, processes, 'kill_process_group',
+                        processes.kill_process_group)
+        processes.kill_process_group = kill
+
+    def test_checked_while_killing(self):
+        cancel = processes.Cancellation()
+        cancelled = []
+
+        def kill(pid):
+            # The process is reaped, and checked, before the kill returns.
+            try:
+                cancel.check(pid, -9)
+            except processes.Cancelled:
+                cancelled.append(pid)
+            return True
+
+        self.replace_kill(kill)
+        cancel.register(123)
+        cancel.cancel()
+        self.assertEqual(cancelled, [123])
+
+    def test_kill_failed(self):
+        cancel = processes.Cancellation()
+        self.replace_kill(lambda pid: False)
+        cancel.register(123)
+        cancel.cancel()
+        cancel.check(123, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
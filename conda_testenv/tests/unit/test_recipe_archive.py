@@ -0,0 +1,93 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from conda_testenv import recipe_archive
+from conda_testenv.test_env import recipe_directory
+
+
+def add(tar, name, content=None):
+    member = tarfile.TarInfo(name)
+    if content is None:
+        member.type = tarfile.DIRTYPE
+        tar.addfile(member)
+    else:
+        data = content.encode('utf-8')
+        member.size = len(data)
+        tar.addfile(member, io.BytesIO(data))
+
+
+class Test_recipe_from_tarball(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.pkgs = os.path.join(self.tmpdir, 'pkgs')
+        self.root = os.path.join(self.tmpdir, 'recipes')
+        os.mkdir(self.pkgs)
+        self.source = os.path.join(self.pkgs, 'a-1.0-0')
+        self.tarball = self.source + '.tar.bz2'
+
+    def make_tarball(self, members):
+        with tarfile.open(self.tarball, 'w:bz2') as tar:
+            for member in members:
+                add(tar, *member)
+
+    def test_extracts_recipe(self):
+        self.make_tarball([('info/files', 'lib/a.py\n'),
+                           ('info/recipe', None),
+                           ('info/recipe/meta.yaml', 'package: {}\n'),
+                           ('info/recipe/parent/run_test.sh', 'true\n'),
+                           ('info/recipe/../../escape', 'oops\n'),
+                           ('lib/a.py', 'print(1)\n')])
+        recipe = recipe_archive.recipe_from_tarball(self.source, self.root)
+        self.assertEqual(recipe, os.path.join(self.root, 'a-1.0-0'))
+        self.assertEqual(sorted(os.listdir(recipe)), ['meta.yaml', 'parent'])
+        with open(os.path.join(recipe, 'parent', 'run_test.sh')) as fh:
+            self.assertEqual(fh.read(), 'true\n')
+        self.assertEqual(sorted(os.listdir(self.root)), ['a-1.0-0'])
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir,
+                                                     'escape')))
+
+    def read_meta(self):
+        recipe = recipe_archive.recipe_from_tarball(self.source, self.root)
+        with open(os.path.join(recipe, 'meta.yaml')) as fh:
+            return fh.read()
+
+    def test_reuses_recipe(self):
+        self.make_tarball([('info/recipe/meta.yaml', 'old\n')])
+        self.assertEqual(self.read_meta(), 'old\n')
+        self.make_tarball([('info/recipe/meta.yaml', 'new\n')])
+        os.utime(self.tarball, (0, 0))
+        self.assertEqual(self.read_meta(), 'old\n')
+        # Once the tarball changes after the recipe was read, it is read
+        # again.
+        future = os.path.getmtime(os.path.join(self.root, 'a-1.0-0')) + 10
+        os.utime(self.tarball, (future, future))
+        self.assertEqual(self.read_meta(), 'new\n')
+
+    def test_conda_build_order(self):
+        # conda-build puts the top-level info/ files first, and the rest,
+        # including the recipe, in order of size.
+        self.make_tarball([('info/files', 'lib/a/__init__.py\n'),
+                           ('info/index.json', '{}'),
+                           ('lib/a/__init__.py', ''),
+                           ('info/recipe/meta.yaml', 'package: {}\n'),
+                           ('lib/a/core.py', 'x = 1\n' * 10),
+                           ('info/recipe/run_test.py', 'import a\n' * 20)])
+        recipe = recipe_archive.recipe_from_tarball(self.source, self.root)
+        self.assertEqual(sorted(os.listdir(recipe)),
+                         ['meta.yaml', 'run_test.py'])
+
+    def test_no_tarball(self):
+        with self.assertRaises(IOError):
+            recipe_archive.recipe_from_tarball(self.source, self.root)
+
+    def test_recipe_directory_falls_back(self):
+        self.make_tarball([('info/recipe/meta.yaml', 'package: {}\n')])
+        os.environ['CONDA_TESTENV_STATE_DIR'] = self.tmpdir
+        self.addCleanup(os.environ.pop, 'CONDA_TESTENV_STATE_DIR')
+        self.assertEqual(recipe_directory(self.source),
+                         os.path.join(self.root, 'a-1.0-0'))
@@ -0,0 +1,148 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from conda_testenv.conda_meta import LinkedPackage
+from conda_testenv.report import (merge_json, read_json, write_json,
+                                  write_junit)
+from conda_testenv.results import (FAILED, PASSED, SKIPPED, TIMED_OUT,
+                                   PackageResult)
+
+
+def result(name, status, reason=None, log=None):
+    package = LinkedPackage(dist='{}-1.0-0'.format(name), name=name,
+                            version='1.0', build='0', source=None,
+                            depends=())
+    return PackageResult(None, status, 1.5, package=package, reason=reason,
+                         kinds=['py'], log=log)
+
+
+class ReportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.results = [result('a', PASSED, log='/logs/a-1.0-0.log'),
+                        result('b', FAILED, reason='Boom.'),
+                        result('c', TIMED_OUT),
+                        result('d', SKIPPED, reason='Cached.')]
+
+
+class Test_write_json(ReportTest):
+    def test_report(self):
+        path = os.path.join(self.tmpdir, 'report.json')
+        write_json(self.results, path)
+        with open(path) as fh:
+            report = json.load(fh)
+        self.assertEqual(report['summary'],
+                         {PASSED: 1, FAILED: 1, TIMED_OUT: 1, SKIPPED: 1})
+        first = report['packages'][0]
+        self.assertEqual(first['dist'], 'a-1.0-0')
+        self.assertEqual(first['status'], PASSED)
+        self.assertEqual(first['kinds'], ['py'])
+        self.assertEqual(first['duration'], 1.5)
+        self.assertEqual(first['log'], '/logs/a-1.0-0.log')
+        self.assertEqual(report['packages'][1]['reason'], 'Boom.')
+
+
+class Test_write_junit(ReportTest):
+    def test_report(self):
+        path = os.path.join(self.tmpdir, 'junit.xml')
+        write_junit(self.results, path)
+        suite = ET.parse(path).getroot()
+        self.assertEqual(suite.get('tests'), '4')
+        self.assertEqual(suite.get('failures'), '2')
+        self.assertEqual(suite.get('skipped'), '1')
+        cases = suite.findall('testcase')
+        self.assertEqual([case.get('name') for case in cases],
+                         ['a-1.0-0', 'b-1.0-0', 'c-1.0-0', 'd-1.0-0'])
+        self.assertEqual(cases[0].find('system-out').text,
+                         '/logs/a-1.0-0.log')
+        self.assertEqual(cases[1].find('failure').get('message'), 'Boom.')
+        self.assertEqual(cases[2].find('failure').get('type'), TIMED_OUT)
+        self.assertIsNotNone(cases[3].find('skipped'))
+
+    def test_quarantined(self):
+        self.results[1].flaky = self.results[1].quarantined = True
+        path = os.path.join(self.tmpdir, 'junit.xml')
+        write_junit(self.results, path)
+        suite = ET.parse(path).getroot()
+        self.assertEqual(suite.get('failures'), '1')
+        self.assertEqual(suite.get('skipped'), '2')
+        skipped = suite.findall('testcase')[1].find('skipped')
+        self.assertEqual(skipped.get('message'),
+                         'Quarantined as flaky: Boom.')
+
+
+class Test_merge_json(ReportTest):
+    def write_shards(self, shards, sharded=None):
+        paths = []
+        for index, results in enumerate(shards, 1):
+            path = os.path.join(self.tmpdir, '{}.json'.format(index))
+            write_json(results, path, shard=(index, len(shards)),
+                       sharded=sharded)
+            paths.append(path)
+        return paths
+
+    def test_round_trip(self):
+        path = os.path.join(self.tmpdir, 'report.json')
+        self.results[1].attempts = 3
+        self.results[1].flaky = True
+        write_json(self.results, path, shard=(1, 1))
+        results, shard, sharded = read_json(path)
+        self.assertEqual(shard, (1, 1))
+        self.assertIsNone(sharded)
+        self.assertEqual([(r.dist, r.status, r.reason) for r in results],
+                         [(r.dist, r.status, r.reason) for r in self.results])
+        self.assertEqual((results[1].attempts, results[1].flaky,
+                          results[1].quarantined), (3, True, False))
+
+    def test_merge(self):
+        paths = self.write_shards([self.results[2:], self.results[:2]])
+        merged = merge_json(paths)
+        self.assertEqual([result.dist for result in merged],
+                         ['a-1.0-0', 'b-1.0-0', 'c-1.0-0', 'd-1.0-0'])
+
+    def test_merge_checks_packages(self):
+        dists = [result.dist for result in self.results]
+        paths = self.write_shards([self.results[2:], self.results[:2]],
+                                  sharded=dists)
+        self.assertEqual(len(merge_json(paths)), 4)
+
+    def test_duplicated_package(self):
+        paths = self.write_shards([self.results[1:], self.results[:2]])
+        with self.assertRaises(ValueError):
+            merge_json(paths)
+
+    def test_untested_package(self):
+        dists = [result.dist for result in self.results]
+        paths = self.write_shards([self.results[3:], self.results[:2]],
+                                  sharded=dists)
+        with self.assertRaises(ValueError):
+            merge_json(paths)
+
+    def test_different_environments(self):
+        dists = [result.dist for result in self.results]
+        paths = self.write_shards([self.results[2:], self.results[:2]],
+                                  sharded=dists)
+        write_json(self.results[:2], paths[1], shard=(2, 2),
+                   sharded=dists[:3])
+        with self.assertRaises(ValueError):
+            merge_json(paths)
+
+    def test_missing_shard(self):
+        paths = self.write_shards([self.results[:2], self.results[2:], []])
+        with self.assertRaises(ValueError):
+            merge_json(paths[:2])
+
+    def test_not_a_shard(self):
+        path = os.path.join(self.tmpdir, 'report.json')
+        write_json(self.results, path)
+        with self.assertRaises(ValueError):
+            merge_json([path])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from conda_testenv.conda_meta import (PackageIndex, dependency_closure,
+                                      linked_packages)
+from conda_testenv.result_cache import ResultCache, cache_key
+
+
+class Test_cache_key(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.recipe = os.path.join(self.tmpdir, 'recipe')
+        os.mkdir(self.recipe)
+        with open(os.path.join(self.recipe, 'meta.yaml'), 'w') as fh:
+            fh.write('package: {name: a}\n')
+        self.meta = os.path.join(self.tmpdir, 'prefix', 'conda-meta')
+        os.makedirs(self.meta)
+        self.link('a-1.0-0', ['b 1.*'])
+        self.link('b-1.0-0', ['c'])
+        self.link('c-1.0-0', [])
+        self.link('d-1.0-0', [])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def link(self, dist, depends):
+        name = dist.rsplit('-', 2)[0]
+        with open(os.path.join(self.meta, dist + '.json'), 'w') as fh:
+            json.dump({'name': name, 'depends': depends}, fh)
+
+    def key(self):
+        packages = linked_packages(os.path.dirname(self.meta))
+        return cache_key('a-1.0-0', self.recipe, packages)
+
+    def test_closure(self):
+        packages = linked_packages(os.path.dirname(self.meta))
+        self.assertEqual(dependency_closure(packages, 'a-1.0-0'),
+                         set(['b-1.0-0', 'c-1.0-0']))
+
+    def test_index(self):
+        packages = linked_packages(os.path.dirname(self.meta))
+        index = PackageIndex(packages)
+        self.assertEqual(dependency_closure(index, 'a-1.0-0'),
+                         set(['b-1.0-0', 'c-1.0-0']))
+        self.assertEqual(cache_key('a-1.0-0', self.recipe, index),
+                         self.key())
+
+    def test_unrelated_change(self):
+        key = self.key()
+        self.link('d-2.0-0', [])
+        self.assertEqual(self.key(), key)
+
+    def test_dependency_change(self):
+        key = self.key()
+        os.remove(os.path.join(self.meta, 'c-1.0-0.json'))
+        self.link('c-2.0-0', [])
+        self.assertNotEqual(self.key(), key)
+
+    def test_recipe_change(self):
+        key = self.key()
+        with open(os.path.join(self.recipe, 'run_test.py'), 'w') as fh:
+            fh.write('import a\n')
+        self.assertNotEqual(self.key(), key)
+
+
+class Test_ResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'results.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        cache = ResultCache(self.path)
+        self.assertFalse(cache.passed('a'))
+        cache.record('a')
+        cache.save()
+        self.assertTrue(ResultCache(self.path).passed('a'))
+
+    def test_evict(self):
+        cache = ResultCache(self.path, max_age=60, max_entries=2)
+        now = time.time()
+        cache.entries = {'old': now - 120, 'a': now - 3, 'b': now - 2,
+                         'c': now - 1}
+        cache.evict()
+        self.assertEqual(sorted(cache.entries), ['b', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from conda_testenv.conda_meta import LinkedPackage
+from conda_testenv.results import (FAILED, PASSED, SKIPPED, TIMED_OUT,
+                                   PackageResult, summarise)
+
+
+def package(name):
+    return LinkedPackage(dist='{}-1.0-0'.format(name), name=name,
+                         version='1.0', build='0', source=None, depends=())
+
+
+def result(name, status, reason=None):
+    return PackageResult(None, status, 1.0, package=package(name),
+                         reason=reason)
+
+
+class Test_PackageResult(unittest.TestCase):
+    def test_identity(self):
+        res = result('a', PASSED)
+        self.assertEqual((res.name, res.version, res.build, res.dist),
+                         ('a', '1.0', '0', 'a-1.0-0'))
+
+    def test_gating(self):
+        self.assertFalse(result('a', PASSED).gating)
+        self.assertFalse(result('a', SKIPPED).gating)
+        self.assertTrue(result('a', FAILED).gating)
+        self.assertTrue(result('a', TIMED_OUT).gating)
+
+    def test_quarantined(self):
+        res = result('a', FAILED)
+        res.flaky = res.quarantined = True
+        self.assertFalse(res.gating)
+
+
+class Test_summarise(unittest.TestCase):
+    def test(self):
+        out = StringIO()
+        summarise([result('a', PASSED), result('b', FAILED),
+                   result('c', TIMED_OUT), result('d', SKIPPED),
+                   result('e', FAILED, reason='ValueError: bad recipe')],
+                  out=out)
+        self.assertEqual(out.getvalue().splitlines(),
+                         ['===== Summary of 5 packages =====',
+                          '1 passed, 2 failed, 1 timed out, 1 skipped',
+                          'FAILED: b-1.0-0',
+                          'FAILED: e-1.0-0 (ValueError: bad recipe)',
+                          'TIMED OUT: c-1.0-0'])
+
+    def test_flaky(self):
+        quarantined = result('a', FAILED)
+        quarantined.flaky = quarantined.quarantined = True
+        retried = result('b', PASSED)
+        retried.flaky = True
+        retried.attempts = 2
+        out = StringIO()
+        summarise([quarantined, retried], out=out)
+        self.assertEqual(out.getvalue().splitlines()[2:],
+                         ['FAILED: a-1.0-0 [flaky, quarantined]',
+                          'PASSED ON ATTEMPT 2: b-1.0-0'])
+
+    def test_several_envs(self):
+        py27, py36 = result('a', FAILED), result('a', FAILED)
+        py27.env, py36.env = '/envs/py27', '/envs/py36'
+        out = StringIO()
+        summarise([py27, py36], out=out)
+        self.assertEqual(out.getvalue().splitlines()[2:],
+                         ['FAILED: a-1.0-0 in /envs/py27',
+                          'FAILED: a-1.0-0 in /envs/py36'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from conda_testenv import scratch
+from conda_testenv.scratch import ScratchPool
+
+
+class NoexecStat(object):
+    """The statvfs of a filesystem, as if it were mounted noexec."""
+    def __init__(self, stat):
+        for name in dir(stat):
+            if name.startswith('f_'):
+                setattr(self, name, getattr(stat, name))
+        self.f_flag |= scratch.ST_NOEXEC
+
+
+class Test_ScratchPool(unittest.TestCase):
+    def setUp(self):
+        self.shm = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.shm)
+
+    def test_recycled(self):
+        pool = ScratchPool(shm=self.shm)
+        try:
+            with pool.workdir() as first:
+                self.assertEqual(os.listdir(first), [])
+                self.assertEqual(os.path.dirname(first), pool.shm_root)
+                with open(os.path.join(first, 'run_test.py'), 'w') as fh:
+                    fh.write('pass')
+            with pool.workdir() as second:
+                self.assertEqual(second, first)
+                self.assertEqual(os.listdir(second), [])
+        finally:
+            pool.close()
+        self.assertEqual(os.listdir(self.shm), [])
+
+    def test_concurrent(self):
+        pool = ScratchPool(shm=self.shm)
+        try:
+            first, second = pool.acquire(), pool.acquire()
+            self.assertNotEqual(first, second)
+            pool.release(first)
+            pool.release(second)
+        finally:
+            pool.close()
+
+    def test_size_cap(self):
+        pool = ScratchPool(shm=self.shm, shm_size_cap=0)
+        try:
+            with pool.workdir() as workdir:
+                self.assertEqual(os.path.dirname(workdir), pool.disk_root)
+        finally:
+            pool.close()
+
+    def test_too_little_free(self):
+        # As on the 64 MiB /dev/shm of a container.
+        pool = ScratchPool(shm=self.shm, shm_free_margin=2 ** 62)
+        try:
+            self.assertIsNone(pool.shm_root)
+        finally:
+            pool.close()
+
+    def test_filling_up(self):
+        pool = ScratchPool(shm=self.shm, shm_free_margin=0)
+        try:
+            with pool.workdir() as workdir:
+                self.assertEqual(os.path.dirname(workdir), pool.shm_root)
+            # Other processes have since used the space on the tmpfs.
+            pool.shm_free_margin = 2 ** 62
+            with pool.workdir() as workdir:
+                self.assertEqual(os.path.dirname(workdir), pool.disk_root)
+        finally:
+            pool.close()
+
+    @unittest.skipIf(scratch.ST_NOEXEC is None, 'The flag is not known.')
+    def test_noexec(self):
+        statvfs = os.statvfs
+        self.addCleanup(setattr, os, 'statvfs', statvfs)
+        os.statvfs = lambda path: NoexecStat(statvfs(path))
+        pool = ScratchPool(shm=self.shm)
+        try:
+            self.assertIsNone(pool.shm_root)
+            with pool.workdir() as workdir:
+                self.assertEqual(os.path.dirname(workdir), pool.disk_root)
+        finally:
+            pool.close()
+
+    def test_no_shm(self):
+        pool = ScratchPool(shm=os.path.join(self.shm, 'missing'))
+        try:
+            self.assertIsNone(pool.shm_root)
+            with pool.workdir() as workdir:
+                self.assertTrue(os.path.isdir(workdir))
+        finally:
+            pool.close()
+        self.assertFalse(os.path.exists(workdir))
+
+
+if __name__ == '__main__':
+    unittest.main()
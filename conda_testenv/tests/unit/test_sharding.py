@@ -0,0 +1,65 @@
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+
+from conda_testenv.conda_meta import LinkedPackage
+from conda_testenv.durations import DurationHistory
+from conda_testenv.sharding import parse_shard, shard, split
+
+
+def package(name):
+    return LinkedPackage(dist='{}-1.0-0'.format(name), name=name,
+                         version='1.0', build='0', source=None, depends=())
+
+
+class Test_parse_shard(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(parse_shard('2/3'), (2, 3))
+
+    def test_invalid(self):
+        for value in ['2', 'a/3', '0/3', '4/3']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_shard(value)
+
+
+class Test_split(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.history = DurationHistory(os.path.join(tmpdir, 'durations.json'))
+        self.packages = [package(name) for name in 'abcdefg']
+
+    def test_covers_every_package_once(self):
+        shards = split(self.packages, 3)
+        dists = sorted(p.dist for shard in shards for p in shard)
+        self.assertEqual(dists, [p.dist for p in self.packages])
+
+    def test_stable_without_history(self):
+        # Without a shared history, a package's shard does not depend on
+        # which other packages there are.
+        shards = split(self.packages, 3)
+        fewer = split(self.packages[1:], 3)
+        for before, after in zip(shards, fewer):
+            self.assertEqual([p for p in before if p.name != 'a'], after)
+
+    def test_balanced_by_duration(self):
+        self.history.record('a-1.0-0', 'a', 60.0)
+        for name in 'bcdefg':
+            self.history.record('{}-1.0-0'.format(name), name, 10.0)
+        first, second = split(self.packages, 2, self.history)
+        self.assertEqual([p.name for p in first], ['a'])
+        self.assertEqual(len(second), 6)
+
+    def test_deterministic(self):
+        self.assertEqual(split(self.packages, 3),
+                         split(list(reversed(self.packages)), 3))
+
+    def test_shard(self):
+        self.assertEqual(shard(self.packages, 2, 3),
+                         split(self.packages, 3)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+"""
+Check that conda-testenv starts quickly, by not importing conda or
+conda-build until it needs to.
+
+"""
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+
+#: The time, in seconds, which ``conda-testenv --version`` may take beyond
+#: the startup time of the interpreter.
+BUDGET = 1.0
+
+HEAVY_MODULES = ('conda', 'conda_build')
+
+
+def run_python(*args):
+    env = os.environ.copy()
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__)))))
+    env['PYTHONPATH'] = os.pathsep.join([root, env.get('PYTHONPATH', '')])
+    start = time.time()
+    output = subprocess.check_output([sys.executable] + list(args), env=env)
+    return time.time() - start, output.decode('ascii')
+
+
+class Test_startup(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        code = ('import sys; import conda_testenv.cli, conda_testenv.test_env;'
+                'print(" ".join(m for m in sys.modules '
+                'if m.split(".")[0] in {!r}))'.format(HEAVY_MODULES))
+        _, output = run_python('-c', code)
+        self.assertEqual(output.strip(), '')
+
+    def test_version_budget(self):
+        baseline = min(run_python('-c', 'pass')[0] for _ in range(3))
+        duration = min(run_python('-m', 'conda_testenv.cli', '--version')[0]
+                       for _ in range(3))
+        self.assertLess(duration - baseline, BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
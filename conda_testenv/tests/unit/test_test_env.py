@@ -0,0 +1,290 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from conda_testenv.conda_meta import LinkedPackage
+from conda_testenv.durations import DurationHistory
+from conda_testenv.flaky import FlakyHistory
+from conda_testenv.result_cache import ResultCache
+from conda_testenv.results import FAILED, PASSED, SKIPPED, PackageResult
+from conda_testenv.test_env import (Recorder, RunOptions, env_log_dirs,
+                                    mark_flaky, original_recipe,
+                                    plan_builds, retry_failures,
+                                    run_packages, share_results,
+                                    unique_builds)
+from conda_testenv.tests.unit.fakes import FakeMetaData
+
+
+class Test_original_recipe(unittest.TestCase):
+    def setUp(self):
+        self.recipe = tempfile.mkdtemp()
+        self.write('meta.yaml', 'rendered')
+        self.write('run_test.py', 'print("hello")')
+
+    def tearDown(self):
+        shutil.rmtree(self.recipe)
+
+    def write(self, fname, content):
+        with open(os.path.join(self.recipe, fname), 'w') as fh:
+            fh.write(content)
+
+    def read(self, dirname, fname):
+        with open(os.path.join(dirname, fname)) as fh:
+            return fh.read()
+
+    def test_no_orig(self):
+        with original_recipe(self.recipe) as view:
+            self.assertEqual(view, self.recipe)
+
+    def test_orig(self):
+        self.write('meta.yaml.orig', 'original')
+        with original_recipe(self.recipe) as view:
+            self.assertNotEqual(view, self.recipe)
+            self.assertEqual(self.read(view, 'meta.yaml'), 'original')
+            self.assertFalse(os.path.exists(os.path.join(view,
+                                                         'meta.yaml.orig')))
+            self.assertEqual(self.read(view, 'run_test.py'),
+                             'print("hello")')
+            # The recipe itself is untouched.
+            self.assertEqual(self.read(self.recipe, 'meta.yaml'), 'rendered')
+            self.assertEqual(self.read(self.recipe, 'meta.yaml.orig'),
+                             'original')
+        self.assertFalse(os.path.exists(view))
+
+    def test_concurrent(self):
+        # Runs sharing the pkgs cache may render the same recipe at once.
+        self.write('meta.yaml.orig', 'original')
+        with original_recipe(self.recipe) as first:
+            with original_recipe(self.recipe) as second:
+                self.assertNotEqual(first, second)
+                self.assertEqual(self.read(second, 'meta.yaml'), 'original')
+            self.assertFalse(os.path.exists(second))
+            self.assertEqual(self.read(first, 'meta.yaml'), 'original')
+        self.assertEqual(sorted(os.listdir(self.recipe)),
+                         ['meta.yaml', 'meta.yaml.orig', 'run_test.py'])
+
+    def test_removed_on_error(self):
+        self.write('meta.yaml.orig', 'original')
+        with self.assertRaises(ValueError):
+            with original_recipe(self.recipe) as view:
+                raise ValueError('The recipe could not be rendered.')
+        self.assertFalse(os.path.exists(view))
+        self.assertEqual(self.read(self.recipe, 'meta.yaml'), 'rendered')
+
+
+class Test_run_packages(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.history = DurationHistory(os.path.join(self.tmpdir,
+                                                    'durations.json'))
+        self.history.record('slow-1.0-0', 'slow', 100.0)
+        self.history.record('medium-1.0-0', 'medium', 10.0)
+        self.metas = [FakeMetaData(name, self.tmpdir)
+                      for name in ['fast', 'slow', 'medium']]
+        self.started = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_serial(self):
+        def run(m):
+            self.started.append(m.name())
+            return PackageResult(m, PASSED, 0.0)
+
+        results = run_packages(run, self.metas, 1, self.history)
+        # A single job tests each recipe only once it is asked for.
+        self.assertEqual(self.started, [])
+        self.assertEqual([result.m for result in results], self.metas)
+        self.assertEqual(self.started, ['fast', 'slow', 'medium'])
+
+    def test_concurrent(self):
+        both = threading.Event()
+
+        def run(m):
+            with self.lock:
+                self.started.append(m.name())
+                if len(self.started) == 2:
+                    both.set()
+            # Times out unless two jobs run at the same time.
+            both.wait(10)
+            return PackageResult(m, PASSED if both.is_set() else FAILED,
+                                 0.0)
+
+        results = run_packages(run, self.metas, 2, self.history)
+        self.assertEqual([result.m for result in results], self.metas)
+        self.assertEqual([result.status for result in results],
+                         [PASSED] * 3)
+        # The longest are started first.
+        self.assertEqual(sorted(self.started[:2]), ['medium', 'slow'])
+        self.assertEqual(self.started[2], 'fast')
+
+
+class Test_unique_builds(unittest.TestCase):
+    def test_shared(self):
+        package = LinkedPackage(dist='a-1.0-0', name='a', version='1.0',
+                                build='0', source=None, depends=())
+        other = package._replace(dist='b-1.0-0', name='b')
+        py27 = ('/envs/py27', package, '/pkgs/a-1.0-0/info/recipe')
+        py36 = ('/envs/py36', package, '/pkgs/a-1.0-0/info/recipe')
+        py37 = ('/envs/py37', package, '/pkgs/a-1.0-0/info/recipe')
+        b27 = ('/envs/py27', other, '/pkgs/b-1.0-0/info/recipe')
+        b36 = ('/envs/py36', other, '/pkgs/b-1.0-0/info/recipe')
+        keys = {py27: 'a', py36: 'a', py37: 'a', b27: 'b27', b36: 'b36'}
+        unique, sharers = unique_builds([py27, b27, py36, b36, py37], keys)
+        self.assertEqual(unique, [py27, b27, b36])
+        self.assertEqual(sharers, {('/envs/py27', package): [py36, py37]})
+
+
+class Test_RunOptions(unittest.TestCase):
+    def test_defaults(self):
+        options = RunOptions(jobs=4, package_timeouts={'slow': 60})
+        self.assertEqual(options.jobs, 4)
+        self.assertTrue(options.use_cache)
+        self.assertEqual(options.retries, 0)
+        self.assertEqual(options._replace(retries=2).retries, 2)
+        self.assertEqual(options.package_timeout('slow'), 60)
+        self.assertIsNone(options.package_timeout('fast'))
+        with self.assertRaises(TypeError):
+            RunOptions(jobz=4)
+
+    def test_check(self):
+        RunOptions(zygote=True).check(['/envs/a'])
+        with self.assertRaises(ValueError):
+            RunOptions(zygote=True).check(['/envs/a', '/envs/b'])
+        with self.assertRaises(ValueError):
+            RunOptions(queue_dir='/queue', retries=1).check(['/envs/a'])
+        with self.assertRaises(ValueError):
+            RunOptions(queue_dir='/queue',
+                       test_requires=True).check(['/envs/a'])
+
+
+class StepsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        package = LinkedPackage(dist='a-1.0-0', name='a', version='1.0',
+                                build='0', source=None, depends=())
+        other = package._replace(dist='b-1.0-0', name='b')
+        self.a27 = ('/envs/py27', package, '/pkgs/a-1.0-0/info/recipe')
+        self.a36 = ('/envs/py36', package, '/pkgs/a-1.0-0/info/recipe')
+        self.b27 = ('/envs/py27', other, '/pkgs/b-1.0-0/info/recipe')
+        self.keys = {self.a27: 'a', self.a36: 'a', self.b27: 'b'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, fname):
+        return os.path.join(self.tmpdir, fname)
+
+    def result(self, build, status, attempts=1):
+        result = PackageResult(None, status, 1.0, package=build[1])
+        result.env = build[0]
+        result.attempts = attempts
+        return result
+
+
+class Test_plan_builds(StepsTest):
+    def test_no_keys(self):
+        builds = [self.a27, self.b27]
+        self.assertEqual(plan_builds(builds), (builds, [], {}))
+
+    def test_shared_and_cached(self):
+        cache = ResultCache(self.path('results.json'))
+        cache.record('b')
+        builds, skipped, sharers = plan_builds(
+            [self.a27, self.b27, self.a36], self.keys, cache)
+        self.assertEqual(builds, [self.a27])
+        self.assertEqual([(result.dist, result.status, result.env)
+                          for result in skipped],
+                         [('b-1.0-0', SKIPPED, '/envs/py27')])
+        self.assertEqual(sharers, {self.a27[:2]: [self.a36]})
+
+
+class Test_Recorder(StepsTest):
+    def test_record(self):
+        history = DurationHistory(self.path('durations.json'))
+        outcomes = FlakyHistory(self.path('flaky.json'))
+        cache = ResultCache(self.path('results.json'))
+        recorder = Recorder(history, outcomes, cache, self.keys)
+        passed = self.result(self.a27, PASSED)
+        recorder.record(passed, self.a27)
+        failed = self.result(self.b27, FAILED)
+        recorder.record(failed, self.b27)
+        self.assertEqual(passed.package, self.a27[1])
+        self.assertEqual(history.get('a-1.0-0'), 1.0)
+        self.assertEqual(history.get('b-1.0-0'), 1.0)
+        self.assertTrue(cache.passed('a'))
+        self.assertFalse(cache.passed('b'))
+        recorder.save()
+        self.assertTrue(os.path.exists(self.path('flaky.json')))
+
+
+class Test_retry_failures(unittest.TestCase):
+    def test_retries(self):
+        metas = [FakeMetaData(name, '') for name in ['good', 'bad', 'flip']]
+        tested = [PackageResult(metas[0], PASSED, 1.0),
+                  PackageResult(metas[1], FAILED, 1.0),
+                  PackageResult(metas[2], FAILED, 1.0)]
+        runs = []
+
+        def runner(metas):
+            runs.append([m.name() for m in metas])
+            return [PackageResult(m, PASSED if m.name() == 'flip' else
+                                  FAILED, 1.0) for m in metas]
+
+        recorded = []
+        retry_failures(tested, runner, 2, recorded.append)
+        self.assertEqual(runs, [['bad', 'flip'], ['bad']])
+        self.assertEqual([(result.name, result.status, result.attempts)
+                          for result in tested],
+                         [('good', PASSED, 1), ('bad', FAILED, 3),
+                          ('flip', PASSED, 2)])
+        self.assertEqual(len(recorded), 3)
+
+
+class Test_mark_flaky(StepsTest):
+    def test_mark(self):
+        outcomes = FlakyHistory(self.path('flaky.json'))
+        for passed in [True, False, True, False]:
+            outcomes.record('b-1.0-0', passed)
+        results = [self.result(self.a27, PASSED, attempts=2),
+                   self.result(self.b27, FAILED)]
+        mark_flaky(results, outcomes, quarantine=True)
+        self.assertTrue(results[0].flaky)
+        self.assertFalse(results[0].quarantined)
+        self.assertTrue(results[1].flaky)
+        self.assertTrue(results[1].quarantined)
+
+
+class Test_share_results(StepsTest):
+    def test_share(self):
+        results = [self.result(self.b27, PASSED),
+                   self.result(self.a27, FAILED)]
+        shared = share_results(results, {self.a27[:2]: [self.a36]})
+        self.assertEqual([(result.dist, result.env, result.tested_in,
+                           result.status) for result in shared],
+                         [('a-1.0-0', '/envs/py27', None, FAILED),
+                          ('a-1.0-0', '/envs/py36', '/envs/py27', FAILED),
+                          ('b-1.0-0', '/envs/py27', None, PASSED)])
+
+
+class Test_env_log_dirs(unittest.TestCase):
+    def test_single(self):
+        self.assertEqual(env_log_dirs('/logs', ['/opt/conda']),
+                         {'/opt/conda': '/logs'})
+        self.assertEqual(env_log_dirs(None, ['/a', '/b']),
+                         {'/a': None, '/b': None})
+
+    def test_several(self):
+        dirs = env_log_dirs('/logs', ['/opt/conda', '/opt/conda/envs/py27',
+                                      '/other/py27'])
+        self.assertEqual(dirs, {
+            '/opt/conda': os.path.join('/logs', 'conda'),
+            '/opt/conda/envs/py27': os.path.join('/logs', 'py27'),
+            '/other/py27': os.path.join('/logs', 'py27-2')})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from conda_testenv import watch
+
+
+class WatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.conda_meta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.conda_meta)
+
+    def write(self, dist, content='{}'):
+        with open(os.path.join(self.conda_meta, dist + '.json'), 'w') as fh:
+            fh.write(content)
+
+
+class Test_changed(WatchTestCase):
+    def test_new_and_changed(self):
+        self.write('a-1.0-0')
+        self.write('b-1.0-0')
+        before = watch.snapshot(self.conda_meta)
+        self.write('b-1.0-0', '{"name": "b"}')
+        self.write('c-1.0-0')
+        os.remove(os.path.join(self.conda_meta, 'a-1.0-0.json'))
+        after = watch.snapshot(self.conda_meta)
+        self.assertEqual(watch.changed(before, after), ['b-1.0-0', 'c-1.0-0'])
+
+
+class WatcherTests(object):
+    def test_timeout(self):
+        watcher = self.watcher()
+        self.addCleanup(watcher.close)
+        self.assertFalse(watcher.wait(0.1))
+
+    def test_change(self):
+        watcher = self.watcher()
+        self.addCleanup(watcher.close)
+        self.write('a-1.0-0')
+        self.assertTrue(watcher.wait(5))
+        self.assertFalse(watcher.wait(0.1))
+
+
+class Test_Poller(WatchTestCase, WatcherTests):
+    def watcher(self):
+        return watch.Poller(self.conda_meta, poll=0.05)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'Uses inotify.')
+class Test_Inotify(WatchTestCase, WatcherTests):
+    def watcher(self):
+        return watch.Inotify(self.conda_meta)
+
+
+class Test_batches(WatchTestCase):
+    def test_debounced(self):
+        self.write('a-1.0-0')
+        poller = watch.Poller(self.conda_meta, poll=0.02)
+
+        def install():
+            for dist in ['b-1.0-0', 'c-1.0-0', 'd-1.0-0']:
+                time.sleep(0.05)
+                self.write(dist)
+
+        thread = threading.Thread(target=install)
+        thread.start()
+        self.addCleanup(thread.join)
+        batches = watch.batches(self.conda_meta, poller, debounce=0.5)
+        self.assertEqual(next(batches), ['b-1.0-0', 'c-1.0-0', 'd-1.0-0'])
@@ -0,0 +1,192 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from conda_testenv import test_env, work_queue
+from conda_testenv.conda_meta import LinkedPackage
+from conda_testenv.results import FAILED, PASSED, PackageResult
+from conda_testenv.work_queue import JobQueue, coordinate, run_job, work
+
+
+def package(name):
+    return LinkedPackage(dist='{}-1.0-0'.format(name), name=name,
+                         version='1.0', build='0', source=None, depends=())
+
+
+def record(dist, status):
+    name, version, build = dist.rsplit('-', 2)
+    return {'name': name, 'version': version, 'build': build, 'dist': dist,
+            'status': status, 'kinds': ['py'], 'duration': 0.5,
+            'log': None, 'reason': None}
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.queue = JobQueue(self.tmpdir, lease=30.0)
+
+
+class Test_JobQueue(QueueTest):
+    def test_claim_once(self):
+        self.queue.publish('run', [{'dist': 'a-1.0-0', 'lease': 30.0},
+                                   {'dist': 'b-1.0-0', 'lease': 30.0}])
+        other = JobQueue(self.tmpdir)
+        first, second = self.queue.claim(), other.claim()
+        self.assertEqual(sorted([first['dist'], second['dist']]),
+                         ['a-1.0-0', 'b-1.0-0'])
+        self.assertIsNone(self.queue.claim())
+
+    def test_claim_requeued_before_lease(self):
+        self.queue.publish('run', [{'dist': 'a-1.0-0', 'lease': 30.0}])
+        utime = os.utime
+
+        def requeued(path, times):
+            # The coordinator requeues the job just after it is renamed.
+            os.rename(path, os.path.join(self.queue.todo, 'a-1.0-0.json'))
+            utime(path, times)
+
+        os.utime = requeued
+        try:
+            self.assertIsNone(self.queue.claim())
+        finally:
+            os.utime = utime
+        self.assertEqual(self.queue.claim()['dist'], 'a-1.0-0')
+
+    def test_results_of_run(self):
+        self.queue.publish('old', [{'dist': 'a-1.0-0', 'lease': 30.0}])
+        stale = self.queue.claim()
+        self.queue.publish('new', [{'dist': 'a-1.0-0', 'lease': 30.0}])
+        self.queue.complete(stale, record('a-1.0-0', FAILED))
+        self.assertEqual(self.queue.results('new'), {})
+        job = self.queue.claim()
+        self.assertEqual(job['run'], 'new')
+        self.queue.complete(job, record('a-1.0-0', PASSED))
+        self.assertEqual(self.queue.results('new')['a-1.0-0']['status'],
+                         PASSED)
+
+    def test_requeue_expired(self):
+        self.queue.publish('run', [{'dist': 'a-1.0-0', 'lease': 30.0},
+                                   {'dist': 'b-1.0-0', 'lease': 30.0}])
+        crashed = self.queue.claim()
+        alive = self.queue.claim()
+        os.utime(os.path.join(self.queue.claimed, crashed['dist'] + '.json'),
+                 (0, 0))
+        self.assertEqual(self.queue.requeue_expired(), [crashed['dist']])
+        self.assertEqual(self.queue.claim()['dist'], crashed['dist'])
+        self.queue.renew(alive)
+        self.assertEqual(self.queue.requeue_expired(), [])
+
+    def test_finished(self):
+        self.queue.publish('run', [{'dist': 'a-1.0-0', 'lease': 30.0}])
+        self.assertEqual(self.queue.runs(), set(['run']))
+        self.assertFalse(self.queue.finished(set(['run'])))
+        self.queue.finish('run')
+        self.assertTrue(self.queue.finished(set(['run'])))
+        # The marker of an earlier run does not finish the next one.
+        self.assertFalse(self.queue.finished(set(['next'])))
+        self.queue.publish('next', [])
+        self.assertFalse(self.queue.finished(set(['run'])))
+
+
+class Test_coordinate(QueueTest):
+    def test_collects_results(self):
+        runs = set()
+
+        def worker():
+            queue = JobQueue(self.tmpdir)
+            while not queue.finished(runs):
+                job = queue.claim()
+                if job is None:
+                    runs.update(queue.runs())
+                    time.sleep(0.01)
+                    continue
+                runs.add(job['run'])
+                status = PASSED if job['dist'] != 'b-1.0-0' else FAILED
+                queue.complete(job, record(job['dist'], status))
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        packages = [package(name) for name in 'abc']
+        recipes = [(p, '/recipes/' + p.name) for p in packages]
+        results = list(coordinate(self.queue, recipes,
+                                  lambda package: 10.0, poll=0.01))
+        thread.join()
+        self.assertEqual(sorted((r.dist, r.status) for r in results),
+                         [('a-1.0-0', PASSED), ('b-1.0-0', FAILED),
+                          ('c-1.0-0', PASSED)])
+        self.assertTrue(all(r.package in packages for r in results))
+        self.assertTrue(self.queue.finished(runs))
+
+
+class Test_work(QueueTest):
+    def test_started_before_publish(self):
+        # The marker of the previous run is still in the directory when the
+        # worker starts.
+        self.queue.publish('old', [])
+        self.queue.finish('old')
+        prefix = os.path.join(self.tmpdir, 'env')
+        os.makedirs(os.path.join(prefix, 'conda-meta'))
+
+        def run_job(job, packages, env_prefix, *args):
+            return PackageResult(None, PASSED, 0.0,
+                                 package=package(job['dist'].split('-')[0]))
+
+        self.addCleanup(setattr, work_queue, 'run_job', work_queue.run_job)
+        work_queue.run_job = run_job
+        tested = []
+        thread = threading.Thread(target=lambda: tested.append(
+            work(JobQueue(self.tmpdir), prefix, use_metadata_cache=False,
+                 poll=0.01)))
+        thread.start()
+        time.sleep(0.2)
+        self.assertTrue(thread.is_alive())
+        packages = [package(name) for name in 'ab']
+        results = list(coordinate(self.queue,
+                                  [(p, '/recipes/' + p.name)
+                                   for p in packages], poll=0.01))
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(sorted((r.dist, r.status) for r in results),
+                         [('a-1.0-0', PASSED), ('b-1.0-0', PASSED)])
+        self.assertEqual(tested, [2])
+
+
+class Test_run_job(unittest.TestCase):
+    def replace(self, name, function):
+        self.addCleanup(setattr, test_env, name, getattr(test_env, name))
+        setattr(test_env, name, function)
+
+    def test_renders_one_at_a_time(self):
+        rendering = []
+        overlaps = []
+
+        def iter_package_metadata(recipes, rendered):
+            rendering.append(None)
+            overlaps.append(len(rendering))
+            time.sleep(0.05)
+            rendering.pop()
+            return ['m']
+
+        self.replace('recipe_directory', lambda source: source)
+        self.replace('iter_package_metadata', iter_package_metadata)
+        self.replace('run_pkg_tests', lambda m, env_prefix, **kwargs:
+                     PackageResult(None, PASSED, 0.0, package=package('a')))
+        packages = dict((p.dist, p._replace(source='recipe'))
+                        for p in map(package, 'abcd'))
+        threads = [threading.Thread(target=run_job,
+                                    args=({'dist': dist, 'timeout': None},
+                                          packages, 'prefix'))
+                   for dist in packages]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [1, 1, 1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
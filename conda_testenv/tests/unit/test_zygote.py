@@ -0,0 +1,103 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from conda_testenv.processes import Cancellation, Cancelled
+from conda_testenv.zygote import Zygote
+
+
+SCRIPT = """\
+from __future__ import print_function
+import os
+import sys
+print('running', os.path.basename(os.getcwd()), os.environ['GREETING'])
+print('on stderr', file=sys.stderr)
+sys.exit(int(os.environ['STATUS']))
+"""
+
+
+@unittest.skipIf(sys.platform == 'win32', 'The zygote requires fork.')
+class Test_Zygote(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.script = os.path.join(self.tmpdir, 'run_test.py')
+        with open(self.script, 'w') as fh:
+            fh.write(SCRIPT)
+        self.env = os.environ.copy()
+        self.env['GREETING'] = 'hello'
+        self.output = os.path.join(self.tmpdir, 'output.txt')
+        self.zygote_output = open(self.output, 'w+')
+        self.zygote = Zygote(self.env, preload=['json'],
+                             python=sys.executable,
+                             stdout=self.zygote_output,
+                             stderr=subprocess.STDOUT)
+
+    def tearDown(self):
+        self.zygote.close()
+        self.zygote_output.close()
+        shutil.rmtree(self.tmpdir)
+
+    def run_script(self, status):
+        env = dict(self.env, STATUS=str(status))
+        return self.zygote.run(self.script, self.tmpdir, env)
+
+    def subprocess_output(self, status):
+        env = dict(self.env, STATUS=str(status))
+        proc = subprocess.Popen([sys.executable, '-s', self.script],
+                                cwd=self.tmpdir, env=env,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        output = proc.communicate()[0].decode('utf-8')
+        return proc.returncode, output
+
+    def test_matches_subprocess(self):
+        for status in [0, 3]:
+            expected_status, expected_output = self.subprocess_output(status)
+            self.zygote_output.seek(0)
+            self.zygote_output.truncate()
+            self.assertEqual(self.run_script(status), expected_status)
+            self.zygote_output.seek(0)
+            self.assertEqual(self.zygote_output.read(), expected_output)
+
+    def test_uncaught_exception(self):
+        with open(self.script, 'w') as fh:
+            fh.write('raise ValueError("broken")\n')
+        self.assertEqual(self.run_script(0), 1)
+        self.zygote_output.seek(0)
+        self.assertIn('ValueError: broken', self.zygote_output.read())
+
+    def test_exception_matches_subprocess(self):
+        for source in ['def fail():\n    raise ValueError("broken")\n'
+                       '\n'
+                       'fail()\n',
+                       'def broken(\n']:
+            with open(self.script, 'w') as fh:
+                fh.write(source)
+            expected_status, expected_output = self.subprocess_output(0)
+            self.zygote_output.seek(0)
+            self.zygote_output.truncate()
+            self.assertEqual(self.run_script(0), expected_status)
+            self.zygote_output.seek(0)
+            self.assertEqual(self.zygote_output.read(), expected_output)
+
+    def test_cancelled_at_once(self):
+        # The child is killed on registration, which is as soon as it
+        # starts, but after it leads its own process group.
+        with open(self.script, 'w') as fh:
+            fh.write('import time\ntime.sleep(30)\n')
+        cancel = Cancellation()
+        cancel.cancel()
+        start = time.time()
+        for _ in range(5):
+            with self.assertRaises(Cancelled):
+                self.zygote.run(self.script, self.tmpdir, self.env,
+                                cancel=cancel)
+        self.assertLess(time.time() - start, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
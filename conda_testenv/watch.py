@@ -0,0 +1,203 @@
+"""
+Watch the ``conda-meta`` directory of an environment, and test each
+package as it is linked into the environment, as the ``conda-testenv
+watch`` command.
+
+On Linux, the directory is watched with inotify, through ctypes, and
+elsewhere, or should inotify be unavailable, it is polled. Changes are
+debounced: once a change is seen, the batch of packages to test is only
+taken when the directory has been quiet for a while, so that a bulk
+install is tested as one batch rather than package by package.
+
+"""
+from __future__ import print_function
+
+import ctypes
+import ctypes.util
+import errno
+import glob
+import os
+import select
+import sys
+import time
+
+
+#: The number of seconds for which conda-meta must be quiet before the
+#: packages which changed are tested.
+DEBOUNCE = 2.0
+
+#: The number of seconds between looks at conda-meta when polling.
+POLL = 1.0
+
+#: The inotify events of interest: a record which has been written, or
+#: renamed into place, or removed.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE
+
+
+def snapshot(conda_meta):
+    """
+    A dictionary of the name of each record in the given conda-meta
+    directory to its modification time and size.
+
+    """
+    records = {}
+    for path in glob.glob(os.path.join(conda_meta, '*.json')):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # Removed since it was listed.
+            continue
+        records[os.path.basename(path)] = (stat.st_mtime, stat.st_size)
+    return records
+
+
+def changed(before, after):
+    """
+    The sorted dists of the records which are new or changed between the
+    given snapshots.
+
+    """
+    return sorted(name[:-len('.json')] for name, stamp in after.items()
+                  if before.get(name) != stamp)
+
+
+class Poller(object):
+    """Watch a directory by taking a snapshot of it every poll seconds."""
+    def __init__(self, path, poll=POLL):
+        self.path = path
+        self.poll = poll
+        self.last = snapshot(path)
+
+    def wait(self, timeout=None):
+        """
+        Wait up to timeout seconds (for ever if None) for the directory to
+        change, returning whether it did.
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            delay = self.poll
+            if deadline is not None:
+                delay = min(delay, max(deadline - time.time(), 0))
+            time.sleep(delay)
+            current = snapshot(self.path)
+            if current != self.last:
+                self.last = current
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+
+    def close(self):
+        pass
+
+
+class Inotify(object):
+    """
+    Watch a directory with inotify. Raises OSError if inotify is not
+    available.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        name = ctypes.util.find_library('c')
+        try:
+            libc = ctypes.CDLL(name, use_errno=True)
+            init, add_watch = libc.inotify_init, libc.inotify_add_watch
+        except (OSError, AttributeError):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = init()
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        if add_watch(self.fd, path.encode(sys.getfilesystemencoding()),
+                     IN_MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, os.strerror(err))
+
+    def wait(self, timeout=None):
+        """
+        Wait up to timeout seconds (for ever if None) for the directory to
+        change, returning whether it did.
+
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        # The events themselves are not needed, as the changes are found
+        # by comparing snapshots, so just drain them.
+        while ready:
+            os.read(self.fd, 64 * 1024)
+            ready, _, _ = select.select([self.fd], [], [], 0)
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watcher(path, poll=False):
+    """
+    An :class:`Inotify` watching the given directory, or a :class:`Poller`
+    should inotify be unavailable or poll be True.
+
+    """
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            return Inotify(path)
+        except OSError as err:
+            print('Unable to watch {} with inotify ({}), so polling '
+                  'it.'.format(path, err))
+    return Poller(path)
+
+
+def batches(conda_meta, watch, debounce=DEBOUNCE):
+    """
+    Yield a list of the dists whose records in the given conda-meta
+    directory are new or changed, each time it changes and then stays
+    quiet for debounce seconds, as seen by the given watcher.
+
+    """
+    last = snapshot(conda_meta)
+    while True:
+        watch.wait()
+        while watch.wait(debounce):
+            pass
+        current = snapshot(conda_meta)
+        dists = changed(last, current)
+        last = current
+        if dists:
+            yield dists
+
+
+def watch_env(env_prefix, poll=False, debounce=DEBOUNCE, **options):
+    """
+    Test each package as it is linked into the given environment, until
+    interrupted. The options are those of
+    :class:`~conda_testenv.test_env.RunOptions`.
+
+    """
+    from conda_testenv import test_env
+
+    conda_meta = os.path.join(env_prefix, 'conda-meta')
+    if not os.path.isdir(conda_meta):
+        raise IOError('{} is not a conda environment.'.format(env_prefix))
+    watch = watcher(conda_meta, poll)
+    print('Watching {} for packages to test.'.format(conda_meta))
+    try:
+        for dists in batches(conda_meta, watch, debounce):
+            print('Testing {} new or changed packages: {}'.format(
+                len(dists), ', '.join(dists)))
+            try:
+                test_env.run_env_tests(env_prefix, dists=dists, **options)
+            except (IOError, OSError, ValueError) as err:
+                # Perhaps a record was caught half written; it will be
+                # tested once it has been written.
+                print('Unable to test the packages: {}'.format(err))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watch.close()
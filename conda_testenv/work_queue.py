@@ -0,0 +1,391 @@
+"""
+A queue of package tests in a shared directory, from which any number of
+``conda-testenv worker`` processes, on any hosts which share the directory
+and have the same environment, claim packages to test as they become free.
+
+The queue directory holds a JSON file per package in one of:
+
+* ``todo``, for packages waiting to be tested.
+* ``claimed``, for packages being tested. A job is claimed by renaming it
+  from ``todo``, which only one worker can do. Its modification time is
+  the worker's lease on it, which the worker renews for as long as it is
+  testing the package. A job whose lease expires, because its worker
+  died, is moved back to ``todo`` for another worker to claim.
+* ``done``, for the results of the tests, written by the workers.
+
+Each run of the coordinator, :func:`coordinate`, has a random id which its
+jobs and results carry, so that the stragglers of an earlier run cannot be
+mistaken for results of the current one.
+
+A directory is used rather than, say, an SQLite database, as renaming a
+file is atomic on network filesystems where locking often is not.
+
+"""
+from __future__ import print_function
+
+import errno
+import glob
+import os
+import threading
+import time
+import uuid
+
+from conda_testenv import conda_meta, metadata_cache, state, test_env
+from conda_testenv.report import record_result, result_record
+from conda_testenv.results import FAILED, PackageResult, error_reason
+from conda_testenv.scratch import ScratchPool
+
+
+#: The number of seconds after which a job whose lease has not been renewed
+#: is given to another worker.
+LEASE = 60.0
+
+#: The number of seconds to wait between looks at the queue.
+POLL = 1.0
+
+#: Held while a worker thread renders a recipe, as the conda-build config
+#: is global state, and the metadata cache is not thread-safe either.
+RENDER_LOCK = threading.Lock()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+
+
+class JobQueue(object):
+    """
+    The queue of jobs in the given shared directory. The jobs it publishes
+    have the given lease, in seconds.
+
+    """
+    def __init__(self, path, lease=LEASE):
+        self.path = path
+        self.lease = lease
+        self.todo = os.path.join(path, 'todo')
+        self.claimed = os.path.join(path, 'claimed')
+        self.done = os.path.join(path, 'done')
+        for directory in (self.todo, self.claimed, self.done):
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError as err:
+                    if err.errno != errno.EEXIST:
+                        raise
+
+    def _names(self, directory):
+        return sorted(os.path.basename(path) for path in
+                      glob.glob(os.path.join(directory, '*.json')))
+
+    def _finished_path(self):
+        return os.path.join(self.path, 'finished.json')
+
+    def publish(self, run, jobs):
+        """
+        Replace the contents of the queue with the given jobs of the given
+        run, dictionaries each with a unique 'dist'.
+
+        """
+        _remove(self._finished_path())
+        for directory in (self.todo, self.claimed, self.done):
+            for name in self._names(directory):
+                _remove(os.path.join(directory, name))
+        for job in jobs:
+            job = dict(job, run=run)
+            state.dump_json(job, os.path.join(self.todo,
+                                              job['dist'] + '.json'))
+
+    def claim(self):
+        """
+        Claim the next job, returning it or None if there are none waiting.
+
+        """
+        for name in self._names(self.todo):
+            claimed = os.path.join(self.claimed, name)
+            try:
+                os.rename(os.path.join(self.todo, name), claimed)
+            except OSError:
+                # Another worker claimed it first.
+                continue
+            # The job keeps the modification time it was published with
+            # until its lease is set, so it may have been requeued as
+            # expired in the meantime, in which case it is not claimed.
+            try:
+                os.utime(claimed, None)
+            except OSError:
+                continue
+            job = state.load_json(claimed)
+            if job is not None:
+                return job
+        return None
+
+    def renew(self, job):
+        """Renew the lease on a claimed job."""
+        try:
+            os.utime(os.path.join(self.claimed, job['dist'] + '.json'), None)
+        except OSError:
+            # The lease expired and the job was given to another worker.
+            pass
+
+    def complete(self, job, record):
+        """
+        Record the result of a claimed job, as made by
+        :func:`~conda_testenv.report.result_record`.
+
+        """
+        state.dump_json({'run': job['run'], 'result': record},
+                        os.path.join(self.done, job['dist'] + '.json'))
+        _remove(os.path.join(self.claimed, job['dist'] + '.json'))
+
+    def now(self):
+        """
+        The current time according to the filesystem of the queue, against
+        which leases are measured, so that the clocks of the hosts needn't
+        agree.
+
+        """
+        path = os.path.join(self.path, 'clock')
+        with open(path, 'a'):
+            os.utime(path, None)
+        return os.path.getmtime(path)
+
+    def requeue_expired(self):
+        """
+        Move the claimed jobs whose leases have expired back to todo,
+        returning their dists. Each job's lease is that of the queue which
+        published it.
+
+        """
+        expired = []
+        now = self.now()
+        for name in self._names(self.claimed):
+            claimed = os.path.join(self.claimed, name)
+            job = state.load_json(claimed, default={})
+            try:
+                if os.path.getmtime(claimed) + job.get('lease',
+                                                       self.lease) > now:
+                    continue
+                os.rename(claimed, os.path.join(self.todo, name))
+            except OSError:
+                # The job has just been completed.
+                continue
+            expired.append(name[:-len('.json')])
+        return expired
+
+    def results(self, run, dists=None):
+        """
+        Return a dictionary of dist to the result records of the given run
+        which have been completed, of only the given dists if any.
+
+        """
+        results = {}
+        for name in self._names(self.done):
+            if dists is not None and name[:-len('.json')] not in dists:
+                continue
+            done = state.load_json(os.path.join(self.done, name))
+            if done is not None and done.get('run') == run:
+                results[name[:-len('.json')]] = done['result']
+        return results
+
+    def runs(self):
+        """The runs of the jobs which are waiting or being tested."""
+        runs = set()
+        for directory in (self.todo, self.claimed):
+            for name in self._names(directory):
+                job = state.load_json(os.path.join(directory, name))
+                if job is not None and 'run' in job:
+                    runs.add(job['run'])
+        return runs
+
+    def finish(self, run):
+        """Mark the given run as finished, so that its workers exit."""
+        state.dump_json({'run': run}, self._finished_path())
+
+    def finished(self, runs):
+        """
+        Whether one of the given runs is the run of the queue, and is
+        finished. The marker of a finished run is left in the directory
+        until the next run is published, so it only counts for the runs
+        whose jobs a worker has seen.
+
+        """
+        marker = state.load_json(self._finished_path())
+        return marker is not None and marker.get('run') in runs
+
+
+def coordinate(queue, recipes, timeout_for=None, poll=POLL):
+    """
+    Publish a job to test each of the given (package, recipe directory)
+    pairs to the given :class:`JobQueue`, and yield the
+    :class:`~conda_testenv.results.PackageResult` of each, in the order
+    in which the workers complete them. If given, timeout_for(package) is
+    the timeout of the tests of the given package.
+
+    """
+    run = uuid.uuid4().hex
+    packages = dict((package.dist, package) for package, _ in recipes)
+    jobs = [{'dist': package.dist, 'lease': queue.lease,
+             'timeout': None if timeout_for is None else timeout_for(package)}
+            for package, _ in recipes]
+    queue.publish(run, jobs)
+    print('Queued {} packages in {}, for "conda-testenv worker" to '
+          'test.'.format(len(jobs), queue.path))
+    try:
+        remaining = set(packages)
+        while remaining:
+            for dist in queue.requeue_expired():
+                print('Re-queued {}, whose worker stopped renewing its '
+                      'lease.'.format(dist))
+            completed = queue.results(run, remaining)
+            for dist in sorted(remaining.intersection(completed)):
+                remaining.remove(dist)
+                result = record_result(completed[dist])
+                yield PackageResult(None, result.status, result.duration,
+                                    package=packages[dist],
+                                    reason=result.reason,
+                                    kinds=result.kinds, log=result.log)
+            if remaining:
+                time.sleep(poll)
+    finally:
+        queue.finish(run)
+
+
+class Lease(threading.Thread):
+    """
+    A daemon thread which renews the leases of the jobs a worker is
+    testing, until stopped. Each job carries the lease of its run, which
+    is renewed three times a lease.
+
+    """
+    def __init__(self, queue):
+        super(Lease, self).__init__()
+        self.daemon = True
+        self.queue = queue
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def add(self, job):
+        with self.lock:
+            self.jobs[job['dist']] = job
+
+    def discard(self, job):
+        with self.lock:
+            self.jobs.pop(job['dist'], None)
+
+    def interval(self):
+        with self.lock:
+            leases = [job['lease'] for job in self.jobs.values()]
+        if not leases:
+            # Look again soon, in case a job is claimed with a short lease.
+            return POLL
+        return min(leases) / 3.0
+
+    def run(self):
+        while not self.stopped.wait(self.interval()):
+            with self.lock:
+                jobs = list(self.jobs.values())
+            for job in jobs:
+                self.queue.renew(job)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job, packages, env_prefix, rendered=None, scratch=None,
+            log_dir=None):
+    """
+    Test the package of the given job in the given environment, whose
+    linked packages are given by dist, returning its
+    :class:`~conda_testenv.results.PackageResult`.
+
+    """
+    package = packages.get(job['dist'])
+    try:
+        if package is None:
+            name, version, build = job['dist'].rsplit('-', 2)
+            package = conda_meta.LinkedPackage(
+                dist=job['dist'], name=name, version=version, build=build,
+                source=None, depends=())
+            raise IOError('The package is not linked into {} on this '
+                          'host.'.format(env_prefix))
+        if package.source is None:
+            raise IOError('The source of this package is not recorded.')
+        recipe_path = test_env.recipe_directory(package.source)
+        with RENDER_LOCK:
+            m, = test_env.iter_package_metadata([(package, recipe_path)],
+                                                rendered)
+    except Exception as err:
+        return PackageResult(None, FAILED, 0.0, package=package,
+                             reason=error_reason(err))
+    return test_env.run_pkg_tests(m, env_prefix,
+                                  timeout_for=lambda m: job['timeout'],
+                                  scratch=scratch, log_dir=log_dir)
+
+
+def work(queue, env_prefix, jobs=1, log_dir=None, use_metadata_cache=True,
+         poll=POLL):
+    """
+    Test the packages of the given :class:`JobQueue` in the given
+    environment, up to the given number at a time, until its run is
+    finished. Returns the number of packages tested.
+
+    The worker waits for the jobs of a run to be published, as it may be
+    started before the coordinator, and only exits once a run whose jobs
+    it has seen is finished.
+
+    """
+    packages = dict((package.dist, package)
+                    for package in conda_meta.linked_packages(env_prefix))
+    rendered = None
+    if use_metadata_cache:
+        import conda_build
+        from conda_build.config import config
+
+        rendered = metadata_cache.MetadataCache(conda_build.__version__,
+                                                config.CONDA_NPY)
+    if log_dir is not None and not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    scratch = ScratchPool()
+    lease = Lease(queue)
+    lease.start()
+    tested = []
+    runs = set()
+
+    def worker():
+        while True:
+            job = queue.claim()
+            if job is None:
+                runs.update(queue.runs())
+                if queue.finished(runs):
+                    return
+                queue.requeue_expired()
+                time.sleep(poll)
+                continue
+            runs.add(job['run'])
+            lease.add(job)
+            try:
+                result = run_job(job, packages, env_prefix, rendered,
+                                 scratch, log_dir)
+                print('{}: {}'.format(job['dist'], result.status))
+                queue.complete(job, result_record(result))
+                tested.append(result)
+            finally:
+                lease.discard(job)
+
+    threads = [threading.Thread(target=worker) for _ in range(jobs)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        lease.stop()
+        scratch.close()
+        if use_metadata_cache:
+            rendered.save()
+    return len(tested)
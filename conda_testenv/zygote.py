@@ -0,0 +1,266 @@
+"""
+A "zygote" is a warm Python interpreter, started once in the environment
+being tested and with some modules already imported, which forks a child to
+run each package's ``run_test.py``. This avoids paying for interpreter
+startup (and for importing numpy, say) once per package.
+
+This module is run as a script by the Python of the environment under test,
+so the server side must only depend on the standard library and work on
+both Python 2 and 3. It relies on fork, so is not available on Windows.
+
+"""
+from __future__ import print_function
+
+import errno
+import json
+import os
+import runpy
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+
+def _exit_code(exc):
+    """The exit status of an interpreter which raised the given SystemExit."""
+    code = exc.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code & 0xff
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _print_exception(script):
+    """
+    Print the traceback of the exception being handled as the interpreter
+    would when running the given script, without the frames of the zygote
+    and runpy which led to the script's.
+
+    """
+    exc_type, exc, tb = sys.exc_info()
+    while tb is not None and tb.tb_frame.f_code.co_filename != script:
+        tb = tb.tb_next
+    # With no frame of the script, such as for a SyntaxError, just the
+    # exception is printed, as by the interpreter.
+    traceback.print_exception(exc_type, exc, tb)
+
+
+def _run_script(request, ready=None):
+    """
+    Run a test script in the same way as ``python -s script``, returning
+    its exit status. The given file descriptor, if any, is closed once
+    this process leads its own process group.
+
+    """
+    # Like a test subprocess, lead a process group so that the test and
+    # anything it starts can be killed together.
+    os.setsid()
+    if ready is not None:
+        os.close(ready)
+    if request.get('log'):
+        fd = os.open(request['log'],
+                     os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.close(fd)
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    script = request['script']
+    sys.argv = [script]
+    sys.path.insert(0, os.path.dirname(script))
+    try:
+        runpy.run_path(script, run_name='__main__')
+        status = 0
+    except SystemExit as exc:
+        status = _exit_code(exc)
+    except BaseException:
+        _print_exception(script)
+        status = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return status
+
+
+def _handle(conn):
+    """
+    Fork a child to run the script requested on the given connection, and
+    reply with the child's pid followed by its exit status.
+
+    """
+    request = json.loads(conn.makefile('r').readline())
+    ready, set_ready = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        conn.close()
+        os.close(ready)
+        status = 1
+        try:
+            status = _run_script(request, set_ready)
+        finally:
+            os._exit(status)
+    os.close(set_ready)
+    # The pid is only sent once the child leads its own process group, so
+    # that the client can kill the group from then on.
+    os.read(ready, 1)
+    os.close(ready)
+    conn.sendall('{}\n'.format(pid).encode('ascii'))
+    _, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        status = -os.WTERMSIG(status)
+    else:
+        status = os.WEXITSTATUS(status)
+    conn.sendall('{}\n'.format(status).encode('ascii'))
+
+
+def serve(address, preload=()):
+    """
+    Import the given modules, then fork a handler for each connection made
+    to the unix socket at the given address.
+
+    """
+    for name in preload:
+        try:
+            __import__(name)
+        except Exception:
+            print('conda-testenv zygote: unable to preload {}'.format(name),
+                  file=sys.stderr)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(address)
+    sock.listen(128)
+    # Handlers are reaped automatically.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    while True:
+        try:
+            conn, _ = sock.accept()
+        except socket.error as err:
+            if err.args[0] == errno.EINTR:
+                continue
+            raise
+        if os.fork() == 0:
+            sock.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            try:
+                _handle(conn)
+            finally:
+                os._exit(0)
+        conn.close()
+
+
+class Zygote(object):
+    """
+    A zygote process running in the given environment, with the given
+    modules preloaded. Scripts run by the zygote write to the zygote's
+    stdout and stderr, which are inherited from this process by default.
+
+    """
+    def __init__(self, env, preload=(), python='python', stdout=None,
+                 stderr=None, timeout=60):
+        self.tmpdir = tempfile.mkdtemp(prefix='conda-testenv-zygote-')
+        self.address = os.path.join(self.tmpdir, 'zygote.sock')
+        script = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+        cmd = [python, '-s', script, self.address] + list(preload)
+        self.process = subprocess.Popen(cmd, env=env, stdout=stdout,
+                                        stderr=stderr)
+        try:
+            self._wait_until_ready(timeout)
+        except Exception:
+            self.close()
+            raise
+
+    def _wait_until_ready(self, timeout):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self._connect().close()
+                return
+            except socket.error:
+                if self.process.poll() is not None:
+                    raise RuntimeError('The zygote exited with status {} '
+                                       'before it was ready.'
+                                       ''.format(self.process.returncode))
+                if time.time() > deadline:
+                    raise RuntimeError('The zygote was not ready after {}s.'
+                                       ''.format(timeout))
+                time.sleep(0.05)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.address)
+        except socket.error:
+            sock.close()
+            raise
+        return sock
+
+    def run(self, script, cwd, env, timeout=None, log=None, cancel=None):
+        """
+        Run the given Python script in a child of the zygote, returning its
+        exit status (negative if it was killed by a signal). If the script
+        takes longer than timeout seconds, its process group is killed and
+        None is returned. If given the path of a log file, the script's
+        output is appended to it. If given a
+        :class:`~conda_testenv.processes.Cancellation`, the child is
+        registered with it.
+
+        """
+        request = {'script': script, 'cwd': cwd, 'env': dict(env),
+                   'log': log}
+        sock = self._connect()
+        timed_out = False
+        pid = None
+        try:
+            sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+            replies = sock.makefile('r')
+            pid = int(replies.readline())
+            if cancel is not None:
+                cancel.register(pid)
+            if timeout is not None:
+                sock.settimeout(max(timeout, 0.01))
+            try:
+                status = replies.readline()
+            except socket.timeout:
+                timed_out = True
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except OSError:
+                    # The child has already exited.
+                    pass
+        finally:
+            sock.close()
+            if cancel is not None and pid is not None:
+                cancel.unregister(pid)
+        if timed_out:
+            return None
+        if not status:
+            raise RuntimeError('The zygote failed to run {}.'.format(script))
+        if cancel is not None:
+            cancel.check(pid, int(status))
+        return int(status)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == '__main__':
+    # Don't let the modules alongside this one shadow those of the tests.
+    del sys.path[0]
+    serve(sys.argv[1], sys.argv[2:])
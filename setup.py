@@ -1,17 +1,40 @@
+import sys
+
 from setuptools import setup
 import versioneer
 
 
+#: The modules which are only valid syntax from the given version of
+#: Python, and are left out of the package for earlier versions so that
+#: they are not byte-compiled when it is installed.
+PY_MODULE_VERSIONS = {('conda_testenv', 'async_engine'): (3, 5)}
+
+cmdclass = versioneer.get_cmdclass()
+_build_py = cmdclass['build_py']
+
+
+class build_py(_build_py):
+    def find_package_modules(self, package, package_dir):
+        modules = _build_py.find_package_modules(self, package, package_dir)
+        return [(pkg, module, path) for pkg, module, path in modules
+                if sys.version_info >= PY_MODULE_VERSIONS.get((pkg, module),
+                                                              (0,))]
+
+
+cmdclass['build_py'] = build_py
+
+
 setup(
       name='conda-testenv',
       version=versioneer.get_version(),
-      cmdclass=versioneer.get_cmdclass(),
+      cmdclass=cmdclass,
       description='Run the tests of all packages installed in a conda environment',
       author='Laura Dreyer',
       author_email='lbdreyer@users.noreply.github.com',
       url='https://github.com/scitools/conda-testenv',
       packages=['conda_testenv', 'conda_testenv.tests',
-                'conda_testenv.tests.integration'],
+                'conda_testenv.tests.integration',
+                'conda_testenv.tests.unit'],
       include_package_data=True,
       zip_safe=False,
       entry_points={